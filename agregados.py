@@ -0,0 +1,230 @@
+"""
+Agregados das vagas em três resoluções (minuto, hora e dia).
+
+O loop de estacionamento entrega cada varredura ao Agregador, que acumula
+por vaga (ignorando o estado 'desconhecido', antes da primeira leitura
+classificada): amostras, amostras ocupadas, falhas, transições livre<->ocupada e
+mínimo/média/máximo da distância. Quando o período (bucket) de uma
+resolução termina, os acumuladores viram registros de tamanho fixo que a
+thread de logging grava em disco:
+
+    inicio       int64    epoch (s) do início do bucket
+    vaga         uint16   id da vaga
+    amostras     uint32
+    ocupadas     uint32
+    falhas       uint32
+    transicoes   uint32
+    dist_min     float32  (NaN = sem leitura válida no bucket)
+    dist_soma    float64  soma das distâncias válidas
+    dist_n       uint32   leituras válidas
+    dist_max     float32
+
+Arquivos: "agregados_minuto_AAAAMMDD.bin", "agregados_hora_AAAAMM.bin" e
+"agregados_dia.bin". Um mesmo bucket pode aparecer mais de uma vez (ex.:
+parcial gravado no desligamento e completado depois do reinício); a
+leitura combina as repetições.
+"""
+import math
+import os
+import struct
+import time
+from array import array
+from datetime import datetime, timedelta
+
+from registro_vagas import CODIGO_ESTADO
+
+REGISTRO = struct.Struct('<qHIIIIfdIf')
+RESOLUCOES = ('minuto', 'hora', 'dia')
+PREFIXO = "agregados_"
+EXTENSAO = ".bin"
+
+_DESCONHECIDO = CODIGO_ESTADO['desconhecido']
+_LIVRE = CODIGO_ESTADO['livre']
+_OCUPADA = CODIGO_ESTADO['ocupada']
+_FALHA = CODIGO_ESTADO['falha']
+
+
+def limites_bucket(resolucao, instante):
+    """(inicio, fim) em epoch do bucket da resolução que contém o instante (hora local)."""
+    t = datetime.fromtimestamp(instante)
+    if resolucao == 'minuto':
+        inicio = t.replace(second=0, microsecond=0)
+        fim = inicio + timedelta(minutes=1)
+    elif resolucao == 'hora':
+        inicio = t.replace(minute=0, second=0, microsecond=0)
+        fim = inicio + timedelta(hours=1)
+    else:
+        # Pelo relógio local: dias de 23/25 h no horário de verão saem certos
+        inicio = t.replace(hour=0, minute=0, second=0, microsecond=0)
+        fim = inicio + timedelta(days=1)
+    return inicio.timestamp(), fim.timestamp()
+
+
+def nome_arquivo(resolucao, inicio):
+    """Arquivo que guarda o bucket que começa em `inicio`."""
+    if resolucao == 'minuto':
+        return f"{PREFIXO}minuto_{time.strftime('%Y%m%d', time.localtime(inicio))}{EXTENSAO}"
+    if resolucao == 'hora':
+        return f"{PREFIXO}hora_{time.strftime('%Y%m', time.localtime(inicio))}{EXTENSAO}"
+    return f"{PREFIXO}dia{EXTENSAO}"
+
+
+class _Acumulador:
+    """Acumuladores de um bucket, em colunas indexadas pelo slot da vaga."""
+
+    def __init__(self, resolucao, n_vagas):
+        self.resolucao = resolucao
+        self.inicio = None
+        self.fim = -math.inf
+        self.amostras = array('I', [0]) * n_vagas
+        self.ocupadas = array('I', [0]) * n_vagas
+        self.falhas = array('I', [0]) * n_vagas
+        self.transicoes = array('I', [0]) * n_vagas
+        self.dist_min = array('f', [math.nan]) * n_vagas
+        self.dist_soma = array('d', [0.0]) * n_vagas
+        self.dist_n = array('I', [0]) * n_vagas
+        self.dist_max = array('f', [math.nan]) * n_vagas
+
+    def zerar(self):
+        n = len(self.amostras)
+        self.__init__(self.resolucao, n)
+
+    def registros(self, ids):
+        """Bytes dos registros das vagas com amostras no bucket."""
+        dados = bytearray()
+        for slot, vaga_id in enumerate(ids):
+            if self.amostras[slot]:
+                dados += REGISTRO.pack(int(self.inicio), vaga_id, self.amostras[slot],
+                                       self.ocupadas[slot], self.falhas[slot], self.transicoes[slot],
+                                       self.dist_min[slot], self.dist_soma[slot],
+                                       self.dist_n[slot], self.dist_max[slot])
+        return dados
+
+
+class Agregador:
+    """
+    Recebe as varreduras (thread do loop) e devolve os buckets fechados.
+    Leitores usam abertos() para incluir os buckets em andamento.
+    """
+
+    def __init__(self, ids):
+        self.ids = list(ids)  # id da vaga por slot
+        self.acumuladores = [_Acumulador(r, len(self.ids)) for r in RESOLUCOES]
+        self.ultimo_estado = bytearray(len(self.ids))  # último livre/ocupada (0 = nenhum)
+
+    def amostrar(self, instante, distancias, estados):
+        """
+        distancias/estados por slot (estado como código). Retorna a lista de
+        (resolucao, inicio, bytes) dos buckets que fecharam.
+        """
+        fechados = []
+        for acumulador in self.acumuladores:
+            if instante >= acumulador.fim or acumulador.inicio is None or instante < acumulador.inicio:
+                if acumulador.inicio is not None:
+                    fechados.append((acumulador.resolucao, acumulador.inicio, acumulador.registros(self.ids)))
+                acumulador.zerar()
+                acumulador.inicio, acumulador.fim = limites_bucket(acumulador.resolucao, instante)
+
+        for slot, estado in enumerate(estados):
+            if estado == _DESCONHECIDO:
+                continue  # aquecimento do filtro: não entra nas amostras (nem na ocupação)
+            d = distancias[slot]
+            transicao = False
+            if estado in (_LIVRE, _OCUPADA):
+                transicao = self.ultimo_estado[slot] not in (0, estado)
+                self.ultimo_estado[slot] = estado
+            for acumulador in self.acumuladores:
+                acumulador.amostras[slot] += 1
+                if estado == _OCUPADA:
+                    acumulador.ocupadas[slot] += 1
+                elif estado == _FALHA:
+                    acumulador.falhas[slot] += 1
+                if transicao:
+                    acumulador.transicoes[slot] += 1
+                if d is not None:
+                    if not d >= acumulador.dist_min[slot]:  # NaN ou menor
+                        acumulador.dist_min[slot] = d
+                    if not d <= acumulador.dist_max[slot]:
+                        acumulador.dist_max[slot] = d
+                    acumulador.dist_soma[slot] += d
+                    acumulador.dist_n[slot] += 1
+        return [f for f in fechados if f[2]]
+
+    def abertos(self, resolucao):
+        """Bytes dos registros do bucket em andamento da resolução."""
+        for acumulador in self.acumuladores:
+            if acumulador.resolucao == resolucao and acumulador.inicio is not None:
+                return acumulador.registros(self.ids)
+        return b''
+
+    def fechar_todos(self):
+        """Buckets em andamento (parciais), para gravar no desligamento."""
+        return [(a.resolucao, a.inicio, a.registros(self.ids))
+                for a in self.acumuladores if a.inicio is not None]
+
+
+def _menor(a, b):
+    return b if math.isnan(a) else (a if math.isnan(b) else min(a, b))
+
+
+def _maior(a, b):
+    return b if math.isnan(a) else (a if math.isnan(b) else max(a, b))
+
+
+def _combinar(a, b):
+    """Junta dois registros do mesmo bucket/vaga."""
+    return (a[0], a[1], a[2] + b[2], a[3] + b[3], a[4] + b[4], a[5] + b[5],
+            _menor(a[6], b[6]), a[7] + b[7], a[8] + b[8], _maior(a[9], b[9]))
+
+
+def arquivos_resolucao(diretorio, resolucao):
+    """Arquivos de uma resolução, em ordem (o sufixo é a data)."""
+    prefixo = f"{PREFIXO}{resolucao}"
+    return sorted(os.path.join(diretorio, nome) for nome in os.listdir(diretorio)
+                  if nome.startswith(prefixo) and nome.endswith(EXTENSAO))
+
+
+def ler(diretorio, resolucao, inicio=None, fim=None, vaga_id=None, extras=b''):
+    """
+    Registros (tuplas do REGISTRO) com início do bucket em [inicio, fim],
+    ordenados por (inicio, vaga) e com repetições combinadas. `extras` são
+    bytes de registros ainda não gravados (buckets em andamento).
+    """
+    combinados = {}
+    ignorar_antes = nome_arquivo(resolucao, inicio) if inicio is not None and resolucao != 'dia' else None
+    ignorar_depois = nome_arquivo(resolucao, fim) if fim is not None and resolucao != 'dia' else None
+    blocos = []
+    for caminho in arquivos_resolucao(diretorio, resolucao):
+        nome = os.path.basename(caminho)
+        if (ignorar_antes and nome < ignorar_antes) or (ignorar_depois and nome > ignorar_depois):
+            continue
+        with open(caminho, 'rb') as f:
+            dados = f.read()
+        blocos.append(dados[:len(dados) - len(dados) % REGISTRO.size])
+    blocos.append(extras)
+    for dados in blocos:
+        for registro in REGISTRO.iter_unpack(dados):
+            if (inicio is not None and registro[0] < inicio) or (fim is not None and registro[0] > fim):
+                continue
+            if vaga_id is not None and registro[1] != vaga_id:
+                continue
+            chave = (registro[0], registro[1])
+            anterior = combinados.get(chave)
+            combinados[chave] = registro if anterior is None else _combinar(anterior, registro)
+    return [combinados[chave] for chave in sorted(combinados)]
+
+
+def como_dict(registro):
+    inicio, vaga_id, amostras, ocupadas, falhas, transicoes, dist_min, dist_soma, dist_n, dist_max = registro
+    validas = amostras - falhas
+    return {
+        'inicio': datetime.fromtimestamp(inicio).strftime('%Y-%m-%d %H:%M:%S'),
+        'vaga': vaga_id,
+        'amostras': amostras,
+        'ocupacao': round(ocupadas / validas, 4) if validas else None,
+        'distancia_min': None if math.isnan(dist_min) else round(dist_min, 2),
+        'distancia_media': round(dist_soma / dist_n, 2) if dist_n else None,
+        'distancia_max': None if math.isnan(dist_max) else round(dist_max, 2),
+        'transicoes': transicoes,
+        'falhas': falhas,
+    }
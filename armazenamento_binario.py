@@ -0,0 +1,242 @@
+"""
+Armazenamento binário das leituras e ações do LED.
+
+Alternativa compacta aos CSVs: cada evento é um registro de largura fixa
+(16 bytes), gravado em um arquivo por dia ("leituras_AAAAMMDD.v2.bin"):
+
+    instante_ms  int64    epoch em milissegundos
+    origem       uint16   id da vaga (0 = LED)
+    distancia    float32  cm (NaN = sem leitura)
+    codigo       uint8    estado da vaga | 0x80 se muito próximo (LED: 1 = ligado)
+    incerteza    uint8    100 - confiança da leitura em % (255 = não se aplica)
+
+A versão do formato vai no nome do arquivo. Os arquivos da versão 1
+("leituras_AAAAMMDD.bin") têm o mesmo registro, mas o último byte era só
+preenchimento (0): as leituras deles saem com confiança desconhecida (NaN).
+Um dia pode ter os dois arquivos (o de versão 1 é o mais antigo).
+
+Os registros ficam em ordem de tempo, então a leitura usa mmap e busca
+binária para achar o início de um intervalo sem percorrer o arquivo. O CSV
+continua existindo só como formato de exportação (gerado sob demanda).
+"""
+import math
+import mmap
+import os
+import struct
+import time
+
+REGISTRO = struct.Struct('<qHfBB')
+_INSTANTE = struct.Struct('<q')
+PREFIXO = "leituras_"
+EXTENSAO = ".bin"
+VERSAO_FORMATO = 2  # gravada no nome: leituras_AAAAMMDD.v2.bin (versão 1: sem ".vN")
+BLOCO_LEITURA = 4096  # registros desempacotados por vez
+SEM_CONFIANCA = 255
+
+
+def _incerteza(confianca):
+    return SEM_CONFIANCA if confianca is None else 100 - round(confianca * 100)
+
+
+def _confianca(incerteza, versao=VERSAO_FORMATO):
+    if versao < 2 or incerteza == SEM_CONFIANCA:
+        return math.nan
+    return (100 - incerteza) / 100
+
+
+def _dia(instante_ms):
+    return time.strftime('%Y%m%d', time.localtime(instante_ms / 1000))
+
+
+def _limites_dia(instante_ms):
+    """(inicio_ms, fim_ms) do dia local que contém o instante."""
+    t = time.localtime(instante_ms / 1000)
+    inicio = time.mktime((t.tm_year, t.tm_mon, t.tm_mday, 0, 0, 0, 0, 0, -1))
+    fim = time.mktime((t.tm_year, t.tm_mon, t.tm_mday + 1, 0, 0, 0, 0, 0, -1))
+    return int(inicio * 1000), int(fim * 1000)
+
+
+def descartar_registro_parcial(arquivo, tamanho_registro):
+    """
+    Trunca um arquivo de registros (aberto para acréscimo) no último
+    registro completo. Uma gravação interrompida (queda de energia) deixa
+    um registro parcial no fim; sem isso, tudo o que fosse acrescentado
+    depois ficaria desalinhado.
+    """
+    tamanho = os.fstat(arquivo.fileno()).st_size
+    sobra = tamanho % tamanho_registro
+    if sobra:
+        arquivo.truncate(tamanho - sobra)
+        print(f"Aviso: {arquivo.name}: descartado registro parcial de {sobra} bytes no fim.")
+
+
+class _Mapeamento:
+    """Arquivo de um dia mapeado em memória (somente leitura)."""
+
+    def __init__(self, caminho, versao):
+        self.versao = versao
+        self.arquivo = open(caminho, 'rb')
+        tamanho = os.fstat(self.arquivo.fileno()).st_size
+        # Ignora um registro parcial no fim (gravação em andamento)
+        self.total = tamanho // REGISTRO.size
+        self.mapa = mmap.mmap(self.arquivo.fileno(), 0, access=mmap.ACCESS_READ) if self.total else None
+
+    def instante(self, i):
+        return _INSTANTE.unpack_from(self.mapa, i * REGISTRO.size)[0]
+
+    def primeiro_a_partir(self, instante_ms):
+        """Índice do primeiro registro com instante >= instante_ms."""
+        baixo, alto = 0, self.total
+        while baixo < alto:
+            meio = (baixo + alto) // 2
+            if self.instante(meio) < instante_ms:
+                baixo = meio + 1
+            else:
+                alto = meio
+        return baixo
+
+    def registros(self, inicio, fim):
+        """Registros [inicio, fim) desempacotados em blocos."""
+        for bloco in range(inicio, fim, BLOCO_LEITURA):
+            ate = min(fim, bloco + BLOCO_LEITURA)
+            yield from REGISTRO.iter_unpack(self.mapa[bloco * REGISTRO.size:ate * REGISTRO.size])
+
+    def fechar(self):
+        if self.mapa is not None:
+            self.mapa.close()
+        self.arquivo.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.fechar()
+
+
+class ArmazenamentoBinario:
+    """
+    Escrita em lote (só a thread de logging chama adicionar/descarregar)
+    e leitura por intervalo ou pelas últimas N ocorrências.
+    Tem a mesma interface de descarga do ArquivoLog (caminho, pendente,
+    descarregar, fechar), para ser descarregado junto com os CSVs.
+    """
+
+    def __init__(self, diretorio):
+        self.diretorio = diretorio
+        self.caminho = os.path.join(diretorio, PREFIXO + "*" + EXTENSAO)
+        self.pendente = bytearray()
+        self.dia_pendente = None
+        self._limites = (0, 0)
+        self._arquivo = None
+        self._dia_arquivo = None
+
+    def caminho_dia(self, dia, versao=VERSAO_FORMATO):
+        sufixo = f".v{versao}" if versao > 1 else ""
+        return os.path.join(self.diretorio, PREFIXO + dia + sufixo + EXTENSAO)
+
+    def _arquivos(self):
+        """{dia ('AAAAMMDD'): [versões com arquivo, da mais antiga à atual]}."""
+        arquivos = {}
+        for nome in os.listdir(self.diretorio):
+            if nome.startswith(PREFIXO) and nome.endswith(EXTENSAO):
+                dia, _, versao = nome[len(PREFIXO):-len(EXTENSAO)].partition('.v')
+                if len(dia) != 8 or not dia.isdigit():
+                    continue
+                if not versao:
+                    arquivos.setdefault(dia, []).append(1)
+                elif versao.isdigit() and int(versao) <= VERSAO_FORMATO:
+                    arquivos.setdefault(dia, []).append(int(versao))
+        return {dia: sorted(versoes) for dia, versoes in arquivos.items()}
+
+    def dias(self):
+        """Dias ('AAAAMMDD') com arquivo, em ordem."""
+        return sorted(self._arquivos())
+
+    def _mapeamentos(self, dias, reverso=False):
+        """Gera os arquivos (_Mapeamento) dos dias, em ordem de tempo (ou do fim para o início)."""
+        arquivos = self._arquivos()
+        for dia in dias:
+            versoes = arquivos.get(dia, ())
+            for versao in (reversed(versoes) if reverso else versoes):
+                with _Mapeamento(self.caminho_dia(dia, versao), versao) as arquivo:
+                    yield arquivo
+
+    def remover_dia(self, dia):
+        """Apaga os arquivos de um dia (de todas as versões do formato)."""
+        for versao in self._arquivos().get(dia, ()):
+            os.remove(self.caminho_dia(dia, versao))
+
+    def adicionar(self, instante_ms, origem, distancia, codigo, confianca=None):
+        if not self._limites[0] <= instante_ms < self._limites[1]:
+            # Virou o dia: o que está pendente vai para o arquivo do dia anterior
+            self.descarregar()
+            self._limites = _limites_dia(instante_ms)
+            self.dia_pendente = _dia(instante_ms)
+        self.pendente += REGISTRO.pack(instante_ms, origem,
+                                       math.nan if distancia is None else distancia, codigo,
+                                       _incerteza(confianca))
+
+    def descarregar(self, fsync=False):
+        if self.pendente:
+            if self._dia_arquivo != self.dia_pendente:
+                if self._arquivo is not None:
+                    self._arquivo.close()
+                self._arquivo = open(self.caminho_dia(self.dia_pendente), 'ab', buffering=0)
+                descartar_registro_parcial(self._arquivo, REGISTRO.size)
+                self._dia_arquivo = self.dia_pendente
+            self._arquivo.write(self.pendente)
+            self.pendente.clear()
+        if fsync and self._arquivo is not None:
+            os.fsync(self._arquivo.fileno())
+
+    def fechar(self):
+        self.descarregar()
+        if self._arquivo is not None:
+            self._arquivo.close()
+            self._arquivo = None
+            self._dia_arquivo = None
+
+    def ler(self, inicio_ms=None, fim_ms=None, origem=None):
+        """
+        Gera (instante_s, origem, distancia, codigo, confianca) com instante em
+        [inicio_ms, fim_ms], em ordem de tempo, opcionalmente de uma origem.
+        """
+        dia_inicio = _dia(inicio_ms) if inicio_ms is not None else None
+        dia_fim = _dia(fim_ms) if fim_ms is not None else None
+        dias = [dia for dia in self.dias()
+                if not (dia_inicio and dia < dia_inicio) and not (dia_fim and dia > dia_fim)]
+        for arquivo in self._mapeamentos(dias):
+            if not arquivo.total:
+                continue
+            primeiro = arquivo.primeiro_a_partir(inicio_ms) if inicio_ms is not None else 0
+            for instante, orig, distancia, codigo, incerteza in arquivo.registros(primeiro, arquivo.total):
+                if fim_ms is not None and instante > fim_ms:
+                    return
+                if origem is None or orig == origem:
+                    yield instante / 1000, orig, distancia, codigo, _confianca(incerteza, arquivo.versao)
+
+    def ultimos(self, n, janela_ms=None, origem=None):
+        """
+        As n últimas ocorrências (em ordem cronológica); com janela_ms, também
+        todas as do intervalo que termina na última. Lê do fim para o início.
+        """
+        encontrados = []
+        limite = None
+        for arquivo in self._mapeamentos(reversed(self.dias()), reverso=True):
+            fim = arquivo.total
+            while fim > 0:
+                inicio = max(0, fim - BLOCO_LEITURA)
+                bloco = list(arquivo.registros(inicio, fim))
+                for instante, orig, distancia, codigo, incerteza in reversed(bloco):
+                    if origem is not None and orig != origem:
+                        continue
+                    if limite is None and janela_ms is not None:
+                        limite = instante - janela_ms
+                    if len(encontrados) >= n and (limite is None or instante < limite):
+                        encontrados.reverse()
+                        return encontrados
+                    encontrados.append((instante / 1000, orig, distancia, codigo,
+                                        _confianca(incerteza, arquivo.versao)))
+                fim = inicio
+        encontrados.reverse()
+        return encontrados
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Benchmark da captura do Echo (modo 'borda' x modo 'polling') usando o
+GPIOFalso do monitor_sensor_web, sem precisar de hardware.
+
+Mede, por medição:
+  - tempo de CPU do processo (inclui as threads de callback)
+  - tempo de parede
+  - erro absoluto em relação à distância simulada
+
+E o tempo de uma varredura completa de N vagas com cada vaga no seu próprio
+grupo (uma janela de eco por vaga) x todas no mesmo grupo de disparo.
+
+Uso:
+    python3 benchmark_eco.py --medicoes 200 --distancia 35 --vagas 8 [--pings 1]
+"""
+import argparse
+import statistics
+import time
+
+import monitor_sensor_web as monitor
+from registro_vagas import RegistroVagas
+
+TRIGGER = 23
+ECHO = 24
+
+
+def executar(modo, medicoes, distancia_cm):
+    gpio = monitor.GPIOFalso()
+    gpio.conectar_sensor(TRIGGER, ECHO, distancia_cm)
+    monitor.definir_backend_gpio(gpio)
+    monitor.MODO_CAPTURA_ECO = modo
+
+    erros = []
+    falhas = 0
+    cpu_inicio = time.process_time()
+    parede_inicio = time.perf_counter()
+    for _ in range(medicoes):
+        d, _ = monitor.medir_distancia_parking(TRIGGER, ECHO)
+        if d is None:
+            falhas += 1
+        else:
+            erros.append(abs(d - distancia_cm))
+    cpu_total = time.process_time() - cpu_inicio
+    parede_total = time.perf_counter() - parede_inicio
+
+    # O settle de 20 ms antes do trigger não consome CPU; fica no tempo de parede
+    print(f"[{modo}]")
+    print(f"  CPU por medição:    {cpu_total / medicoes * 1000:.3f} ms")
+    print(f"  Parede por medição: {parede_total / medicoes * 1000:.3f} ms")
+    if erros:
+        erros.sort()
+        p99 = erros[min(len(erros) - 1, int(len(erros) * 0.99))]
+        print(f"  Erro médio:         {statistics.mean(erros):.3f} cm")
+        print(f"  Erro p99:           {p99:.3f} cm")
+    print(f"  Falhas:             {falhas}/{medicoes}")
+
+
+def executar_varredura(rotulo, agrupar, vagas, varreduras, distancia_cm):
+    gpio = monitor.GPIOFalso()
+    configs = []
+    for vaga_id in range(1, vagas + 1):
+        trigger, echo = 100 + 2 * vaga_id, 101 + 2 * vaga_id
+        gpio.conectar_sensor(trigger, echo, distancia_cm)
+        configs.append({'id': vaga_id, 'trigger': trigger, 'echo': echo,
+                        'led_vermelho': 0, 'led_verde': 0, 'buzzer': 0,
+                        'grupo': 0 if agrupar else vaga_id})
+    monitor.registro = RegistroVagas(configs)
+    monitor.definir_backend_gpio(gpio)
+    monitor.MODO_CAPTURA_ECO = 'borda'
+
+    inicio = time.perf_counter()
+    for _ in range(varreduras):
+        monitor.medir_varredura()
+    duracao = (time.perf_counter() - inicio) / varreduras
+    print(f"[varredura {rotulo}, {vagas} vagas]")
+    print(f"  Duração:            {duracao * 1000:.3f} ms")
+    print(f"  Varreduras/s:       {1 / duracao:.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark da captura do Echo do HC-SR04")
+    parser.add_argument("--medicoes", type=int, default=200, help="Medições por modo (default: %(default)s)")
+    parser.add_argument("--distancia", type=float, default=35.0, help="Distância simulada em cm (default: %(default)s)")
+    parser.add_argument("--vagas", type=int, default=8, help="Vagas no benchmark de varredura (default: %(default)s)")
+    parser.add_argument("--pings", type=int, default=monitor.PINGS_POR_LEITURA,
+                        help="Pings por leitura, modo rajada (default: %(default)s)")
+    args = parser.parse_args()
+    monitor.PINGS_POR_LEITURA = args.pings
+
+    for modo in ('polling', 'borda'):
+        executar(modo, args.medicoes, args.distancia)
+
+    varreduras = max(1, args.medicoes // 10)
+    executar_varredura('um grupo por vaga', False, args.vagas, varreduras, args.distancia)
+    executar_varredura('grupo único', True, args.vagas, varreduras, args.distancia)
+
+
+if __name__ == "__main__":
+    main()
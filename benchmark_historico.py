@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Benchmark da leitura do histórico: leitura reversa por blocos
+(ler_ultimas_linhas) x leitura completa do CSV (list(leitor)[-100:]).
+
+Gera um historico_completo.csv sintético do tamanho pedido e mede a
+latência de buscar as últimas N linhas, como fazem /api/historico/*.
+
+Uso:
+    python3 benchmark_historico.py --tamanho-mb 2048 --linhas 100
+    python3 benchmark_historico.py --tamanho-mb 200 --comparar-antigo
+"""
+import argparse
+import csv
+import os
+import tempfile
+import time
+
+import monitor_sensor_web as monitor
+
+
+def gerar_log(caminho, tamanho_mb):
+    """Escreve um CSV de eventos com ~tamanho_mb MB (em blocos, sem usar RAM)."""
+    alvo = tamanho_mb * 1024 * 1024
+    linhas = []
+    for i in range(10000):
+        minuto, segundo = divmod(i, 60)
+        linhas.append(f"2026-01-01 {minuto // 60 % 24:02d}:{minuto % 60:02d}:{segundo:02d},vaga{i % 2 + 1},distancia_cm,{20 + i % 40}.25\r\n")
+    bloco = ''.join(linhas).encode()
+    with open(caminho, 'wb') as f:
+        f.write(b"timestamp,tipo,descricao,valor\r\n")
+        escrito = 0
+        while escrito < alvo:
+            f.write(bloco)
+            escrito += len(bloco)
+
+
+def medir(funcao, repeticoes):
+    tempos = []
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        resultado = funcao()
+        tempos.append(time.perf_counter() - inicio)
+    tempos.sort()
+    return resultado, tempos[len(tempos) // 2]
+
+
+def leitura_antiga(caminho, n):
+    with open(caminho, 'r', newline='') as arquivo:
+        leitor = csv.reader(arquivo)
+        next(leitor, None)
+        return list(leitor)[-n:]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark da leitura do final dos CSVs de histórico")
+    parser.add_argument("--tamanho-mb", type=int, default=2048, help="Tamanho do log sintético (default: %(default)s)")
+    parser.add_argument("--linhas", type=int, default=100, help="Linhas pedidas (default: %(default)s)")
+    parser.add_argument("--repeticoes", type=int, default=20, help="Repetições da leitura reversa (default: %(default)s)")
+    parser.add_argument("--comparar-antigo", action="store_true", help="Mede também a leitura completa (lenta em arquivos grandes)")
+    parser.add_argument("--arquivo", help="Usa um CSV existente em vez de gerar um sintético")
+    args = parser.parse_args()
+
+    temporario = None
+    caminho = args.arquivo
+    if caminho is None:
+        temporario = tempfile.NamedTemporaryFile(suffix='.csv', delete=False)
+        temporario.close()
+        caminho = temporario.name
+        print(f"Gerando log sintético de {args.tamanho_mb} MB em {caminho}...")
+        gerar_log(caminho, args.tamanho_mb)
+
+    try:
+        tamanho = os.path.getsize(caminho) / (1024 * 1024)
+        novas, mediana = medir(lambda: monitor.ler_ultimas_linhas(caminho, args.linhas), args.repeticoes)
+        print(f"Arquivo: {tamanho:.0f} MB")
+        print(f"[leitura reversa]  {args.linhas} linhas em {mediana * 1000:.3f} ms (mediana)")
+        if args.comparar_antigo:
+            antigas, mediana = medir(lambda: leitura_antiga(caminho, args.linhas), 1)
+            print(f"[leitura completa] {args.linhas} linhas em {mediana * 1000:.3f} ms")
+            print(f"Resultados iguais: {novas == antigas}")
+    finally:
+        if temporario is not None:
+            os.remove(caminho)
+
+
+if __name__ == "__main__":
+    main()
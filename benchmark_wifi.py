@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Benchmark da verificação de conexão Wi-Fi do painel_wifi.
+
+Compara o uso de CPU do loop do painel (uma iteração a cada 100 ms) com:
+  - o método antigo: `iwgetid -r` em um subprocesso a cada iteração
+  - o ObservadorWifi: estado em cache, atualizado por eventos do netlink
+
+O tempo de CPU inclui os processos filhos (shell + iwgetid). Não precisa
+do display nem dos botões; sem Wi-Fi, o resultado do teste é "desconectado"
+nos dois casos, mas o custo medido é o mesmo.
+
+Uso:
+    python3 benchmark_wifi.py --duracao 10
+"""
+import argparse
+import resource
+import subprocess
+import time
+
+from info_sistema import ObservadorWifi
+
+INTERVALO_LOOP_S = 0.1  # MENU_REDRAW_SLEEP do painel
+
+
+def wifi_conectado_antigo():
+    """Como o painel fazia antes: um processo por verificação."""
+    try:
+        ssid = subprocess.check_output("iwgetid -r", shell=True, text=True, stderr=subprocess.DEVNULL).strip()
+    except (subprocess.CalledProcessError, FileNotFoundError):
+        return False
+    return ssid != ""
+
+
+def tempo_cpu():
+    proprio = resource.getrusage(resource.RUSAGE_SELF)
+    filhos = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return proprio.ru_utime + proprio.ru_stime + filhos.ru_utime + filhos.ru_stime
+
+
+def executar(rotulo, verificar, duracao):
+    iteracoes = 0
+    cpu_inicio = tempo_cpu()
+    parede_inicio = time.perf_counter()
+    fim = parede_inicio + duracao
+    while time.perf_counter() < fim:
+        verificar()
+        iteracoes += 1
+        time.sleep(INTERVALO_LOOP_S)
+    cpu_total = tempo_cpu() - cpu_inicio
+    parede_total = time.perf_counter() - parede_inicio
+
+    print(f"[{rotulo}]")
+    print(f"  Iterações:          {iteracoes}")
+    print(f"  CPU total:          {cpu_total * 1000:.1f} ms")
+    print(f"  CPU por iteração:   {cpu_total / iteracoes * 1000:.3f} ms")
+    print(f"  Uso de CPU:         {cpu_total / parede_total * 100:.2f} %")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark da verificação de Wi-Fi do painel")
+    parser.add_argument("--duracao", type=float, default=10.0, help="Duração de cada loop em segundos (default: %(default)s)")
+    args = parser.parse_args()
+
+    executar("antigo: iwgetid por iteração", wifi_conectado_antigo, args.duracao)
+
+    observador = ObservadorWifi()
+    observador.iniciar()
+    try:
+        # Inclui a thread do observador (mesmo processo) no tempo medido
+        executar("observador: estado em cache", lambda: observador.conectado, args.duracao)
+    finally:
+        observador.parar()
+    print(f"  Eventos netlink:    {observador.eventos}")
+
+
+if __name__ == "__main__":
+    main()
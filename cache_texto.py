@@ -0,0 +1,146 @@
+"""
+Cache de medidas, layouts e bitmaps de texto para o display do painel.
+
+Medir texto com FreeType (font.getbbox) é a parte cara de um redesenho:
+a quebra de linhas mede uma vez por palavra e o corte de nomes longos
+uma vez por caractere removido. Como as telas repetem os mesmos textos
+(títulos, nomes de rede, instruções), tudo aqui é memorizado com
+descarte LRU, por (fonte, texto[, largura]):
+
+    quebrar_linhas(font, texto, largura)   # linhas da quebra por palavras
+    truncar(font, texto, largura)          # texto cortado com "..."
+    bitmap_texto(font, texto)              # (bitmap modo "1", dx) pronto para blit
+    altura_linha(font)
+
+desenhar() copia o bitmap para a imagem com ImageDraw.bitmap, sem passar
+pelo FreeType. desenhar_com_final() monta "texto + caractere" a partir do
+bitmap do texto e do par (último caractere, caractere): o FreeType posiciona
+cada glifo conforme o vizinho, então o par, e não o glifo sozinho, é que
+sai idêntico ao texto inteiro. pre_renderizar() gera esses pares de
+antemão para um conjunto de caracteres (o CHARSET da senha), para
+percorrê-lo sem medir nada.
+
+A fonte entra na chave pela identidade: carregue cada fonte uma vez.
+"""
+from functools import lru_cache
+
+from PIL import Image, ImageDraw
+
+TAMANHO_CACHE_LAYOUT = 256
+TAMANHO_CACHE_BITMAPS = 512  # cabem o CHARSET e os pares pré-renderizados + os textos das telas
+RETICENCIAS = "..."
+
+
+@lru_cache(maxsize=TAMANHO_CACHE_LAYOUT)
+def caixa(font, texto, mode=""):
+    """
+    font.getbbox(texto) em cache. Com mode="1", a caixa do texto como ele
+    sai numa imagem modo "1" (hinting monocromático, em geral mais larga
+    que a medida com antialiasing, que é a usada no layout).
+    """
+    return font.getbbox(texto, mode=mode)
+
+
+def largura(font, texto):
+    esquerda, _, direita, _ = caixa(font, texto)
+    return direita - esquerda
+
+
+@lru_cache(maxsize=TAMANHO_CACHE_LAYOUT)
+def avanco(font, texto):
+    """Deslocamento horizontal até o próximo caractere depois do texto (modo "1")."""
+    return font.getlength(texto, mode="1")
+
+
+@lru_cache(maxsize=None)
+def altura_linha(font):
+    """Altura de uma linha de texto (altura do "A" + 2 de espaçamento)."""
+    _, topo, _, base = font.getbbox("A")
+    return base - topo + 2
+
+
+@lru_cache(maxsize=TAMANHO_CACHE_LAYOUT)
+def quebrar_linhas(font, texto, largura_max):
+    """
+    Quebra por palavras para caber em largura_max. Uma palavra maior que a
+    linha sozinha é cortada e ganha "...".
+    """
+    linhas = []
+    atual = ""
+    for palavra in texto.split(' '):
+        teste = f"{atual} {palavra}".strip()
+        if largura(font, teste) <= largura_max:
+            atual = teste
+        else:
+            linhas.append(atual)
+            atual = palavra
+            if largura(font, palavra) > largura_max:
+                while largura(font, atual) > largura_max:
+                    atual = atual[:-1]
+                atual += RETICENCIAS
+    linhas.append(atual)
+    return tuple(linhas)
+
+
+@lru_cache(maxsize=TAMANHO_CACHE_LAYOUT)
+def truncar(font, texto, largura_max):
+    """
+    Texto inteiro se a borda direita couber em largura_max; senão, o maior
+    prefixo que cabe seguido de "..." (busca binária no tamanho do prefixo).
+    """
+    if caixa(font, texto)[2] <= largura_max:
+        return texto
+    baixo, alto = 0, len(texto)
+    while baixo < alto:
+        meio = (baixo + alto + 1) // 2
+        if font.getbbox(texto[:meio] + RETICENCIAS)[2] <= largura_max:
+            baixo = meio
+        else:
+            alto = meio - 1
+    return texto[:baixo] + RETICENCIAS
+
+
+@lru_cache(maxsize=TAMANHO_CACHE_BITMAPS)
+def bitmap_texto(font, texto):
+    """
+    (bitmap, dx) do texto desenhado na origem, ou None se não acende nenhum
+    pixel. dx corrige glifos que começam à esquerda da origem (a caixa do
+    FreeType é arredondada: deixa uma coluna de folga de cada lado).
+    """
+    esquerda, _, direita, base = caixa(font, texto, "1")
+    if direita <= esquerda or base <= 0:
+        return None
+    dx = min(0, esquerda) - 1
+    bitmap = Image.new("1", (direita - dx + 1, base))
+    # Mesmo rasterizador do draw.text direto na tela: o blit sai idêntico
+    ImageDraw.Draw(bitmap).text((-dx, 0), texto, font=font, fill=255)
+    return bitmap, dx
+
+
+def desenhar(draw, font, texto, x, y):
+    """Equivalente a draw.text((x, y), texto, font=font, fill=255), via bitmap em cache."""
+    renderizado = bitmap_texto(font, texto)
+    if renderizado is not None:
+        bitmap, dx = renderizado
+        draw.bitmap((x + dx, y), bitmap, fill=255)
+
+
+def desenhar_com_final(draw, font, texto, caractere, x, y):
+    """Desenha texto + caractere (ex.: asteriscos da senha + caractere atual)."""
+    if not texto:
+        desenhar(draw, font, caractere, x, y)
+        return
+    desenhar(draw, font, texto[:-1], x, y)
+    desenhar(draw, font, texto[-1] + caractere, x + avanco(font, texto[:-1]), y)
+
+
+def pre_renderizar(font, caracteres, anterior=None):
+    """
+    Gera os bitmaps de cada caractere (ex.: o CHARSET da senha) e, com
+    `anterior`, os dos pares anterior + caractere usados por
+    desenhar_com_final().
+    """
+    for caractere in caracteres:
+        bitmap_texto(font, caractere)
+        if anterior is not None:
+            bitmap_texto(font, anterior + caractere)
@@ -0,0 +1,124 @@
+"""
+Filtro das leituras de distância de uma vaga.
+
+Etapas, por amostra:
+  1. mediana móvel das últimas K leituras válidas (descarta ecos isolados);
+  2. EMA opcional sobre a mediana (suaviza a distância mostrada);
+  3. histerese em torno dos limiares: para ocupar a distância precisa cair
+     abaixo de limiar - histerese, para liberar subir acima de
+     limiar + histerese;
+  4. permanência mínima: o novo estado precisa se manter por permanencia_s
+     antes de ser aceito (o "muito próximo" não espera, é alerta de manobra).
+
+Falhas de leitura (None) mantêm o último estado até max_falhas seguidas.
+Os buffers são alocados uma vez; o custo por amostra é O(K), com K fixo e
+pequeno.
+
+estimativa_robusta() reduz os pings de uma rajada a uma leitura, antes do
+filtro.
+"""
+from array import array
+from bisect import bisect_left, insort
+
+
+class FiltroVaga:
+    __slots__ = ('k', 'ema_alfa', 'histerese_cm', 'permanencia_s', 'max_falhas',
+                 'limiar_ocupada', 'limiar_proximo',
+                 'janela', 'ordenada', 'posicao', 'ema', 'falhas',
+                 'estado', 'candidato', 'candidato_desde', 'distancia', 'muito_proximo')
+
+    def __init__(self, limiar_ocupada, limiar_proximo, k=5, ema_alfa=None,
+                 histerese_cm=3.0, permanencia_s=2.0, max_falhas=None):
+        self.k = max(1, int(k))
+        self.ema_alfa = ema_alfa
+        self.histerese_cm = histerese_cm
+        self.permanencia_s = permanencia_s
+        self.max_falhas = max_falhas if max_falhas is not None else self.k
+        self.limiar_ocupada = limiar_ocupada
+        self.limiar_proximo = limiar_proximo
+        self.janela = array('d', [0.0]) * self.k  # buffer circular das leituras
+        self.ordenada = []                         # a mesma janela, ordenada
+        self.reiniciar()
+
+    def reiniciar(self):
+        del self.ordenada[:]
+        self.posicao = 0
+        self.ema = None
+        self.falhas = 0
+        self.estado = 'desconhecido'
+        self.candidato = None
+        self.candidato_desde = 0.0
+        self.distancia = None
+        self.muito_proximo = False
+
+    def _mediana(self, distancia):
+        if len(self.ordenada) == self.k:
+            antiga = self.janela[self.posicao]
+            del self.ordenada[bisect_left(self.ordenada, antiga)]
+        self.janela[self.posicao] = distancia
+        insort(self.ordenada, distancia)
+        self.posicao = (self.posicao + 1) % self.k
+        return self.ordenada[len(self.ordenada) // 2]
+
+    def _banda(self, valor, limiar, atual):
+        """Histerese: True abaixo de limiar - h, False acima de limiar + h."""
+        if valor < limiar - self.histerese_cm:
+            return True
+        if valor > limiar + self.histerese_cm:
+            return False
+        return atual
+
+    def atualizar(self, distancia, agora):
+        """
+        Processa uma leitura (cm ou None) no instante `agora` (monotônico) e
+        retorna o estado filtrado: 'livre', 'ocupada' ou 'falha'. A distância
+        filtrada e o "muito próximo" ficam em self.distancia/self.muito_proximo.
+        """
+        if distancia is None:
+            self.falhas += 1
+            if self.falhas >= self.max_falhas or self.estado == 'desconhecido':
+                self.reiniciar()
+                self.estado = 'falha'
+            return self.estado
+        self.falhas = 0
+
+        valor = self._mediana(distancia)
+        if self.ema_alfa:
+            self.ema = valor if self.ema is None else self.ema + self.ema_alfa * (valor - self.ema)
+            valor = self.ema
+        self.distancia = valor
+        self.muito_proximo = self._banda(valor, self.limiar_proximo, self.muito_proximo)
+
+        ocupada_atual = self.estado == 'ocupada'
+        desejado = 'ocupada' if self._banda(valor, self.limiar_ocupada, ocupada_atual) else 'livre'
+        if self.estado not in ('livre', 'ocupada'):
+            # Primeira classificação (ou volta de falha): sem esperar
+            self.estado = desejado
+            self.candidato = None
+        elif desejado == self.estado:
+            self.candidato = None
+        elif self.candidato != desejado:
+            self.candidato = desejado
+            self.candidato_desde = agora
+        elif agora - self.candidato_desde >= self.permanencia_s:
+            self.estado = desejado
+            self.candidato = None
+        return self.estado
+
+
+def estimativa_robusta(amostras, minimo, maximo, tolerancia_cm):
+    """
+    Combina os pings de uma rajada (cm ou None) em (distancia, confianca).
+    Descarta timeouts e valores fora de [minimo, maximo]; das leituras
+    válidas, fica com as que estão a até tolerancia_cm (ou 3x o desvio
+    absoluto mediano, se maior) da mediana e retorna a média delas. A
+    confiança é a fração dos pings que concordam com a estimativa.
+    """
+    validas = sorted(a for a in amostras if a is not None and minimo <= a <= maximo)
+    if not validas:
+        return None, 0.0
+    mediana = validas[len(validas) // 2]
+    desvios = sorted(abs(a - mediana) for a in validas)
+    limite = max(tolerancia_cm, 3 * desvios[len(desvios) // 2])
+    aceitas = [a for a in validas if abs(a - mediana) <= limite]
+    return round(sum(aceitas) / len(aceitas), 2), round(len(aceitas) / len(amostras), 2)
@@ -0,0 +1,305 @@
+"""
+Informações do sistema e da rede para o painel, sem subprocessos.
+
+Cada campo é lido direto do kernel (ioctl, /proc, utmp) e guardado em
+cache com o seu próprio TTL. Uma thread em segundo plano renova os campos
+vencidos, então a leitura pelo loop da interface (valor()) só consulta um
+dicionário: nenhum fork a cada redesenho do carrossel.
+
+    coletor = ColetorSistema()
+    coletor.iniciar()
+    coletor.valor('ssid')      # None enquanto não houver leitura
+
+O ObservadorWifi acompanha a conexão Wi-Fi por eventos de link do kernel
+(netlink) e publica o estado em um atributo, lido de graça pelo loop.
+
+    observador = ObservadorWifi()
+    observador.iniciar()
+    observador.conectado
+"""
+import fcntl
+import select
+import socket
+import struct
+import threading
+import time
+from array import array
+
+try:
+    import psutil
+except ImportError:  # as leituras abaixo não dependem dele
+    psutil = None
+
+INTERFACE_WIFI = "wlan0"
+
+# ioctls (linux/wireless.h e linux/sockios.h)
+SIOCGIWESSID = 0x8B1B
+SIOCGIFADDR = 0x8915
+IW_ESSID_MAX_SIZE = 32
+
+# utmp (glibc, igual em 32 e 64 bits): só os campos usados importam
+ARQUIVO_UTMP = "/var/run/utmp"
+REGISTRO_UTMP = struct.Struct('hxxi32s4s32s256shhiii4i20x')
+USER_PROCESS = 7
+
+PORTA_SSH = 22
+TCP_LISTEN = '0A'
+
+# Netlink (linux/rtnetlink.h): mudanças de link e de endereço IPv4
+RTMGRP_LINK = 0x1
+RTMGRP_IPV4_IFADDR = 0x10
+# Sem netlink, o observador lê o operstate nesse intervalo; com netlink, é
+# só a releitura de segurança caso algum evento se perca
+INTERVALO_POLL_WIFI_S = 1.0
+INTERVALO_CONFIRMACAO_WIFI_S = 30.0
+
+# TTL (s) de cada campo
+TTL_CAMPOS = {
+    'ssid': 5.0,
+    'ip': 10.0,
+    'hostname': 300.0,
+    'sinal': 3.0,
+    'ssh_ativo': 10.0,
+    'usuarios_ssh': 10.0,
+}
+
+
+def ler_ssid(interface=INTERFACE_WIFI):
+    """SSID da rede associada (SIOCGIWESSID) ou None."""
+    essid = array('b', bytes(IW_ESSID_MAX_SIZE + 1))
+    endereco, tamanho = essid.buffer_info()
+    pedido = struct.pack('16sPHH', interface.encode(), endereco, tamanho, 0).ljust(32, b'\0')
+    try:
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
+            resposta = fcntl.ioctl(s.fileno(), SIOCGIWESSID, pedido)
+    except OSError:
+        return None
+    comprimento = struct.unpack_from('16sPHH', resposta)[2]
+    return essid.tobytes()[:comprimento].decode(errors='replace') or None
+
+
+def _ip_interface(interface):
+    pedido = struct.pack('16sH14s', interface.encode(), socket.AF_INET, b'')
+    try:
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
+            resposta = fcntl.ioctl(s.fileno(), SIOCGIFADDR, pedido)
+    except OSError:
+        return None
+    return socket.inet_ntoa(resposta[20:24])
+
+
+def ler_ip(preferida=INTERFACE_WIFI):
+    """Primeiro IPv4 fora do loopback (a interface Wi-Fi primeiro) ou None."""
+    if psutil is not None:
+        enderecos = psutil.net_if_addrs()
+        interfaces = sorted(enderecos, key=lambda nome: nome != preferida)
+        for nome in interfaces:
+            for endereco in enderecos[nome]:
+                if endereco.family == socket.AF_INET and not endereco.address.startswith('127.'):
+                    return endereco.address
+        return None
+    interfaces = sorted((nome for _, nome in socket.if_nameindex()), key=lambda nome: nome != preferida)
+    for nome in interfaces:
+        ip = _ip_interface(nome)
+        if ip and not ip.startswith('127.'):
+            return ip
+    return None
+
+
+def ler_sinal(interface=INTERFACE_WIFI):
+    """
+    (nível_dbm, qualidade) da interface em /proc/net/wireless; cada um pode
+    ser None (alguns drivers só informam a qualidade).
+    """
+    try:
+        with open('/proc/net/wireless', 'r') as arquivo:
+            linhas = arquivo.readlines()[2:]
+    except OSError:
+        return None, None
+    for linha in linhas:
+        nome, _, resto = linha.partition(':')
+        if nome.strip() != interface:
+            continue
+        campos = resto.split()
+        try:
+            qualidade = float(campos[1].rstrip('.'))
+            nivel = float(campos[2].rstrip('.'))
+        except (IndexError, ValueError):
+            return None, None
+        return (int(nivel) if nivel < 0 else None), int(qualidade)
+    return None, None
+
+
+def contar_usuarios_ssh():
+    """Sessões em pseudo-terminais (pts/*), como `who | grep pts`."""
+    if psutil is not None:
+        return sum(1 for usuario in psutil.users() if (usuario.terminal or '').startswith('pts'))
+    try:
+        with open(ARQUIVO_UTMP, 'rb') as arquivo:
+            dados = arquivo.read()
+    except OSError:
+        return 0
+    total = 0
+    for registro in REGISTRO_UTMP.iter_unpack(dados[:len(dados) - len(dados) % REGISTRO_UTMP.size]):
+        if registro[0] == USER_PROCESS and registro[2].startswith(b'pts'):
+            total += 1
+    return total
+
+
+def ssh_ativo(porta=PORTA_SSH):
+    """True se há um socket TCP escutando na porta do SSH (/proc/net/tcp e tcp6)."""
+    sufixo = f":{porta:04X}"
+    for caminho in ('/proc/net/tcp', '/proc/net/tcp6'):
+        try:
+            with open(caminho, 'r') as arquivo:
+                next(arquivo, None)
+                for linha in arquivo:
+                    campos = linha.split()
+                    if len(campos) > 3 and campos[1].endswith(sufixo) and campos[3] == TCP_LISTEN:
+                        return True
+        except OSError:
+            continue
+    return False
+
+
+class ColetorSistema:
+    """Cache com TTL por campo, renovado por uma thread em segundo plano."""
+
+    def __init__(self, ttl=None):
+        self.leitores = {
+            'ssid': ler_ssid,
+            'ip': ler_ip,
+            'hostname': socket.gethostname,
+            'sinal': ler_sinal,
+            'ssh_ativo': ssh_ativo,
+            'usuarios_ssh': contar_usuarios_ssh,
+        }
+        self.ttl = dict(TTL_CAMPOS, **(ttl or {}))
+        self.valores = {}
+        self.vencimento = {campo: 0.0 for campo in self.leitores}
+        self._acordar = threading.Event()
+        self._parar = False
+        self._thread = None
+
+    def valor(self, campo, padrao=None):
+        """Último valor lido (sem I/O)."""
+        return self.valores.get(campo, padrao)
+
+    def invalidar(self, *campos):
+        """Força a releitura dos campos (todos, sem argumentos) o quanto antes."""
+        for campo in campos or self.leitores:
+            self.vencimento[campo] = 0.0
+        self._acordar.set()
+
+    def atualizar_vencidos(self):
+        """Relê os campos com TTL vencido; retorna o instante do próximo vencimento."""
+        agora = time.monotonic()
+        for campo, leitor in self.leitores.items():
+            if self.vencimento[campo] <= agora:
+                try:
+                    self.valores[campo] = leitor()
+                except Exception as e:
+                    print(f"Erro ao ler {campo}: {e}")
+                self.vencimento[campo] = time.monotonic() + self.ttl[campo]
+        return min(self.vencimento.values())
+
+    def _executar(self):
+        while not self._parar:
+            proximo = self.atualizar_vencidos()
+            self._acordar.wait(max(0.0, proximo - time.monotonic()))
+            self._acordar.clear()
+
+    def iniciar(self):
+        if self._thread is None:
+            self.atualizar_vencidos()  # primeira leitura síncrona: a tela já abre preenchida
+            self._thread = threading.Thread(target=self._executar, name="coletor-sistema", daemon=True)
+            self._thread.start()
+
+    def parar(self):
+        self._parar = True
+        self._acordar.set()
+
+
+def ler_operstate(interface=INTERFACE_WIFI):
+    """Conteúdo de /sys/class/net/<interface>/operstate ('up', 'down', 'dormant'...) ou None."""
+    try:
+        with open(f'/sys/class/net/{interface}/operstate', 'r') as arquivo:
+            return arquivo.read().strip()
+    except OSError:
+        return None
+
+
+def wifi_conectado(interface=INTERFACE_WIFI):
+    """Associado a uma rede: link operacional e SSID definido (como `iwgetid -r`)."""
+    operstate = ler_operstate(interface)
+    if operstate not in ('up', 'unknown'):  # 'unknown': driver que não informa
+        return False
+    return ler_ssid(interface) is not None
+
+
+class ObservadorWifi:
+    """
+    Publica em `conectado` o estado do Wi-Fi. Uma thread espera eventos de
+    link/endereço no netlink e só então relê o estado (operstate + SSID);
+    sem netlink, faz polling barato do operstate.
+    """
+
+    def __init__(self, interface=INTERFACE_WIFI, ao_mudar=None):
+        self.interface = interface
+        self.ao_mudar = ao_mudar  # chamada (na thread do observador) com o novo estado
+        self.conectado = False
+        self.eventos = 0  # mensagens netlink recebidas
+        self._netlink = None
+        self._parar = False
+        self._thread = None
+
+    def _abrir_netlink(self):
+        try:
+            s = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, socket.NETLINK_ROUTE)
+            s.bind((0, RTMGRP_LINK | RTMGRP_IPV4_IFADDR))
+            return s
+        except (OSError, AttributeError):
+            print("Aviso: netlink indisponível, usando polling do operstate.")
+            return None
+
+    def reavaliar(self):
+        conectado = wifi_conectado(self.interface)
+        if conectado != self.conectado:
+            self.conectado = conectado
+            if self.ao_mudar is not None:
+                try:
+                    self.ao_mudar(conectado)
+                except Exception as e:
+                    print(f"Erro no aviso de mudança do Wi-Fi: {e}")
+        return conectado
+
+    def _executar(self):
+        while not self._parar:
+            if self._netlink is None:
+                time.sleep(INTERVALO_POLL_WIFI_S)
+            else:
+                prontos, _, _ = select.select([self._netlink], [], [], INTERVALO_CONFIRMACAO_WIFI_S)
+                if prontos:
+                    # Drena a rajada de mensagens (uma mudança gera várias) e relê uma vez
+                    try:
+                        while True:
+                            self._netlink.recv(65536, socket.MSG_DONTWAIT)
+                            self.eventos += 1
+                    except BlockingIOError:
+                        pass
+                    except OSError:  # ENOBUFS: perdemos eventos, a releitura cobre
+                        pass
+            if not self._parar:
+                self.reavaliar()
+
+    def iniciar(self):
+        if self._thread is None:
+            self._netlink = self._abrir_netlink()
+            self.reavaliar()
+            self._thread = threading.Thread(target=self._executar, name="observador-wifi", daemon=True)
+            self._thread.start()
+
+    def parar(self):
+        self._parar = True
+        if self._netlink is not None:
+            self._netlink.close()
@@ -6,45 +6,68 @@ import time
 import random
 import os
 import csv
+import io
 import argparse
+import gzip
+import math
 import queue  
+import selectors
+import socket
+import struct
+import zlib
+from array import array
+from bisect import bisect_left
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from datetime import datetime
 from urllib.parse import parse_qs, urlparse
 
+import agregados
+import sessoes
+from agregados import Agregador
+from armazenamento_binario import ArmazenamentoBinario, descartar_registro_parcial
+from filtro_vagas import FiltroVaga, estimativa_robusta
+from sessoes import RastreadorSessoes
+from registro_vagas import (ARQUIVO_CONFIG_VAGAS, CODIGO_ESTADO, ESTADOS,
+                            EstadoVagas, carregar_registro)
+
 # Variável global para controle do LED
 led_status = False
 PORT = 8001
 
-# ====================== Configuração de Estacionamento (2 vagas) ====================== #
-# Sensores ultrassônicos (duas vagas)
-S1_TRIGGER = 23  # Vaga 1 - Trigger
-S1_ECHO = 24     # Vaga 1 - Echo
-S2_TRIGGER = 14  # Vaga 2 - Trigger
-S2_ECHO = 15     # Vaga 2 - Echo
-
-# LEDs (vermelho/verde por vaga)
-LED_VAGA1_VERMELHO = 25
-LED_VAGA1_VERDE = 8
-LED_VAGA2_VERMELHO = 7
-LED_VAGA2_VERDE = 1 
-
-# Polaridade
-LED_VAGA1_RED_ACTIVE_HIGH = True
-LED_VAGA1_GREEN_ACTIVE_HIGH = True
-LED_VAGA2_RED_ACTIVE_HIGH = True
-LED_VAGA2_GREEN_ACTIVE_HIGH = True
-
-# Polaridade dos buzzers (alterar para False se acionam em LOW)
-BUZZER_VAGA1_ACTIVE_HIGH = True
-BUZZER_VAGA2_ACTIVE_HIGH = True
-
-# Buzzers por vaga
-BUZZER_VAGA1 = 12
-BUZZER_VAGA2 = 13
+# Servidor HTTP (pool de threads com keep-alive)
+MAX_WORKERS_HTTP = 8          # threads atendendo requisições
+MAX_CONEXOES_HTTP = 64        # conexões abertas ao mesmo tempo (as excedentes recebem 503)
+TIMEOUT_KEEPALIVE_S = 15.0    # conexão keep-alive ociosa é fechada após esse tempo
+TIMEOUT_REQUISICAO_S = 10.0   # tempo máximo para o cliente enviar/receber uma requisição
+
+# Downloads: enviados em blocos (memória constante), com Range e gzip opcional
+TAMANHO_BLOCO_ENVIO = 64 * 1024
+NIVEL_GZIP = 5                # 1 = mais rápido ... 9 = menor
+
+# ====================== Configuração de Estacionamento (N vagas) ====================== #
+# Pinos, polaridade e grupo de disparo de cada vaga ficam no registro de
+# vagas (vagas.json, ver registro_vagas.py). Sem o arquivo, usa as duas
+# vagas originais (Vaga 1: 23/24, LEDs 25/8, buzzer 12;
+# Vaga 2: 14/15, LEDs 7/1, buzzer 13).
+registro = carregar_registro(ARQUIVO_CONFIG_VAGAS)
 
 # Thresholds (ajuste conforme instalação)
 THRESHOLD_OCUPADA_CM = 40.0     # abaixo disso considera ocupada
 THRESHOLD_MUITO_PROXIMO_CM = 10.0   # abaixo disso emite bip
+# Mediana, EMA, histerese e permanência mínima são configuradas por vaga no
+# registro (mediana_k, ema_alfa, histerese_cm, permanencia_s)
+
+
+def _criar_filtros():
+    """Um filtro de leituras por slot, com os parâmetros de cada vaga."""
+    return [FiltroVaga(THRESHOLD_OCUPADA_CM, THRESHOLD_MUITO_PROXIMO_CM,
+                       k=vaga.mediana_k, ema_alfa=vaga.ema_alfa,
+                       histerese_cm=vaga.histerese_cm, permanencia_s=vaga.permanencia_s)
+            for vaga in registro]
+
+filtros_vagas = _criar_filtros()
 
 # ==============================================================================
 # REMOVIDO: Conflito de Threads
@@ -114,26 +137,27 @@ except (ImportError, RuntimeError):
     sensor = SensorSimulado() # Objeto placeholder para cleanup
 
 # Inicialização dos pinos para estacionamento quando em Raspberry Pi
-try:
-    import RPi.GPIO as _GPIO_check
-    # Configuração de pinos de sensores e atuadores de estacionamento
-    _GPIO_check.setmode(_GPIO_check.BCM)
-    _GPIO_check.setwarnings(False)
-    # Sensores
-    _GPIO_check.setup(S1_TRIGGER, _GPIO_check.OUT, initial=_GPIO_check.LOW)
-    _GPIO_check.setup(S1_ECHO, _GPIO_check.IN)
-    _GPIO_check.setup(S2_TRIGGER, _GPIO_check.OUT, initial=_GPIO_check.LOW)
-    _GPIO_check.setup(S2_ECHO, _GPIO_check.IN)
-    # Atuadores
-    for pin in [LED_VAGA1_VERMELHO, LED_VAGA1_VERDE, LED_VAGA2_VERMELHO, LED_VAGA2_VERDE,
-                BUZZER_VAGA1, BUZZER_VAGA2]:
-        try:
-            _GPIO_check.setup(pin, _GPIO_check.OUT, initial=_GPIO_check.LOW)
-        except Exception as e:
-            print(f"Aviso: falha ao configurar GPIO {pin}: {e}")
-except Exception:
-    # Em ambiente de simulação (Windows), essa etapa é ignorada
-    pass
+def configurar_pinos_estacionamento():
+    try:
+        import RPi.GPIO as _GPIO_check
+        # Configuração de pinos de sensores e atuadores de estacionamento
+        _GPIO_check.setmode(_GPIO_check.BCM)
+        _GPIO_check.setwarnings(False)
+        # Sensores
+        for vaga in registro:
+            _GPIO_check.setup(vaga.trigger, _GPIO_check.OUT, initial=_GPIO_check.LOW)
+            _GPIO_check.setup(vaga.echo, _GPIO_check.IN)
+        # Atuadores
+        for pin in registro.pinos_saida():
+            try:
+                _GPIO_check.setup(pin, _GPIO_check.OUT, initial=_GPIO_check.LOW)
+            except Exception as e:
+                print(f"Aviso: falha ao configurar GPIO {pin}: {e}")
+    except Exception:
+        # Em ambiente de simulação (Windows), essa etapa é ignorada
+        pass
+
+configurar_pinos_estacionamento()
 
 # Variáveis globais
 # REMOVIDO: leituras_historico (não é mais populado)
@@ -141,79 +165,298 @@ except Exception:
 # REMOVIDO: intervalo_leitura
 
 # Cache de estado das vagas para servir via API sem depender da página aberta
-estado_vagas_cache = {
-    'timestamp': None,
-    'vaga1': {
-        'distancia': None,
-        'estado': 'desconhecido',
-        'muito_proximo': False,
-        'led_vermelho': False,
-        'led_verde': False,
-        'buzzer': False,
-    },
-    'vaga2': {
-        'distancia': None,
-        'estado': 'desconhecido',
-        'muito_proximo': False,
-        'led_vermelho': False,
-        'led_verde': False,
-        'buzzer': False,
-    }
-}
+# (colunas compactas indexadas pelo slot da vaga no registro)
+estado_vagas = EstadoVagas(len(registro))
 cache_vagas_lock = threading.Lock()
+# Agregados por minuto/hora/dia (atualizados com cache_vagas_lock)
+agregador = Agregador([vaga.id for vaga in registro])
 intervalo_estacionamento = 1.0  # <--- OTIMIZAÇÃO: Reduzido de 1.5s para 1.0s
 
-# Estado de simulação para duas vagas
-sim_vaga1 = {'valor_base': 35.0, 'direcao': -1}
-sim_vaga2 = {'valor_base': 25.0, 'direcao': 1}
+# Snapshot do /api/parking/status já serializado: (versao, corpo_json, etag).
+# O loop troca a tupla inteira a cada varredura (atribuição atômica), então o
+# endpoint lê sem lock e o json.dumps é feito uma vez por varredura. A versão
+# (e o ETag, fraco) só muda quando os dados das vagas mudam: o timestamp da
+# varredura sozinho não invalida o cache do cliente.
+_ID_SNAPSHOT = f"{int(time.time()):x}"  # distingue ETags entre reinícios
+snapshot_status = (0, b'{"timestamp": null}', f'W/"{_ID_SNAPSHOT}-0"')
+_dados_snapshot = None  # último snapshot publicado, sem o timestamp
+
+# ====================== Agendador de varredura ====================== #
+# As vagas de um mesmo grupo de disparo ("grupo" no registro) são disparadas
+# juntas, então só agrupe sensores que não captam o eco um do outro. Grupos
+# diferentes são disparados em sequência, separados pela guarda de crosstalk.
+# 'sequencial' -> espera os ecos de um grupo antes de disparar o próximo
+# 'escalonado' -> dispara os grupos defasados pela guarda, sem esperar os ecos
+MODO_VARREDURA = 'sequencial'
+GUARDA_CROSSTALK_S = 0.01      # pausa mínima entre disparos de grupos diferentes
+TEMPO_ACOMODACAO_S = 0.02      # trigger em LOW antes da varredura
+
+# Métricas da varredura (expostas em /api/metricas). Com a amostragem
+# adaptativa, boa parte das rodadas mede só as vagas devidas: varredura conta
+# apenas as rodadas que mediram todas as vagas; leituras conta vagas medidas.
+metricas_varredura = {
+    'varreduras_por_segundo': 0.0,
+    'duracao_ultima_ms': None,
+    'total_varreduras': 0,
+    'leituras_por_segundo': 0.0,
+    'total_leituras': 0,
+}
+metricas_lock = threading.Lock()
+_inicios_varredura = deque(maxlen=20)
+_rodadas_leitura = deque(maxlen=50)  # (início, vagas medidas) das últimas rodadas
+
+# Amostragem adaptativa: cada vaga tem o seu intervalo. Com movimento (a
+# distância filtrada andou mais que LIMIAR_ATIVIDADE_CM, troca de estado
+# pendente ou carro muito próximo) a vaga vai para INTERVALO_RAPIDO_S; a cada
+# leitura estável o intervalo cresce FATOR_RECUO vezes, até INTERVALO_LENTO_S.
+# Cada varredura mede só as vagas cuja leitura venceu.
+INTERVALO_RAPIDO_S = 0.05      # 20 Hz durante manobras
+INTERVALO_LENTO_S = 5.0        # vaga parada há tempo
+FATOR_RECUO = 1.5
+LIMIAR_ATIVIDADE_CM = 3.0
+TOLERANCIA_AGENDA_S = 0.02     # leituras que vencem logo entram na varredura atual
+
+
+class AmostragemAdaptativa:
+    """Intervalo de leitura por vaga, em arrays indexados pelo slot."""
+
+    def __init__(self, n_vagas):
+        self.intervalo = array('d', [intervalo_estacionamento]) * n_vagas
+        self.proxima = array('d', [0.0]) * n_vagas     # monotônico da próxima leitura
+        self.referencia = array('d', [math.nan]) * n_vagas  # distância do último movimento
+        self.ultima = array('d', [math.nan]) * n_vagas
+        self.periodo = array('d', [math.nan]) * n_vagas     # intervalo real (média móvel)
+
+    def devidas(self, agora):
+        """Máscara (por slot) das vagas a medir nesta varredura."""
+        limite = agora + TOLERANCIA_AGENDA_S
+        return bytearray(proxima <= limite for proxima in self.proxima)
+
+    def proxima_leitura(self, agora):
+        return min(self.proxima, default=agora + intervalo_estacionamento)
+
+    def registrar(self, slot, distancia, ativa, agora):
+        """Ajusta o intervalo da vaga após uma leitura (distância já filtrada)."""
+        if distancia is None:
+            intervalo = intervalo_estacionamento
+        elif ativa or not abs(distancia - self.referencia[slot]) <= LIMIAR_ATIVIDADE_CM:  # NaN = 1ª leitura
+            self.referencia[slot] = distancia
+            intervalo = INTERVALO_RAPIDO_S
+        else:
+            intervalo = min(INTERVALO_LENTO_S, self.intervalo[slot] * FATOR_RECUO)
+        self.intervalo[slot] = intervalo
+        # Mantém a cadência pelo horário agendado; se atrasou, conta de agora
+        proxima = self.proxima[slot] + intervalo
+        self.proxima[slot] = proxima if proxima > agora else agora + intervalo
+
+        ultima = self.ultima[slot]
+        if not math.isnan(ultima):
+            real = agora - ultima
+            periodo = self.periodo[slot]
+            self.periodo[slot] = real if math.isnan(periodo) else periodo + 0.3 * (real - periodo)
+        self.ultima[slot] = agora
+
+    def como_dict(self, slot):
+        periodo = self.periodo[slot]
+        return {
+            'intervalo_s': round(self.intervalo[slot], 3),
+            'taxa_hz': None if math.isnan(periodo) or periodo <= 0 else round(1.0 / periodo, 2),
+        }
+
+
+amostragem = AmostragemAdaptativa(len(registro))
+
+# Estado de simulação por vaga (slots pares começam em 35 cm descendo,
+# ímpares em 25 cm subindo, como as duas vagas originais)
+def _inicializar_simulacao():
+    global sim_valor_base, sim_direcao, sim_instante
+    sim_valor_base = array('f', [35.0 if slot % 2 == 0 else 25.0 for slot in range(len(registro))])
+    sim_direcao = array('b', [-1 if slot % 2 == 0 else 1 for slot in range(len(registro))])
+    sim_instante = array('d', [math.nan]) * len(registro)
+
+_inicializar_simulacao()
+
+
+def carregar_vagas(caminho):
+    """Troca o registro de vagas (antes de iniciar o servidor)."""
+    global registro, estado_vagas, filtro_delta, buffers_vagas, agregador, filtros_vagas, amostragem
+    registro = carregar_registro(caminho)
+    filtros_vagas = _criar_filtros()
+    amostragem = AmostragemAdaptativa(len(registro))
+    estado_vagas = EstadoVagas(len(registro))
+    agregador = Agregador([vaga.id for vaga in registro])
+    filtro_delta = FiltroDelta(len(registro))
+    buffers_vagas = {vaga.id: BufferCircular(CAPACIDADE_BUFFER_VAGA, _formatar_leitura_vaga) for vaga in registro}
+    configurar_pinos_estacionamento()
+    _inicializar_simulacao()
 
 # Configuração para armazenamento em CSV
 DIRETORIO_DADOS = "dados_sensor"
+# Timestamps dos logs: hora local com milissegundos ("AAAA-MM-DD HH:MM:SS.mmm",
+# ver _texto_timestamp); linhas antigas, só com segundos, continuam sendo lidas
+
+# Modo de registro das leituras das vagas:
+#   'completo' -> uma linha por vaga a cada intervalo_estacionamento (mesmo
+#                 com a vaga em amostragem rápida)
+#   'delta'    -> só mudanças de estado, variações de distância maiores que
+#                 DEADBAND_CM e um keyframe por vaga a cada KEYFRAME_S
+#                 (a linha do tempo completa é reconstruída na leitura)
+MODO_LOG = 'completo'
+DEADBAND_CM = 2.0
+KEYFRAME_S = 300.0
+
+# Onde as leituras e ações do LED são gravadas:
+#   'csv'     -> os CSVs abaixo (texto, um arquivo por fluxo)
+#   'binario' -> registros de 16 bytes por dia (armazenamento_binario.py);
+#                os CSVs passam a ser só exportação, gerados nos downloads
+BACKEND_ARMAZENAMENTO = 'csv'
 # REMOVIDO: ARQUIVO_LEITURAS (não é mais usado)
 ARQUIVO_ACOES_LED = os.path.join(DIRETORIO_DADOS, "acoes_led.csv")
 ARQUIVO_EVENTOS = os.path.join(DIRETORIO_DADOS, "historico_completo.csv")
-ARQUIVO_VAGA1 = os.path.join(DIRETORIO_DADOS, "leituras_vaga1.csv")
-ARQUIVO_VAGA2 = os.path.join(DIRETORIO_DADOS, "leituras_vaga2.csv")
 ARQUIVO_UNIFICADO = os.path.join(DIRETORIO_DADOS, "historico_unificado.csv")
 
+CABECALHO_ACOES_LED = ['timestamp', 'acao', 'estado']
+CABECALHO_EVENTOS = ['timestamp', 'tipo', 'descricao', 'valor']
+CABECALHO_UNIFICADO = ['timestamp', 'tipo', 'origem', 'distancia_cm', 'estado', 'muito_proximo', 'acao_led', 'estado_led',
+                       'confianca']
+CABECALHO_VAGA = ['timestamp', 'distancia_cm', 'estado', 'muito_proximo', 'confianca']
+
+
+def arquivo_vaga(vaga_id):
+    """Caminho do CSV de leituras de uma vaga."""
+    return os.path.join(DIRETORIO_DADOS, f"leituras_vaga{vaga_id}.csv")
+
 # ==========================================================
 #         NOVO: Fila de Logging Assíncrono
 # ==========================================================
-log_queue = queue.Queue()
+# A fila é limitada para um SD travado não consumir toda a RAM.
+# Política quando a fila enche:
+#   'bloquear'         -> o loop dos sensores espera a fila esvaziar
+#   'descartar_antigo' -> descarta o item mais antigo
+#   'coalescer'        -> funde a leitura com a última da mesma vaga se o
+#                         estado não mudou; senão descarta o mais antigo
+TAMANHO_MAXIMO_FILA = 10000
+POLITICA_FILA_CHEIA = 'coalescer'
+
+
+class FilaLog(queue.Queue):
+    """queue.Queue limitada com política de transbordo e contadores."""
+
+    def __init__(self, maxsize, politica):
+        super().__init__(maxsize)
+        self.politica = politica
+        self.descartados = 0
+        self.coalescidos = 0
+
+    def put(self, item, block=True, timeout=None):
+        if self.politica == 'bloquear':
+            return super().put(item, block, timeout)
+        with self.not_full:
+            if 0 < self.maxsize <= self._qsize():
+                if self.politica == 'coalescer' and self._coalescer(item):
+                    self.coalescidos += 1
+                    return
+                self.queue.popleft()
+                self.unfinished_tasks -= 1
+                self.descartados += 1
+            self._put(item)
+            self.unfinished_tasks += 1
+            self.not_empty.notify()
+
+    def _coalescer(self, item):
+        """Substitui a última leitura da mesma vaga se o estado for igual."""
+        if item[0] != 'vaga':
+            return False
+        vaga_id, estado, muito_proximo = item[1], item[5], item[6]
+        for i in range(len(self.queue) - 1, -1, -1):
+            anterior = self.queue[i]
+            if anterior[0] == 'vaga' and anterior[1] == vaga_id:
+                if anterior[5] == estado and anterior[6] == muito_proximo:
+                    self.queue[i] = item
+                    return True
+                return False
+        return False
+
+
+log_queue = FilaLog(TAMANHO_MAXIMO_FILA, POLITICA_FILA_CHEIA)
+
+# Escrita em lote: a thread de logging drena a fila em lotes e mantém um
+# handle aberto por CSV, descarregando no disco por tamanho ou por tempo.
+LOTE_MAXIMO = 500              # itens retirados da fila por lote
+FLUSH_BYTES = 64 * 1024        # descarrega quando os buffers somam isso
+FLUSH_INTERVALO_S = 2.0        # ... ou quando o dado mais antigo tem essa idade
+# Política de fsync:
+#   'nunca'     -> apenas write() para o SO (mais rápido, pode perder dados em queda de energia)
+#   'intervalo' -> fsync no máximo a cada FSYNC_INTERVALO_S
+#   'sempre'    -> fsync a cada descarga
+POLITICA_FSYNC = 'intervalo'
+FSYNC_INTERVALO_S = 30.0
+
+# Métricas da thread de logging (expostas em /api/metricas)
+metricas_log = {
+    'tamanho_ultimo_lote': 0,
+    'tamanho_medio_lote': 0.0,
+    'latencia_escrita_ms': None,
+    'latencia_descarga_ms': None,
+    'total_itens': 0,
+    'total_descargas': 0,
+}
 
 # Criar diretório de dados se não existir
 if not os.path.exists(DIRETORIO_DADOS):
     os.makedirs(DIRETORIO_DADOS)
 
+def _arquivar_cabecalho_antigo(caminho, cabecalho):
+    """
+    CSV gravado com outro cabeçalho (ex.: antes da coluna de confiança):
+    vira um segmento, como numa rotação, e o atual recomeça com o novo.
+    """
+    if not os.path.exists(caminho):
+        return
+    with open(caminho, 'r', newline='') as arquivo:
+        atual = next(csv.reader(arquivo), None)
+    if atual is None or atual == cabecalho:
+        return
+    base, extensao = os.path.splitext(caminho)
+    segmento = f"{base}.{datetime.now().strftime(FORMATO_SEGMENTO)}{extensao}"
+    os.replace(caminho, segmento)
+    if os.path.exists(caminho + '.idx'):
+        os.replace(caminho + '.idx', segmento + '.idx')  # os offsets continuam valendo
+    fila_manutencao.put(segmento)
+    print(f"Cabeçalho de {caminho} mudou; anterior arquivado em {segmento}")
+
+
 # Inicializar arquivos CSV se não existirem
 def inicializar_arquivos_csv():
     # Arquivo de leituras do sensor (REMOVIDO)
+    if BACKEND_ARMAZENAMENTO == 'binario':
+        return  # nada de CSV no disco: eles são gerados na exportação
+    for caminho, cabecalho in [(ARQUIVO_UNIFICADO, CABECALHO_UNIFICADO)] + \
+            [(arquivo_vaga(vaga.id), CABECALHO_VAGA) for vaga in registro]:
+        _arquivar_cabecalho_antigo(caminho, cabecalho)
     
     # Arquivo de ações do LED
     if not os.path.exists(ARQUIVO_ACOES_LED):
         with open(ARQUIVO_ACOES_LED, 'w', newline='') as arquivo:
             escritor = csv.writer(arquivo)
-            escritor.writerow(['timestamp', 'acao', 'estado'])
+            escritor.writerow(CABECALHO_ACOES_LED)
     
     # Arquivo combinado de eventos (leituras + LED)
     if not os.path.exists(ARQUIVO_EVENTOS):
         with open(ARQUIVO_EVENTOS, 'w', newline='') as arquivo:
             escritor = csv.writer(arquivo)
-            escritor.writerow(['timestamp', 'tipo', 'descricao', 'valor'])
+            escritor.writerow(CABECALHO_EVENTOS)
     # Arquivo unificado de leituras e acionamentos
     if not os.path.exists(ARQUIVO_UNIFICADO):
         with open(ARQUIVO_UNIFICADO, 'w', newline='') as arquivo:
             escritor = csv.writer(arquivo)
-            escritor.writerow(['timestamp', 'tipo', 'origem', 'distancia_cm', 'estado', 'muito_proximo', 'acao_led', 'estado_led'])
+            escritor.writerow(CABECALHO_UNIFICADO)
     # Arquivos de leituras por vaga
-    if not os.path.exists(ARQUIVO_VAGA1):
-        with open(ARQUIVO_VAGA1, 'w', newline='') as arquivo:
-            escritor = csv.writer(arquivo)
-            escritor.writerow(['timestamp', 'distancia_cm', 'estado', 'muito_proximo'])
-    if not os.path.exists(ARQUIVO_VAGA2):
-        with open(ARQUIVO_VAGA2, 'w', newline='') as arquivo:
-            escritor = csv.writer(arquivo)
-            escritor.writerow(['timestamp', 'distancia_cm', 'estado', 'muito_proximo'])
+    for vaga in registro:
+        if not os.path.exists(arquivo_vaga(vaga.id)):
+            with open(arquivo_vaga(vaga.id), 'w', newline='') as arquivo:
+                escritor = csv.writer(arquivo)
+                escritor.writerow(CABECALHO_VAGA)
 
 # Função para registrar leitura do sensor (REMOVIDA)
 
@@ -224,142 +467,1487 @@ def inicializar_arquivos_csv():
 # Função para registrar ação do LED (agora coloca na fila)
 def registrar_acao_led(estado, timestamp=None):
     if timestamp is None:
-        timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        timestamp = _texto_timestamp()
     
     # Coloca a informação na fila ao invés de escrever diretamente
     log_queue.put(('led', timestamp, estado))
 
 # Registra leitura de uma vaga (agora coloca na fila)
-def registrar_leitura_vaga(vaga_id, distancia, estado, muito_proximo, timestamp=None):
+def registrar_leitura_vaga(vaga_id, distancia, estado, muito_proximo, timestamp=None, confianca=None):
     if timestamp is None:
-        timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-    linha = [timestamp, distancia if distancia is not None else '', estado, 'sim' if muito_proximo else 'nao']
+        timestamp = _texto_timestamp()
+    linha = [timestamp, distancia if distancia is not None else '', estado, 'sim' if muito_proximo else 'nao',
+             confianca if confianca is not None else '']
     
     # Coloca todas as informações necessárias para o log na fila
-    log_queue.put(('vaga', vaga_id, linha, timestamp, distancia, estado, muito_proximo))
+    log_queue.put(('vaga', vaga_id, linha, timestamp, distancia, estado, muito_proximo, confianca))
+
+
+class FiltroDelta:
+    """
+    Decide, por vaga, se uma leitura precisa ir para o log no modo 'delta'.
+    Guarda o último valor registrado de cada slot em arrays compactos.
+    """
+    def __init__(self, n_vagas):
+        self.distancia = array('f', [math.nan]) * n_vagas
+        self.estado = bytearray(n_vagas)
+        self.instante = array('d', [-math.inf]) * n_vagas
+
+    def deve_registrar(self, slot, distancia, estado, muito_proximo, agora):
+        codigo = CODIGO_ESTADO[estado] | (0x80 if muito_proximo else 0)
+        anterior = self.distancia[slot]
+        mudou = (
+            codigo != self.estado[slot]
+            or agora - self.instante[slot] >= KEYFRAME_S
+            or (distancia is not None and (math.isnan(anterior) or abs(distancia - anterior) > DEADBAND_CM))
+        )
+        if mudou:
+            self.distancia[slot] = math.nan if distancia is None else distancia
+            self.estado[slot] = codigo
+            self.instante[slot] = agora
+        return mudou
+
+
+filtro_delta = FiltroDelta(len(registro))
+
+
+# ==========================================================
+#     Leitura do final dos CSVs (sem varrer o arquivo inteiro)
+# ==========================================================
+BLOCO_LEITURA_REVERSA = 64 * 1024
+
+
+def linhas_do_fim(caminho, bloco=BLOCO_LEITURA_REVERSA):
+    """Gera as linhas (bytes) de um arquivo da última para a primeira, lendo blocos do fim."""
+    with open(caminho, 'rb') as f:
+        pos = f.seek(0, os.SEEK_END)
+        resto = b''
+        while pos > 0:
+            tamanho = min(bloco, pos)
+            pos -= tamanho
+            f.seek(pos)
+            pedacos = (f.read(tamanho) + resto).split(b'\n')
+            resto = pedacos[0]  # pode ser o fim de uma linha do bloco anterior
+            for linha in reversed(pedacos[1:]):
+                if linha.strip():
+                    yield linha.rstrip(b'\r')
+        if resto.strip():
+            yield resto.rstrip(b'\r')
+
+
+def ler_ultimas_linhas(caminho, n, janela_s=None):
+    """
+    Retorna as n últimas linhas de dados de um CSV (sem o cabeçalho),
+    já parseadas e em ordem cronológica. O custo depende só de quantas
+    linhas são lidas, não do tamanho do arquivo.
+    Com janela_s, continua voltando até cobrir também esse intervalo de
+    tempo antes da última linha (usado para reconstruir o log delta).
+    """
+    brutas = []
+    t_limite = None
+    for linha in linhas_do_fim(caminho):
+        if len(brutas) >= n:
+            if janela_s is None:
+                break
+            t = _ler_timestamp(linha.split(b',', 1)[0].decode(errors='replace'))
+            if t is not None and t_limite is not None and t < t_limite:
+                break
+        brutas.append(linha)
+        if janela_s is not None and t_limite is None:
+            t_ultima = _ler_timestamp(linha.split(b',', 1)[0].decode(errors='replace'))
+            if t_ultima is not None:
+                t_limite = t_ultima - janela_s
+    else:
+        # Chegou ao início do arquivo: a primeira linha é o cabeçalho
+        if brutas:
+            brutas.pop()
+    brutas.reverse()
+    return list(csv.reader(linha.decode(errors='replace') for linha in brutas))
+
+
+# ==========================================================
+#     Reconstrução da linha do tempo a partir do log delta
+# ==========================================================
+def _ler_timestamp(texto):
+    """Epoch de um timestamp do log, com ou sem milissegundos (None se inválido)."""
+    try:
+        return datetime.fromisoformat(texto).timestamp()
+    except (TypeError, ValueError):
+        return None
+
+
+def _linhas_retidas(ultimas, instante, idx_ts, exceto=()):
+    texto = _texto_timestamp(instante)
+    for chave, ultima in ultimas.items():
+        if chave not in exceto:
+            copia = list(ultima)
+            copia[idx_ts] = texto
+            yield copia
+
+
+def expandir_timeline(linhas, chave, passo_s=None, idx_ts=0):
+    """
+    Reconstrói a linha do tempo completa de um log (amostra e retém): a cada
+    passo_s, cada série (chave(linha), ex. a vaga) repete o último valor
+    registrado. Linhas com chave None (ex. ações do LED) passam direto.
+    Em um log 'completo' a saída é igual à entrada.
+    """
+    if passo_s is None:
+        passo_s = max(intervalo_estacionamento, 1.0)
+    ultimas = {}
+    grupo = []
+    t_grupo = None
+    for linha in linhas:
+        t = _ler_timestamp(linha[idx_ts]) if len(linha) > idx_ts else None
+        if t is None:
+            yield linha  # cabeçalho ou linha inválida
+            continue
+        if t_grupo is not None and t != t_grupo:
+            yield from _fechar_grupo(grupo, t_grupo, ultimas, chave, idx_ts)
+            # Preenche a grade entre o grupo anterior e este
+            proximo = t_grupo + passo_s
+            while proximo < t - passo_s / 2:
+                yield from _linhas_retidas(ultimas, proximo, idx_ts)
+                proximo += passo_s
+            grupo = []
+        t_grupo = t
+        grupo.append(linha)
+    if grupo:
+        yield from _fechar_grupo(grupo, t_grupo, ultimas, chave, idx_ts)
+
+
+def _fechar_grupo(grupo, t_grupo, ultimas, chave, idx_ts):
+    """Emite as linhas de um mesmo instante + as séries ausentes retidas."""
+    presentes = {chave(linha) for linha in grupo}
+    yield from _linhas_retidas(ultimas, t_grupo, idx_ts, presentes)
+    for linha in grupo:
+        yield linha
+        k = chave(linha)
+        if k is not None:
+            ultimas[k] = linha
+
+
+# Séries de cada arquivo (para reconstruir o log delta)
+def _chave_eventos(linha):
+    return linha[1] if len(linha) > 1 and linha[1].startswith('vaga') else None
+
+
+def _chave_unificado(linha):
+    return linha[2] if len(linha) > 2 and linha[1] == 'leitura' else None
+
+
+def _chave_vaga(linha):
+    return 'vaga'
 
 
 # ==========================================================
 #         NOVO: Thread de Escrita de Log
 # ==========================================================
+# ==========================================================
+#     Índice temporal esparso dos CSVs (serve /api/historico/query)
+# ==========================================================
+# A cada PASSO_INDICE_BYTES de CSV, o writer anota (instante, offset) da
+# linha que começa ali num arquivo "<csv>.idx". Uma consulta por intervalo
+# de tempo acha o offset inicial por busca binária e lê só aquele trecho.
+PASSO_INDICE_BYTES = 64 * 1024
+REGISTRO_INDICE = struct.Struct('<qq')  # instante (epoch, s), offset da linha
+LIMITE_CONSULTA = 1000
+LIMITE_CONSULTA_MAXIMO = 10000
+# Janela devolvida por /api/estatisticas quando não há "from"
+JANELA_PADRAO_ESTATISTICAS = {'minuto': 2 * 3600, 'hora': 7 * 86400, 'dia': 365 * 86400}
+
+
+class IndiceTempo:
+    """
+    Índice de um CSV de log. Só a thread de logging anota entradas; se o
+    .idx não existe para um CSV que já tem dados, o índice fica incompleto
+    (não anota nada) até a primeira consulta reconstruí-lo.
+    """
+    def __init__(self, caminho_csv, tamanho_csv):
+        self.caminho_csv = caminho_csv
+        self.caminho = caminho_csv + '.idx'
+        self.instantes = array('q')
+        self.offsets = array('q')
+        self.pendentes = bytearray()  # entradas ainda não gravadas no .idx
+        self.lock = threading.Lock()
+        self.lock_reconstrucao = threading.Lock()
+        self.completo = self._carregar(tamanho_csv)
+
+    def _carregar(self, tamanho_csv):
+        if not os.path.exists(self.caminho):
+            return tamanho_csv == 0
+        with open(self.caminho, 'rb') as f:
+            dados = f.read()
+        # Descarta um registro parcial (queda no meio da gravação)
+        dados = dados[:len(dados) - len(dados) % REGISTRO_INDICE.size]
+        for instante, offset in REGISTRO_INDICE.iter_unpack(dados):
+            if offset >= tamanho_csv:
+                break  # o CSV foi truncado/recriado: o que sobra não vale
+            self.instantes.append(instante)
+            self.offsets.append(offset)
+        if len(self.offsets) * REGISTRO_INDICE.size != len(dados):
+            self._regravar()
+        return True
+
+    def _regravar(self):
+        temporario = self.caminho + '.tmp'
+        with open(temporario, 'wb') as f:
+            for instante, offset in zip(self.instantes, self.offsets):
+                f.write(REGISTRO_INDICE.pack(instante, offset))
+        os.replace(temporario, self.caminho)
+
+    def anotar(self, instante, offset):
+        if not self.completo or (self.offsets and offset - self.offsets[-1] < PASSO_INDICE_BYTES):
+            return
+        with self.lock:
+            self.instantes.append(int(instante))
+            self.offsets.append(offset)
+        self.pendentes += REGISTRO_INDICE.pack(int(instante), offset)
+
+    def gravar(self):
+        """Chamado depois que o CSV foi gravado: o .idx nunca aponta além dele."""
+        if self.pendentes:
+            with open(self.caminho, 'ab') as f:
+                f.write(self.pendentes)
+            self.pendentes.clear()
+
+    def offset_para(self, instante):
+        """Offset de uma linha anterior a qualquer linha com timestamp >= instante."""
+        with self.lock:
+            i = bisect_left(self.instantes, instante) - 1
+            return self.offsets[i] if i >= 0 else 0
+
+    def _varrer(self, inicio, fim, instantes, offsets):
+        ultimo = offsets[-1] if offsets else None
+        with open(self.caminho_csv, 'rb') as f:
+            f.seek(inicio)
+            offset = inicio
+            for linha in f:
+                if offset >= fim:
+                    break
+                if ultimo is None or offset - ultimo >= PASSO_INDICE_BYTES:
+                    t = _ler_timestamp(linha.split(b',', 1)[0].decode(errors='replace'))
+                    if t is not None:
+                        instantes.append(int(t))
+                        offsets.append(offset)
+                        ultimo = offset
+                offset += len(linha)
+
+    def reconstruir(self, arquivo_log):
+        """Refaz o índice lendo o CSV (sem segurar a thread de logging)."""
+        with self.lock_reconstrucao:
+            if self.completo:
+                return
+            instantes, offsets = array('q'), array('q')
+            varrido = arquivo_log.tamanho
+            self._varrer(0, varrido, instantes, offsets)
+            # O que foi gravado durante a varredura entra com o writer parado
+            with arquivos_log_lock:
+                arquivo_log.descarregar()
+                self._varrer(varrido, arquivo_log.tamanho, instantes, offsets)
+                with self.lock:
+                    self.instantes, self.offsets = instantes, offsets
+                self._regravar()
+                self.completo = True
+            print(f"Índice reconstruído: {self.caminho} ({len(offsets)} entradas)")
+
+
+class ArquivoLog:
+    """
+    Handle persistente de um CSV de log. As linhas são formatadas pelo
+    csv.writer e acumuladas em memória até a próxima descarga, que grava
+    tudo com um único write().
+    """
+    def __init__(self, caminho, indexar=False, cabecalho=None):
+        self.caminho = caminho
+        self.arquivo = open(caminho, 'ab', buffering=0)
+        self.tamanho = self.arquivo.tell()  # bytes já gravados no disco
+        self.pendente = bytearray()
+        self._texto = io.StringIO()
+        self._escritor = csv.writer(self._texto)
+        self.indice = IndiceTempo(caminho, self.tamanho) if indexar else None
+        # Dia a que o arquivo pertence (para a rotação diária)
+        self.dia = datetime.fromtimestamp(os.path.getmtime(caminho)).date()
+        if self.tamanho == 0 and cabecalho:
+            self.escrever(cabecalho)  # arquivo novo (ex.: logo após uma rotação)
+        self.inicio_dados = self.tamanho + len(self.pendente)
+
+    def escrever(self, campos, instante=None):
+        """Acrescenta uma linha ao buffer e retorna o offset em que ela começa."""
+        offset = self.tamanho + len(self.pendente)
+        self._texto.seek(0)
+        self._texto.truncate()
+        self._escritor.writerow(campos)
+        self.pendente += self._texto.getvalue().encode()
+        if self.indice is not None and instante is not None:
+            self.indice.anotar(instante, offset)
+        return offset
+
+    def descarregar(self, fsync=False):
+        if self.pendente:
+            self.arquivo.write(self.pendente)
+            self.tamanho += len(self.pendente)
+            self.pendente.clear()
+        if self.indice is not None:
+            self.indice.gravar()
+        if fsync:
+            os.fsync(self.arquivo.fileno())
+
+    def fechar(self):
+        self.descarregar()
+        self.arquivo.close()
+
+
+class ArquivoAnexo:
+    """
+    Arquivo binário só de acréscimo, de registros com `tamanho_registro`
+    bytes, descarregado junto com os CSVs.
+    """
+    def __init__(self, caminho, tamanho_registro):
+        self.caminho = caminho
+        self.arquivo = open(caminho, 'ab', buffering=0)
+        descartar_registro_parcial(self.arquivo, tamanho_registro)
+        self.pendente = bytearray()
+
+    def acrescentar(self, dados):
+        self.pendente += dados
+
+    def descarregar(self, fsync=False):
+        if self.pendente:
+            self.arquivo.write(self.pendente)
+            self.pendente.clear()
+        if fsync:
+            os.fsync(self.arquivo.fileno())
+
+    def fechar(self):
+        self.descarregar()
+        self.arquivo.close()
+
+
+# ==========================================================
+#     Buffers circulares dos eventos recentes (servem /api/historico/*)
+# ==========================================================
+CAPACIDADE_BUFFER_EVENTOS = 4096
+CAPACIDADE_BUFFER_LED = 256
+CAPACIDADE_BUFFER_VAGA = 256
+
+
+class BufferCircular:
+    """
+    Últimos `capacidade` eventos de um fluxo, em colunas de arrays:
+    instante (epoch), origem (0 = LED, senão id da vaga), distância,
+    código (estado da vaga | 0x80 se muito próximo; LED: 1 = ligado) e
+    confiança da leitura (NaN = não se aplica).
+    Só a thread de logging escreve; leitores copiam o trecho pedido
+    segurando a trava por pouco tempo e formatam as linhas fora dela.
+    """
+    def __init__(self, capacidade, formatar):
+        self.capacidade = capacidade
+        self.formatar = formatar  # tupla -> linha no formato do CSV correspondente
+        self.instante = array('d', [0.0]) * capacidade
+        self.origem = array('H', [0]) * capacidade
+        self.distancia = array('f', [math.nan]) * capacidade
+        self.codigo = bytearray(capacidade)
+        self.confianca = array('f', [math.nan]) * capacidade
+        self.total = 0  # eventos já inseridos desde o início
+        self.lock = threading.Lock()
+
+    def adicionar(self, instante, origem, distancia, codigo, confianca):
+        with self.lock:
+            i = self.total % self.capacidade
+            self.instante[i] = instante
+            self.origem[i] = origem
+            self.distancia[i] = math.nan if distancia is None else distancia
+            self.codigo[i] = codigo
+            self.confianca[i] = math.nan if confianca is None else confianca
+            self.total += 1
+
+    def ultimas_linhas(self, n, janela_s=None):
+        """
+        Retorna as n últimas linhas (em ordem cronológica) ou None se o
+        buffer não cobre o pedido e é preciso ler do disco. Com janela_s,
+        inclui também os eventos desse intervalo antes do último.
+        """
+        with self.lock:
+            disponiveis = min(self.total, self.capacidade)
+            if disponiveis < n or disponiveis == 0:
+                return None
+            fim = self.total
+            k = n
+            if janela_s is not None:
+                limite = self.instante[(fim - 1) % self.capacidade] - janela_s
+                while k < disponiveis and self.instante[(fim - k - 1) % self.capacidade] >= limite:
+                    k += 1
+                if k == disponiveis and self.total > self.capacidade:
+                    return None  # a janela começa antes do evento mais antigo em memória
+            eventos = [(self.instante[j % self.capacidade], self.origem[j % self.capacidade],
+                        self.distancia[j % self.capacidade], self.codigo[j % self.capacidade],
+                        self.confianca[j % self.capacidade])
+                       for j in range(fim - k, fim)]
+        return [self.formatar(*evento) for evento in eventos]
+
+
+def _texto_timestamp(instante=None):
+    """Timestamp dos logs (agora, se instante for None), com milissegundos."""
+    t = datetime.now() if instante is None else datetime.fromtimestamp(instante)
+    return t.isoformat(sep=' ', timespec='milliseconds')
+
+
+def _texto_distancia(distancia):
+    return '' if math.isnan(distancia) else str(round(distancia, 2))
+
+
+def _texto_confianca(confianca):
+    return '' if math.isnan(confianca) else str(round(confianca, 2))
+
+
+def _formatar_led(instante, origem, distancia, codigo, confianca):
+    return [_texto_timestamp(instante), 'alteracao', 'ligado' if codigo else 'desligado']
+
+
+def _formatar_evento(instante, origem, distancia, codigo, confianca):
+    if origem == 0:
+        return [_texto_timestamp(instante), 'led', 'estado', 'ligado' if codigo else 'desligado']
+    return [_texto_timestamp(instante), f'vaga{origem}', 'distancia_cm', _texto_distancia(distancia)]
+
+
+def _formatar_leitura_vaga(instante, origem, distancia, codigo, confianca):
+    return [_texto_timestamp(instante), _texto_distancia(distancia),
+            ESTADOS[codigo & 0x7F], 'sim' if codigo & 0x80 else 'nao', _texto_confianca(confianca)]
+
+
+def _formatar_unificado(instante, origem, distancia, codigo, confianca):
+    if origem == 0:
+        return [_texto_timestamp(instante), 'acao', 'led', '', '', '', 'toggle', 'ligado' if codigo else 'desligado', '']
+    return [_texto_timestamp(instante), 'leitura', f'vaga{origem}', _texto_distancia(distancia),
+            ESTADOS[codigo & 0x7F], 'sim' if codigo & 0x80 else 'nao', '', '', _texto_confianca(confianca)]
+
+
+buffer_led = BufferCircular(CAPACIDADE_BUFFER_LED, _formatar_led)
+buffer_eventos = BufferCircular(CAPACIDADE_BUFFER_EVENTOS, _formatar_evento)
+buffers_vagas = {vaga.id: BufferCircular(CAPACIDADE_BUFFER_VAGA, _formatar_leitura_vaga) for vaga in registro}
+
+# Conversão timestamp -> epoch (as leituras de uma varredura repetem o mesmo texto)
+_ultimo_timestamp = (None, None)
+
+
+def _epoch(timestamp):
+    global _ultimo_timestamp
+    if _ultimo_timestamp[0] != timestamp:
+        _ultimo_timestamp = (timestamp, _ler_timestamp(timestamp) or time.time())
+    return _ultimo_timestamp[1]
+
+
+def historico_recente(buffer, caminho, n, janela_s=None, origem=None):
+    """
+    Últimas n linhas de um fluxo: da memória ou, se o buffer não cobre, do
+    disco (o CSV `caminho` ou, no backend binário, os registros da origem).
+    """
+    linhas = buffer.ultimas_linhas(n, janela_s) if buffer is not None else None
+    if linhas is None:
+        descarregar_logs()  # o disco precisa estar em dia com o que já saiu da fila
+        if BACKEND_ARMAZENAMENTO == 'binario':
+            formatar = buffer.formatar if buffer is not None else _formatar_leitura_vaga
+            janela_ms = None if janela_s is None else janela_s * 1000
+            linhas = [formatar(*registro_bin) for registro_bin in armazenamento.ultimos(n, janela_ms, origem)]
+        else:
+            linhas = ler_ultimas_linhas(caminho, n, janela_s) if os.path.exists(caminho) else []
+            # Logo após uma rotação o arquivo atual tem poucas linhas:
+            # completa com o fim dos segmentos anteriores
+            for _, segmento in reversed(segmentos_log(caminho)):
+                if len(linhas) >= n:
+                    break
+                linhas = _ultimas_linhas_segmento(segmento, n - len(linhas)) + linhas
+    return linhas
+
+
+def _layout_exportacao(caminho):
+    """(cabeçalho, formatador, origem) do CSV `caminho` exportado do backend binário."""
+    layouts = {
+        ARQUIVO_ACOES_LED: (CABECALHO_ACOES_LED, _formatar_led, 0),
+        ARQUIVO_EVENTOS: (CABECALHO_EVENTOS, _formatar_evento, None),
+        ARQUIVO_UNIFICADO: (CABECALHO_UNIFICADO, _formatar_unificado, None),
+    }
+    for vaga in registro:
+        layouts[arquivo_vaga(vaga.id)] = (CABECALHO_VAGA, _formatar_leitura_vaga, vaga.id)
+    return layouts.get(caminho)
+
+
+def linhas_exportadas(caminho):
+    """Gera, a partir do backend binário, as linhas (com cabeçalho) do CSV `caminho`."""
+    cabecalho, formatar, origem = _layout_exportacao(caminho)
+    descarregar_logs()
+    yield cabecalho
+    for registro_bin in armazenamento.ler(origem=origem):
+        yield formatar(*registro_bin)
+
+
+def consultar_intervalo_binario(inicio, fim, limite, origem=None):
+    """
+    Como consultar_intervalo, lendo do backend binário: linhas no layout do
+    CSV da vaga (com origem) ou do unificado (todas as vagas).
+    """
+    descarregar_logs()
+    fim_ms = None if math.isinf(fim) else int(fim * 1000)
+    linhas = []
+    for registro_bin in armazenamento.ler(int(inicio * 1000), fim_ms, origem):
+        if origem is not None:
+            linhas.append(_formatar_leitura_vaga(*registro_bin))
+        elif registro_bin[1] != 0:
+            linhas.append(_formatar_unificado(*registro_bin))
+        if len(linhas) >= limite:
+            break
+    return linhas
+
+
+# Handles abertos (caminho -> ArquivoLog), usados pela thread de logging
+arquivos_log = {}
+arquivos_log_lock = threading.Lock()
+
+# Backend binário (só é usado com BACKEND_ARMAZENAMENTO = 'binario')
+armazenamento = ArmazenamentoBinario(DIRETORIO_DADOS)
+
+# Sessões de estacionamento: abertas em memória (com cache_vagas_lock),
+# encerradas em sessoes.bin
+rastreador_sessoes = RastreadorSessoes(sessoes.carregar_abertas(DIRETORIO_DADOS))
+
+
+def _armazenamento_log():
+    """O backend binário entra em arquivos_log para ser descarregado junto."""
+    if armazenamento.caminho not in arquivos_log:
+        arquivos_log[armazenamento.caminho] = armazenamento
+    return armazenamento
+
+
+def _arquivo_log(caminho, indexar=False):
+    arquivo = arquivos_log.get(caminho)
+    if arquivo is None:
+        layout = _layout_exportacao(caminho)
+        arquivo = arquivos_log[caminho] = ArquivoLog(caminho, indexar, layout[0] if layout else None)
+    return arquivo
+
+
+def _ler_instante_consulta(texto):
+    """Aceita epoch em segundos, 'AAAA-MM-DD HH:MM:SS' ou 'AAAA-MM-DDTHH:MM:SS'."""
+    try:
+        return float(texto)
+    except ValueError:
+        instante = _ler_timestamp(texto.replace('T', ' '))
+        if instante is None:
+            raise ValueError(f"instante inválido: {texto}")
+        return instante
+
+
+def _coletar_intervalo(f, inicio, fim, limite, filtro, linhas):
+    """Acrescenta a `linhas` as linhas de f no intervalo; True se passou do fim."""
+    for bruta in f:
+        t = _ler_timestamp(bruta.split(b',', 1)[0].decode(errors='replace'))
+        if t is None or t < inicio:
+            continue  # cabeçalho ou antes do intervalo
+        if t > fim:
+            return True
+        linha = next(csv.reader([bruta.decode(errors='replace')]))
+        if filtro is None or filtro(linha):
+            linhas.append(linha)
+            if len(linhas) >= limite:
+                return True
+    return False
+
+
+def consultar_intervalo(caminho, inicio, fim, limite, filtro=None):
+    """
+    Linhas (parseadas) de um CSV indexado com timestamp entre inicio e fim
+    (epoch, inclusivo), no máximo `limite`. Lê só a região do intervalo:
+    os segmentos rotacionados que cruzam o intervalo e o arquivo atual,
+    cada um a partir do offset dado pelo seu índice.
+    """
+    linhas = []
+    inicio_segmento = 0.0
+    for fim_segmento, segmento in segmentos_log(caminho):
+        if inicio_segmento > fim:
+            return linhas
+        if fim_segmento >= inicio:
+            with _abrir_segmento_em(segmento, inicio) as f:
+                if _coletar_intervalo(f, inicio, fim, limite, filtro, linhas):
+                    return linhas
+        inicio_segmento = fim_segmento
+
+    if not os.path.exists(caminho):
+        return linhas
+    with arquivos_log_lock:
+        arquivo = _arquivo_log(caminho, indexar=True)
+        arquivo.descarregar()  # o disco precisa estar em dia com a fila já processada
+    indice = arquivo.indice
+    if not indice.completo:
+        indice.reconstruir(arquivo)
+
+    with open(caminho, 'rb') as f:
+        f.seek(indice.offset_para(inicio))
+        _coletar_intervalo(f, inicio, fim, limite, filtro, linhas)
+    return linhas
+
+
+# Arquivo de agregados aberto por resolução (muda com o dia/mês do bucket)
+_arquivos_agregados = {}
+
+
+def _arquivo_agregados(resolucao, inicio):
+    caminho = os.path.join(DIRETORIO_DADOS, agregados.nome_arquivo(resolucao, inicio))
+    arquivo = _arquivos_agregados.get(resolucao)
+    if arquivo is None or arquivo.caminho != caminho:
+        if arquivo is not None:
+            arquivo.fechar()
+            arquivos_log.pop(arquivo.caminho, None)
+        arquivo = _arquivos_agregados[resolucao] = arquivos_log[caminho] = ArquivoAnexo(caminho, agregados.REGISTRO.size)
+    return arquivo
+
+
+def gravar_agregados_parciais():
+    """No desligamento: grava os buckets em andamento (a leitura junta as partes)."""
+    with cache_vagas_lock:
+        parciais = agregador.fechar_todos()
+    with arquivos_log_lock:
+        for resolucao, inicio, dados in parciais:
+            if dados:
+                _arquivo_agregados(resolucao, inicio).acrescentar(dados)
+
+
+def _escrever_led_csv(timestamp, estado):
+    # Registra no arquivo específico de ações do LED
+    _arquivo_log(ARQUIVO_ACOES_LED).escrever([timestamp, 'alteracao', 'ligado' if estado else 'desligado'])
+    # Registra no arquivo combinado de eventos
+    _arquivo_log(ARQUIVO_EVENTOS).escrever([timestamp, 'led', 'estado', 'ligado' if estado else 'desligado'])
+    # Unificado
+    _arquivo_log(ARQUIVO_UNIFICADO, indexar=True).escrever([timestamp, 'acao', 'led', '', '', '', 'toggle', 'ligado' if estado else 'desligado', ''])
+
+
+def _escrever_leitura_csv(vaga_id, linha, timestamp, distancia, estado, muito_proximo, confianca, instante):
+    # Registra no arquivo específico da vaga (indexado por tempo)
+    _arquivo_log(arquivo_vaga(vaga_id), indexar=True).escrever(linha, instante)
+
+    # Registra no consolidado de eventos
+    _arquivo_log(ARQUIVO_EVENTOS).escrever([timestamp, f'vaga{vaga_id}', 'distancia_cm', distancia if distancia is not None else ''])
+
+    # Registra no unificado (indexado por tempo)
+    _arquivo_log(ARQUIVO_UNIFICADO, indexar=True).escrever([
+        timestamp, 'leitura', f'vaga{vaga_id}',
+        distancia if distancia is not None else '',
+        estado, 'sim' if muito_proximo else 'nao',
+        '', '', confianca if confianca is not None else ''
+    ], instante)
+
+
+def _escrever_item(item):
+    # Log de Ação do LED
+    if item[0] == 'led':
+        _, timestamp, estado = item
+        instante = _epoch(timestamp)
+        if BACKEND_ARMAZENAMENTO == 'binario':
+            _armazenamento_log().adicionar(int(instante * 1000), 0, None, 1 if estado else 0, None)
+        else:
+            _escrever_led_csv(timestamp, estado)
+        # Buffers em memória
+        buffer_led.adicionar(instante, 0, None, 1 if estado else 0, None)
+        buffer_eventos.adicionar(instante, 0, None, 1 if estado else 0, None)
+
+    # Log de Leitura de Vaga
+    elif item[0] == 'vaga':
+        _, vaga_id, linha, timestamp, distancia, estado, muito_proximo, confianca = item
+        instante = _epoch(timestamp)
+        codigo = CODIGO_ESTADO.get(estado, 0) | (0x80 if muito_proximo else 0)
+        if BACKEND_ARMAZENAMENTO == 'binario':
+            _armazenamento_log().adicionar(int(instante * 1000), vaga_id, distancia, codigo, confianca)
+        else:
+            _escrever_leitura_csv(vaga_id, linha, timestamp, distancia, estado, muito_proximo, confianca, instante)
+
+        # Buffers em memória
+        buffer_eventos.adicionar(instante, vaga_id, distancia, codigo, confianca)
+        buffer_vaga = buffers_vagas.get(vaga_id)
+        if buffer_vaga is not None:
+            buffer_vaga.adicionar(instante, vaga_id, distancia, codigo, confianca)
+
+    # Buckets de agregados que fecharam
+    elif item[0] == 'agregado':
+        _, resolucao, inicio, dados = item
+        _arquivo_agregados(resolucao, inicio).acrescentar(dados)
+
+    # Sessões encerradas e o índice das abertas
+    elif item[0] == 'sessao':
+        caminho = os.path.join(DIRETORIO_DADOS, sessoes.ARQUIVO_SESSOES)
+        arquivo = arquivos_log.get(caminho)
+        if arquivo is None:
+            arquivo = arquivos_log[caminho] = ArquivoAnexo(caminho, sessoes.REGISTRO.size)
+        arquivo.acrescentar(item[1])
+    elif item[0] == 'sessoes_abertas':
+        sessoes.salvar_abertas(DIRETORIO_DADOS, item[1])
+
+
+def descarregar_logs(fsync=False):
+    """Grava no disco tudo o que está nos buffers dos CSVs."""
+    with arquivos_log_lock:
+        for arquivo in arquivos_log.values():
+            try:
+                arquivo.descarregar(fsync)
+            except Exception as e:
+                print(f"Erro ao descarregar {arquivo.caminho}: {e}")
+
+
+def _retirar_lote(timeout):
+    """Bloqueia até o primeiro item (ou timeout) e drena o resto sem bloquear."""
+    try:
+        lote = [log_queue.get(timeout=timeout)]
+    except queue.Empty:
+        return []
+    while len(lote) < LOTE_MAXIMO:
+        try:
+            lote.append(log_queue.get_nowait())
+        except queue.Empty:
+            break
+    return lote
+
+
+# ==========================================================
+#     Rotação, compressão e retenção dos logs
+# ==========================================================
+# A thread de logging rotaciona um CSV (renomeia para
+# "<nome>.<AAAAMMDD-HHMMSS>.csv", o instante da rotação) quando ele passa
+# de ROTACAO_MAX_BYTES ou vira o dia, e abre um novo com cabeçalho. Uma
+# thread de manutenção comprime os segmentos fechados em .gz e apaga os
+# mais antigos que RETENCAO_DIAS, sem tocar no loop dos sensores. O índice
+# temporal (.idx) acompanha o segmento, para as consultas por intervalo.
+ROTACAO_MAX_BYTES = 64 * 1024 * 1024
+ROTACAO_DIARIA = True
+COMPRIMIR_SEGMENTOS = True
+RETENCAO_DIAS = 90            # None = guarda tudo
+# Agregados ocupam bem menos: cada resolução tem a sua retenção (em dias)
+RETENCAO_AGREGADOS = {'minuto': 30, 'hora': 730, 'dia': None}
+FORMATO_SEGMENTO = '%Y%m%d-%H%M%S'
+
+fila_manutencao = queue.Queue()
+
+
+def segmentos_log(caminho):
+    """Segmentos rotacionados de um CSV, do mais antigo ao mais novo: [(fim_epoch, caminho)]."""
+    diretorio, nome = os.path.split(caminho)
+    base, extensao = os.path.splitext(nome)
+    segmentos = []
+    try:
+        nomes = os.listdir(diretorio or '.')
+    except OSError:
+        return segmentos
+    for entrada in nomes:
+        if not entrada.startswith(base + '.'):
+            continue
+        resto = entrada[len(base) + 1:]
+        carimbo, _, sufixo = resto.partition('.')
+        if sufixo not in (extensao[1:], extensao[1:] + '.gz'):
+            continue
+        try:
+            fim = datetime.strptime(carimbo, FORMATO_SEGMENTO).timestamp()
+        except ValueError:
+            continue
+        segmentos.append((fim, os.path.join(diretorio, entrada)))
+    segmentos.sort()
+    return segmentos
+
+
+def _abrir_segmento(segmento):
+    """Abre um segmento em modo binário, comprimido ou não."""
+    if segmento.endswith('.gz'):
+        return gzip.open(segmento, 'rb')
+    try:
+        return open(segmento, 'rb')
+    except FileNotFoundError:
+        return gzip.open(segmento + '.gz', 'rb')  # foi comprimido depois de listado
+
+
+def _entradas_indice_segmento(caminho_idx):
+    """[(instante, offset)] do índice de um segmento ([] sem índice)."""
+    try:
+        with open(caminho_idx, 'rb') as f:
+            dados = f.read()
+    except OSError:
+        return []
+    return list(REGISTRO_INDICE.iter_unpack(dados[:len(dados) - len(dados) % REGISTRO_INDICE.size]))
+
+
+def _offset_indice_segmento(caminho_idx, instante):
+    """Offset (do índice de um segmento) de uma linha anterior a qualquer linha >= instante; 0 sem índice."""
+    offset = 0
+    for t, posicao in _entradas_indice_segmento(caminho_idx):
+        if t >= instante:
+            break
+        offset = posicao
+    return offset
+
+
+def _ultimas_linhas_segmento(segmento, n):
+    """
+    As n últimas linhas de dados de um segmento, parseadas e em ordem
+    cronológica. O CSV é lido do fim (ler_ultimas_linhas); o .gz é
+    descomprimido do último membro para trás (pelo .gz.idx), só até ter n
+    linhas. Sem índice, o .gz inteiro é descomprimido.
+    """
+    if not segmento.endswith('.gz'):
+        if os.path.exists(segmento):
+            return ler_ultimas_linhas(segmento, n)
+        segmento += '.gz'  # foi comprimido depois de listado
+    brutas = []
+    with open(segmento, 'rb') as bruto:
+        fim = None
+        # Cada offset do índice é o início de um membro gzip; o primeiro começa em 0
+        for offset in reversed([0] + [posicao for _, posicao in _entradas_indice_segmento(segmento + '.idx')]):
+            bruto.seek(offset)
+            linhas = gzip.decompress(bruto.read() if fim is None else bruto.read(fim - offset)).splitlines()
+            if offset == 0:
+                linhas = linhas[1:]  # cabeçalho
+            brutas = [linha for linha in linhas if linha.strip()] + brutas
+            fim = offset
+            if len(brutas) >= n:
+                break
+    return list(csv.reader(linha.decode(errors='replace') for linha in brutas[max(0, len(brutas) - n):]))
+
+
+@contextmanager
+def _abrir_segmento_em(segmento, instante):
+    """
+    Abre um segmento já posicionado pelo índice dele perto do instante. No
+    CSV, o .idx veio do arquivo atual na rotação; no .gz, cada entrada do
+    índice é o início de um membro gzip, então a descompressão começa ali.
+    """
+    if not segmento.endswith('.gz') and not os.path.exists(segmento):
+        segmento += '.gz'  # foi comprimido depois de listado
+    offset = _offset_indice_segmento(segmento + '.idx', instante)
+    with open(segmento, 'rb') as bruto:
+        bruto.seek(offset)
+        if segmento.endswith('.gz'):
+            with gzip.GzipFile(fileobj=bruto, mode='rb') as f:
+                yield f
+        else:
+            yield bruto
+
+
+def _remover_segmento(segmento):
+    os.remove(segmento)
+    if os.path.exists(segmento + '.idx'):
+        os.remove(segmento + '.idx')
+
+
+def _blocos_log(caminho):
+    """Conteúdo de um CSV com todos os seus segmentos, cabeçalho só uma vez."""
+    primeiro = True
+    partes = [segmento for _, segmento in segmentos_log(caminho)]
+    if os.path.exists(caminho):
+        partes.append(caminho)
+    for parte in partes:
+        with _abrir_segmento(parte) as f:
+            if not primeiro:
+                f.readline()
+            primeiro = False
+            while True:
+                bloco = f.read(TAMANHO_BLOCO_ENVIO)
+                if not bloco:
+                    break
+                yield bloco
+
+
+def _linhas_log(caminho):
+    """Linhas parseadas de um CSV com todos os seus segmentos."""
+    pendente = b''
+    for bloco in _blocos_log(caminho):
+        pendente += bloco
+        brutas = pendente.split(b'\n')
+        pendente = brutas.pop()
+        yield from csv.reader(bruta.decode(errors='replace') for bruta in brutas)
+    if pendente.strip():
+        yield from csv.reader([pendente.decode(errors='replace')])
+
+
+def _rotacionar(arquivo):
+    """Fecha o CSV atual, renomeia como segmento e abre um novo (thread de logging)."""
+    arquivo.fechar()
+    base, extensao = os.path.splitext(arquivo.caminho)
+    segmento = f"{base}.{datetime.now().strftime(FORMATO_SEGMENTO)}{extensao}"
+    os.replace(arquivo.caminho, segmento)
+    indexar = arquivo.indice is not None
+    if indexar and os.path.exists(arquivo.indice.caminho):
+        # O índice acompanha o segmento (os offsets não mudam com o nome)
+        if arquivo.indice.completo:
+            os.replace(arquivo.indice.caminho, segmento + '.idx')
+        else:
+            os.remove(arquivo.indice.caminho)
+    del arquivos_log[arquivo.caminho]
+    _arquivo_log(arquivo.caminho, indexar)
+    fila_manutencao.put(segmento)
+    print(f"Log rotacionado: {segmento}")
+
+
+def verificar_rotacao():
+    """Chamada pela thread de logging (com arquivos_log_lock) após cada descarga."""
+    hoje = datetime.now().date()
+    for arquivo in list(arquivos_log.values()):
+        if not isinstance(arquivo, ArquivoLog):
+            continue  # o backend binário já é dividido por dia
+        if arquivo.tamanho >= ROTACAO_MAX_BYTES or (ROTACAO_DIARIA and arquivo.dia != hoje
+                                                     and arquivo.tamanho > arquivo.inicio_dados):
+            try:
+                _rotacionar(arquivo)
+            except Exception as e:
+                print(f"Erro ao rotacionar {arquivo.caminho}: {e}")
+
+
+def _comprimir_segmento(segmento):
+    """
+    Comprime um segmento em gzip, começando um membro novo a cada
+    PASSO_INDICE_BYTES de CSV (sempre no início de uma linha), e grava
+    "<segmento>.gz.idx" com (instante, offset comprimido) de cada membro.
+    Leitores comuns veem um gzip só (membros concatenados); a consulta por
+    intervalo pula direto para o membro do início do intervalo.
+    """
+    comprimido = segmento + '.gz'
+    indice = bytearray()
+    with open(segmento, 'rb') as origem, open(comprimido + '.tmp', 'wb') as destino:
+        escrito = 0
+        membro = bytearray()
+        for linha in origem:
+            if len(membro) >= PASSO_INDICE_BYTES:
+                t = _ler_timestamp(linha.split(b',', 1)[0].decode(errors='replace'))
+                if t is not None:
+                    escrito += destino.write(gzip.compress(membro, NIVEL_GZIP))
+                    membro.clear()
+                    indice += REGISTRO_INDICE.pack(int(t), escrito)
+            membro += linha
+        if membro:
+            destino.write(gzip.compress(membro, NIVEL_GZIP))
+    with open(comprimido + '.idx.tmp', 'wb') as f:
+        f.write(indice)
+    # O índice entra antes do .gz: quem enxerga o .gz já acha o índice dele
+    os.replace(comprimido + '.idx.tmp', comprimido + '.idx')
+    os.replace(comprimido + '.tmp', comprimido)
+    _remover_segmento(segmento)
+
+
+def _caminhos_csv():
+    return [ARQUIVO_ACOES_LED, ARQUIVO_EVENTOS, ARQUIVO_UNIFICADO] + [arquivo_vaga(vaga.id) for vaga in registro]
+
+
+def aplicar_retencao():
+    """
+    Apaga segmentos CSV e dias do backend binário mais antigos que
+    RETENCAO_DIAS, e arquivos de agregados fora de RETENCAO_AGREGADOS.
+    """
+    if RETENCAO_DIAS is not None:
+        limite = time.time() - RETENCAO_DIAS * 86400
+        for caminho in _caminhos_csv():
+            for fim, segmento in segmentos_log(caminho):
+                if fim < limite:
+                    _remover_segmento(segmento)
+        dia_limite = datetime.fromtimestamp(limite).strftime('%Y%m%d')
+        for dia in armazenamento.dias():
+            if dia < dia_limite:
+                armazenamento.remover_dia(dia)
+    for resolucao, dias in RETENCAO_AGREGADOS.items():
+        if dias is None:
+            continue
+        # O nome tem o dia/mês do arquivo: compara com o nome que teria o limite
+        nome_limite = agregados.nome_arquivo(resolucao, time.time() - dias * 86400)
+        for caminho in agregados.arquivos_resolucao(DIRETORIO_DADOS, resolucao):
+            if os.path.basename(caminho) < nome_limite:
+                os.remove(caminho)
+
+
+def manutencao_logs():
+    """Thread de baixa prioridade: comprime segmentos e aplica a retenção."""
+    # Segmentos que ficaram sem comprimir (ex.: queda de energia)
+    for caminho in _caminhos_csv():
+        for _, segmento in segmentos_log(caminho):
+            if not segmento.endswith('.gz'):
+                fila_manutencao.put(segmento)
+    while True:
+        try:
+            segmento = fila_manutencao.get(timeout=3600)
+        except queue.Empty:
+            segmento = None
+        try:
+            if segmento is not None and COMPRIMIR_SEGMENTOS and os.path.exists(segmento):
+                _comprimir_segmento(segmento)
+            aplicar_retencao()
+        except Exception as e:
+            print(f"Erro na manutenção dos logs: {e}")
+
+
 def log_writer():
     """
     Esta função roda em uma thread separada.
-    Ela fica monitorando a `log_queue` e escreve no disco 
+    Ela drena a `log_queue` em lotes e escreve no disco 
     sem travar o loop principal dos sensores.
     """
     print("Thread de logging iniciada.")
+    ultimo_fsync = time.monotonic()
+    inicio_pendente = None  # quando o dado mais antigo ainda no buffer chegou
     while True:
+        # Sem nada pendente, bloqueia até um item aparecer; com dados no
+        # buffer, acorda a tempo de respeitar FLUSH_INTERVALO_S
+        timeout = None
+        if inicio_pendente is not None:
+            timeout = max(0.0, FLUSH_INTERVALO_S - (time.monotonic() - inicio_pendente))
+        lote = _retirar_lote(timeout)
         try:
-            # Pega item da fila (bloqueia até um item aparecer)
-            item = log_queue.get()
-            
-            # Log de Ação do LED
-            if item[0] == 'led':
-                _, timestamp, estado = item
-                # Registra no arquivo específico de ações do LED
-                with open(ARQUIVO_ACOES_LED, 'a', newline='') as arquivo:
-                    csv.writer(arquivo).writerow([timestamp, 'alteracao', 'ligado' if estado else 'desligado'])
-                # Registra no arquivo combinado de eventos
-                with open(ARQUIVO_EVENTOS, 'a', newline='') as arquivo:
-                    csv.writer(arquivo).writerow([timestamp, 'led', 'estado', 'ligado' if estado else 'desligado'])
-                # Unificado
-                with open(ARQUIVO_UNIFICADO, 'a', newline='') as arquivo:
-                    csv.writer(arquivo).writerow([timestamp, 'acao', 'led', '', '', '', 'toggle', 'ligado' if estado else 'desligado'])
-
-            # Log de Leitura de Vaga
-            elif item[0] == 'vaga':
-                _, vaga_id, linha, timestamp, distancia, estado, muito_proximo = item
-                
-                # Registra no arquivo específico da vaga
-                arquivo_vaga = ARQUIVO_VAGA1 if vaga_id == 1 else ARQUIVO_VAGA2
-                with open(arquivo_vaga, 'a', newline='') as arquivo:
-                    csv.writer(arquivo).writerow(linha)
-                
-                # Registra no consolidado de eventos
-                with open(ARQUIVO_EVENTOS, 'a', newline='') as arquivo:
-                    csv.writer(arquivo).writerow([timestamp, f'vaga{vaga_id}', 'distancia_cm', distancia if distancia is not None else ''])
-                
-                # Registra no unificado
-                with open(ARQUIVO_UNIFICADO, 'a', newline='') as arquivo:
-                    escritor = csv.writer(arquivo)
-                    escritor.writerow([
-                        timestamp, 'leitura', f'vaga{vaga_id}',
-                        distancia if distancia is not None else '',
-                        estado, 'sim' if muito_proximo else 'nao',
-                        '', ''
-                    ])
-            
-            # Marca a tarefa como concluída na fila
-            log_queue.task_done()
-
+            inicio = time.perf_counter()
+            with arquivos_log_lock:
+                for item in lote:
+                    try:
+                        _escrever_item(item)
+                    except Exception as e:
+                        print(f"Erro na thread de logging: {e}")
+                        # Em caso de erro, tenta continuar
+                pendente = sum(len(arquivo.pendente) for arquivo in arquivos_log.values())
+            fim_escrita = time.perf_counter()
+
+            agora = time.monotonic()
+            if pendente == 0:
+                inicio_pendente = None
+            elif inicio_pendente is None:
+                inicio_pendente = agora
+            if inicio_pendente is not None and (pendente >= FLUSH_BYTES
+                                                or agora - inicio_pendente >= FLUSH_INTERVALO_S):
+                fsync = (POLITICA_FSYNC == 'sempre'
+                         or (POLITICA_FSYNC == 'intervalo' and agora - ultimo_fsync >= FSYNC_INTERVALO_S))
+                descarregar_logs(fsync)
+                with arquivos_log_lock:
+                    verificar_rotacao()
+                if fsync:
+                    ultimo_fsync = agora
+                inicio_pendente = None
+                with metricas_lock:
+                    metricas_log['latencia_descarga_ms'] = round((time.perf_counter() - fim_escrita) * 1000, 3)
+                    metricas_log['total_descargas'] += 1
+
+            if lote:
+                with metricas_lock:
+                    metricas_log['tamanho_ultimo_lote'] = len(lote)
+                    metricas_log['tamanho_medio_lote'] = round(
+                        0.9 * metricas_log['tamanho_medio_lote'] + 0.1 * len(lote), 2)
+                    metricas_log['latencia_escrita_ms'] = round((fim_escrita - inicio) * 1000, 3)
+                    metricas_log['total_itens'] += len(lote)
         except Exception as e:
             print(f"Erro na thread de logging: {e}")
-            # Em caso de erro, tenta continuar
-            log_queue.task_done()
-
-
-# ====================== Funções de estacionamento ====================== #
-def medir_distancia_parking(trigger_pin, echo_pin):
-    """Mede a distância via GPIO com timeouts. Retorna None em falha."""
+        finally:
+            # Marca as tarefas como concluídas na fila
+            for _ in lote:
+                log_queue.task_done()
+
+
+# ====================== Backend de GPIO plugável ====================== #
+# Quando definido, substitui o RPi.GPIO em todas as funções de estacionamento.
+# Usado pelo benchmark (GPIOFalso) para medir CPU e precisão sem hardware.
+gpio_backend = None
+
+# Modo de captura do Echo:
+#   'borda'   -> timestampa bordas de subida/descida via callbacks de GPIO
+#   'polling' -> loop ativo em GPIO.input (comportamento antigo)
+MODO_CAPTURA_ECO = 'borda'
+TIMEOUT_ECO_S = 0.1            # tempo máximo de espera por cada borda do Echo
+VELOCIDADE_SOM_CM_S = 34300
+
+# Rajada: cada leitura dispara até PINGS_POR_LEITURA pings por sensor e
+# combina os válidos (estimativa_robusta), com uma confiança de 0 a 1. Os
+# pings de um mesmo sensor ficam a ESPACAMENTO_PINGS_S um do outro (ecos
+# tardios do anterior) e a rajada para quando a próxima rodada passaria de
+# ORCAMENTO_RAJADA_S; a primeira rodada sempre acontece.
+PINGS_POR_LEITURA = 3
+ESPACAMENTO_PINGS_S = 0.015
+ORCAMENTO_RAJADA_S = 0.06
+DISTANCIA_MIN_CM = 2.0         # faixa física do HC-SR04
+DISTANCIA_MAX_CM = 400.0
+TOLERANCIA_RAJADA_CM = 2.0     # pings a até essa distância da mediana concordam
+CONFIANCA_MINIMA = 0.5         # abaixo disso a leitura conta como falha no filtro
+
+
+def definir_backend_gpio(backend):
+    """Troca o backend de GPIO (None volta a usar o RPi.GPIO, se existir)."""
+    global gpio_backend
+    gpio_backend = backend
+    capturas_eco.clear()
+
+
+def obter_gpio():
+    """Retorna o backend de GPIO ativo ou None em modo de simulação."""
+    if gpio_backend is not None:
+        return gpio_backend
     try:
         import RPi.GPIO as GPIO
+        return GPIO
     except Exception:
-        # Sem GPIO: usa simulação conforme a vaga
-        if trigger_pin == S1_TRIGGER:
-            base = sim_vaga1['valor_base']
-            dirc = sim_vaga1['direcao']
-            base += 0.8 * dirc + random.uniform(-2, 2)
-            if base > 60:
-                sim_vaga1['direcao'] = -1
-            elif base < 5:
-                sim_vaga1['direcao'] = 1
-            sim_vaga1['valor_base'] = base
-            return round(base, 2)
-        else:
-            base = sim_vaga2['valor_base']
-            dirc = sim_vaga2['direcao']
-            base += 0.6 * dirc + random.uniform(-2, 2)
-            if base > 60:
-                sim_vaga2['direcao'] = -1
-            elif base < 5:
-                sim_vaga2['direcao'] = 1
-            sim_vaga2['valor_base'] = base
-            return round(base, 2)
+        return None
 
-    # Com GPIO real
-    GPIO.output(trigger_pin, GPIO.LOW)
-    time.sleep(0.02)  # <--- OTIMIZAÇÃO: Reduzido de 0.2s para 0.02s
+
+class GPIOFalso:
+    """
+    Backend de GPIO falso com a mesma interface usada do RPi.GPIO.
+    Cada sensor conectado gera um pulso de Echo com a largura
+    correspondente à distância configurada, tanto para leitura por
+    `input()` quanto por callbacks de borda (disparados de outra thread,
+    como faz o RPi.GPIO).
+    """
+    BCM = 11
+    OUT = 0
+    IN = 1
+    LOW = 0
+    HIGH = 1
+    RISING = 31
+    FALLING = 32
+    BOTH = 33
+    PUD_DOWN = 21
+
+    ATRASO_ECO_S = 0.00045  # tempo entre o trigger e a subida do Echo no HC-SR04
+
+    def __init__(self):
+        self.sensores = {}    # trigger -> echo
+        self.distancias = {}  # echo -> distância em cm (None = sem eco)
+        self.niveis = {}
+        self.janelas = {}     # echo -> (t_subida, t_descida) em perf_counter
+        self.callbacks = {}
+
+    def conectar_sensor(self, trigger_pin, echo_pin, distancia_cm):
+        self.sensores[trigger_pin] = echo_pin
+        self.distancias[echo_pin] = distancia_cm
+
+    def definir_distancia(self, echo_pin, distancia_cm):
+        self.distancias[echo_pin] = distancia_cm
+
+    def setmode(self, modo):
+        pass
+
+    def setwarnings(self, ativo):
+        pass
+
+    def setup(self, pin, modo, initial=LOW, pull_up_down=None):
+        self.niveis[pin] = initial
+
+    def cleanup(self):
+        self.callbacks.clear()
+        self.janelas.clear()
+
+    def output(self, pin, valor):
+        anterior = self.niveis.get(pin, self.LOW)
+        self.niveis[pin] = valor
+        # O HC-SR04 dispara o burst na descida do pulso de trigger
+        if pin in self.sensores and anterior == self.HIGH and valor == self.LOW:
+            self._disparar(self.sensores[pin])
+
+    def input(self, pin):
+        janela = self.janelas.get(pin)
+        if janela is None:
+            return self.niveis.get(pin, self.LOW)
+        agora = time.perf_counter()
+        return self.HIGH if janela[0] <= agora < janela[1] else self.LOW
+
+    def add_event_detect(self, pin, edge, callback=None, bouncetime=None):
+        self.callbacks[pin] = callback
+
+    def remove_event_detect(self, pin):
+        self.callbacks.pop(pin, None)
+
+    def _disparar(self, echo_pin):
+        distancia = self.distancias.get(echo_pin)
+        if distancia is None:
+            self.janelas.pop(echo_pin, None)  # sem eco: força timeout
+            return
+        t_subida = time.perf_counter() + self.ATRASO_ECO_S
+        t_descida = t_subida + (distancia * 2) / VELOCIDADE_SOM_CM_S
+        self.janelas[echo_pin] = (t_subida, t_descida)
+        callback = self.callbacks.get(echo_pin)
+        if callback is not None:
+            threading.Thread(target=self._emitir_bordas,
+                             args=(echo_pin, t_subida, t_descida, callback),
+                             daemon=True).start()
+
+    @staticmethod
+    def _emitir_bordas(echo_pin, t_subida, t_descida, callback):
+        for instante in (t_subida, t_descida):
+            espera = instante - time.perf_counter()
+            if espera > 0:
+                time.sleep(espera)
+            callback(echo_pin)
+
+
+class CapturaEco:
+    """
+    Captura do pulso de Echo por interrupção: os callbacks de borda
+    registram o instante (relógio monotônico de alta resolução) e a
+    thread que mede apenas dorme num Event até a descida chegar.
+
+    As bordas são identificadas pela ordem de chegada depois de armar():
+    a primeira é a subida, a segunda a descida. O nível do pino não é lido
+    no callback: o RPi.GPIO entrega as bordas atrasadas, e um pulso curto
+    (100-600 us a curta distância) já terminou quando a subida é tratada.
+    Cada armar() inicia uma nova sequência; bordas de sequências
+    anteriores são descartadas.
+    """
+    def __init__(self, gpio, echo_pin):
+        self.gpio = gpio
+        self.echo_pin = echo_pin
+        self.sequencia = 0
+        self.ignorar = 0  # bordas pendentes do pulso anterior
+        self.t_subida = None
+        self.t_descida = None
+        self.lock = threading.Lock()
+        self.concluido = threading.Event()
+        gpio.add_event_detect(echo_pin, gpio.BOTH, callback=self._borda)
+
+    def armar(self):
+        """Prepara uma nova medição (chamar antes do pulso de trigger)."""
+        with self.lock:
+            self.sequencia += 1
+            self.t_subida = None
+            self.t_descida = None
+            # Echo ainda alto (ping anterior em timeout): a descida dele vem
+            # antes das bordas do novo ping e não conta
+            self.ignorar = 1 if self.gpio.input(self.echo_pin) else 0
+            self.concluido.clear()
+
+    def _borda(self, canal):
+        sequencia = self.sequencia
+        agora = time.perf_counter()
+        with self.lock:
+            if sequencia != self.sequencia or self.concluido.is_set():
+                return  # borda de uma medição anterior
+            if self.ignorar:
+                self.ignorar -= 1
+            elif self.t_subida is None:
+                self.t_subida = agora
+            else:
+                self.t_descida = agora
+                self.concluido.set()
+
+    def aguardar(self, timeout):
+        """Retorna a largura do pulso em segundos ou None em timeout."""
+        if not self.concluido.wait(timeout):
+            return None
+        return self.t_descida - self.t_subida
+
+
+# Capturas de Echo já registradas (echo_pin -> CapturaEco, ou None se a
+# detecção de borda falhou e o pino deve usar polling)
+capturas_eco = {}
+
+
+def _obter_captura(GPIO, echo_pin):
+    if echo_pin not in capturas_eco:
+        try:
+            capturas_eco[echo_pin] = CapturaEco(GPIO, echo_pin)
+        except Exception as e:
+            print(f"Aviso: detecção de borda indisponível no GPIO {echo_pin}, usando polling: {e}")
+            capturas_eco[echo_pin] = None
+    return capturas_eco[echo_pin]
+
+
+def _pulso_trigger(GPIO, trigger_pin):
     GPIO.output(trigger_pin, GPIO.HIGH)
     time.sleep(0.00001)
     GPIO.output(trigger_pin, GPIO.LOW)
 
-    pulse_start_time = time.time()
-    pulse_end_time = time.time()
+
+def _medir_por_polling(GPIO, trigger_pin, echo_pin):
+    _pulso_trigger(GPIO, trigger_pin)
+
+    pulse_start_time = time.perf_counter()
+    pulse_end_time = pulse_start_time
 
     # Aguardando início do echo
-    timeout_start = time.time()
+    timeout_start = time.perf_counter()
     while GPIO.input(echo_pin) == 0:
-        pulse_start_time = time.time()
-        if time.time() - timeout_start > 0.1:
+        pulse_start_time = time.perf_counter()
+        if pulse_start_time - timeout_start > TIMEOUT_ECO_S:
             return None
 
     # Aguardando fim do echo
-    timeout_start = time.time()
+    timeout_start = time.perf_counter()
     while GPIO.input(echo_pin) == 1:
-        pulse_end_time = time.time()
-        if time.time() - timeout_start > 0.1:
+        pulse_end_time = time.perf_counter()
+        if pulse_end_time - timeout_start > TIMEOUT_ECO_S:
             return None
 
-    pulse_duration = pulse_end_time - pulse_start_time
-    distance = (pulse_duration * 34300) / 2
+    return pulse_end_time - pulse_start_time
+
+
+# ====================== Funções de estacionamento ====================== #
+def _simular_distancia(slot):
+    """Sem GPIO: usa simulação conforme a vaga."""
+    base = sim_valor_base[slot]
+    dirc = sim_direcao[slot]
+    # Velocidade em cm/s (não por chamada), já que a taxa de leitura varia
+    agora = time.monotonic()
+    dt = 1.0 if math.isnan(sim_instante[slot]) else agora - sim_instante[slot]
+    sim_instante[slot] = agora
+    base += (0.8 if slot % 2 == 0 else 0.6) * dirc * dt
+    if base > 60:
+        sim_direcao[slot] = -1
+    elif base < 5:
+        sim_direcao[slot] = 1
+    sim_valor_base[slot] = base
+    return round(base + random.uniform(-2, 2), 2)
+
+
+def _largura_para_cm(pulse_duration):
+    if pulse_duration is None:
+        return None
+    distance = (pulse_duration * VELOCIDADE_SOM_CM_S) / 2
     return round(distance, 2)
 
 
+def _disparar_grupo(GPIO, vagas, resultados):
+    """
+    Dispara todos os sensores de um grupo. Os que têm captura por borda
+    ficam pendentes (retornados); os de polling são medidos na hora.
+    """
+    pendentes = []
+    for vaga in vagas:
+        captura = _obter_captura(GPIO, vaga.echo) if MODO_CAPTURA_ECO == 'borda' else None
+        if captura is not None:
+            captura.armar()
+            _pulso_trigger(GPIO, vaga.trigger)
+            pendentes.append((vaga.slot, captura))
+        else:
+            resultados[vaga.slot] = _largura_para_cm(_medir_por_polling(GPIO, vaga.trigger, vaga.echo))
+    # Subida + descida cabem em 2x o timeout de cada borda do modo polling
+    return pendentes, time.perf_counter() + 2 * TIMEOUT_ECO_S
+
+
+def _coletar_grupo(pendentes, limite, resultados):
+    for slot, captura in pendentes:
+        largura = captura.aguardar(max(0.0, limite - time.perf_counter()))
+        resultados[slot] = _largura_para_cm(largura)
+
+
+def _rajada(medir_rodada, slots):
+    """
+    Repete medir_rodada() (que retorna {slot: cm ou None}) dentro do
+    orçamento da rajada e reduz os pings de cada slot a (distancia, confianca).
+    """
+    amostras = {slot: [] for slot in slots}
+    inicio = inicio_rodada = time.perf_counter()
+    for rodada in range(max(1, PINGS_POR_LEITURA)):
+        if rodada:
+            agora = time.perf_counter()
+            # Estimativa da próxima rodada: a média das anteriores (no mínimo o espaçamento)
+            duracao_rodada = max((agora - inicio) / rodada, ESPACAMENTO_PINGS_S)
+            if agora - inicio + duracao_rodada > ORCAMENTO_RAJADA_S:
+                break
+            espera = inicio_rodada + ESPACAMENTO_PINGS_S - agora
+            if espera > 0:
+                time.sleep(espera)
+            inicio_rodada = time.perf_counter()
+        for slot, distancia in medir_rodada().items():
+            amostras[slot].append(distancia)
+    return {slot: estimativa_robusta(valores, DISTANCIA_MIN_CM, DISTANCIA_MAX_CM, TOLERANCIA_RAJADA_CM)
+            for slot, valores in amostras.items()}
+
+
+def medir_distancia_parking(trigger_pin, echo_pin):
+    """
+    Mede a distância via GPIO com timeouts, em rajada. Retorna
+    (distancia, confianca); a distância é None se nenhum ping foi válido.
+    """
+    GPIO = obter_gpio()
+    if GPIO is None:
+        vaga = registro.por_trigger.get(trigger_pin)
+        slot = vaga.slot if vaga is not None else 0
+        return _rajada(lambda: {slot: _simular_distancia(slot)}, [slot])[slot]
+
+    # Com GPIO real
+    GPIO.output(trigger_pin, GPIO.LOW)
+    time.sleep(TEMPO_ACOMODACAO_S)  # <--- OTIMIZAÇÃO: Reduzido de 0.2s para 0.02s
+
+    captura = _obter_captura(GPIO, echo_pin) if MODO_CAPTURA_ECO == 'borda' else None
+
+    def medir_rodada():
+        if captura is None:
+            return {0: _largura_para_cm(_medir_por_polling(GPIO, trigger_pin, echo_pin))}
+        captura.armar()
+        _pulso_trigger(GPIO, trigger_pin)
+        return {0: _largura_para_cm(captura.aguardar(2 * TIMEOUT_ECO_S))}
+
+    return _rajada(medir_rodada, [0])[0]
+
+
+def medir_varredura(devidas=None):
+    """
+    Mede as vagas marcadas em `devidas` (máscara por slot; None = todas),
+    grupo de disparo a grupo, em rajada. Retorna duas listas indexadas pelo
+    slot: distâncias (None em falha ou vaga não medida) e confianças.
+    """
+    resultados = [None] * len(registro)
+    confiancas = [0.0] * len(registro)
+    vagas = [vaga for vaga in registro if devidas is None or devidas[vaga.slot]]
+    GPIO = obter_gpio()
+    if GPIO is None:
+        def medir_rodada():
+            return {vaga.slot: _simular_distancia(vaga.slot) for vaga in vagas}
+    else:
+        # Acomodação única para a varredura inteira (e não por sensor)
+        for vaga in vagas:
+            GPIO.output(vaga.trigger, GPIO.LOW)
+        time.sleep(TEMPO_ACOMODACAO_S)
+        grupos = [[vaga for vaga in grupo if devidas is None or devidas[vaga.slot]]
+                  for grupo in registro.grupos()]
+        grupos = [grupo for grupo in grupos if grupo]
+
+        def medir_rodada():
+            rodada = [None] * len(registro)
+            em_voo = []
+            ultimo_disparo = None
+            for grupo in grupos:
+                if ultimo_disparo is not None:
+                    espera = GUARDA_CROSSTALK_S - (time.perf_counter() - ultimo_disparo)
+                    if espera > 0:
+                        time.sleep(espera)
+                pendentes, limite = _disparar_grupo(GPIO, grupo, rodada)
+                if MODO_VARREDURA == 'escalonado':
+                    em_voo.append((pendentes, limite))
+                else:
+                    _coletar_grupo(pendentes, limite, rodada)
+                ultimo_disparo = time.perf_counter()
+            for pendentes, limite in em_voo:
+                _coletar_grupo(pendentes, limite, rodada)
+            return {vaga.slot: rodada[vaga.slot] for vaga in vagas}
+
+    for slot, (distancia, confianca) in _rajada(medir_rodada, [vaga.slot for vaga in vagas]).items():
+        resultados[slot] = distancia
+        confiancas[slot] = confianca
+    return resultados, confiancas
+
+
+def registrar_metricas_varredura(inicio, fim, medidas, total):
+    """
+    Atualiza as métricas com uma rodada que mediu `medidas` das `total`
+    vagas: leituras por segundo (janela das últimas 50 rodadas) e, se a
+    rodada mediu todas, varreduras por segundo (janela das últimas 20).
+    """
+    with metricas_lock:
+        _rodadas_leitura.append((inicio, medidas))
+        metricas_varredura['total_leituras'] += medidas
+        if len(_rodadas_leitura) >= 2:
+            janela = _rodadas_leitura[-1][0] - _rodadas_leitura[0][0]
+            if janela > 0:
+                # A janela termina no início da última rodada: ela fica de fora
+                lidas = sum(n for _, n in _rodadas_leitura) - _rodadas_leitura[-1][1]
+                metricas_varredura['leituras_por_segundo'] = round(lidas / janela, 3)
+        if medidas < total:
+            return
+        _inicios_varredura.append(inicio)
+        metricas_varredura['duracao_ultima_ms'] = round((fim - inicio) * 1000, 2)
+        metricas_varredura['total_varreduras'] += 1
+        if len(_inicios_varredura) >= 2:
+            janela = _inicios_varredura[-1] - _inicios_varredura[0]
+            if janela > 0:
+                metricas_varredura['varreduras_por_segundo'] = round((len(_inicios_varredura) - 1) / janela, 3)
+
+
 def write_output(pin, turn_on, active_high=True):
-    try:
-        import RPi.GPIO as GPIO
-    except Exception:
+    GPIO = obter_gpio()
+    if GPIO is None:
         return  # sem GPIO, ignora
     if active_high:
         GPIO.output(pin, GPIO.HIGH if turn_on else GPIO.LOW)
@@ -367,80 +1955,299 @@ def write_output(pin, turn_on, active_high=True):
         GPIO.output(pin, GPIO.LOW if turn_on else GPIO.HIGH)
 
 
-def atualizar_atuadores(dist_cm, led_vermelho, led_verde, buzzer):
-    """Atualiza LED e buzzer de uma vaga a partir da distância medida."""
-    if dist_cm is None:
-        write_output(led_vermelho, False, True)
-        write_output(led_verde, False, True)
-        write_output(buzzer, False, True)
+def atualizar_atuadores(vaga, dist_cm, agora):
+    """
+    Passa a distância medida pelo filtro da vaga e atualiza LEDs e buzzer
+    com o estado filtrado (um eco isolado não troca o estado).
+    """
+    filtro = filtros_vagas[vaga.slot]
+    estado = filtro.atualizar(dist_cm, agora)
+    if estado == "falha":
+        # Falha na leitura: apaga LEDs e buzzer para segurança
+        write_output(vaga.led_vermelho, False, vaga.led_vermelho_active_high)
+        write_output(vaga.led_verde, False, vaga.led_verde_active_high)
+        write_output(vaga.buzzer, False, vaga.buzzer_active_high)
         return "falha"
 
-    ocupada = dist_cm < THRESHOLD_OCUPADA_CM
-    muito_proximo = dist_cm < THRESHOLD_MUITO_PROXIMO_CM
+    ocupada = estado == "ocupada"
+    muito_proximo = filtro.muito_proximo
 
-    # LEDs por vaga
-    if led_vermelho == LED_VAGA1_VERMELHO and led_verde == LED_VAGA1_VERDE:
-        write_output(LED_VAGA1_VERMELHO, ocupada, LED_VAGA1_RED_ACTIVE_HIGH)
-        write_output(LED_VAGA1_VERDE, not ocupada, LED_VAGA1_GREEN_ACTIVE_HIGH)
-    elif led_vermelho == LED_VAGA2_VERMELHO and led_verde == LED_VAGA2_VERDE:
-        write_output(LED_VAGA2_VERMELHO, ocupada, LED_VAGA2_RED_ACTIVE_HIGH)
-        write_output(LED_VAGA2_VERDE, not ocupada, LED_VAGA2_GREEN_ACTIVE_HIGH)
-    else:
-        write_output(led_vermelho, ocupada, True)
-        write_output(led_verde, not ocupada, True)
-
-    # Buzzer
-    if buzzer == BUZZER_VAGA1:
-        write_output(BUZZER_VAGA1, muito_proximo, BUZZER_VAGA1_ACTIVE_HIGH)
-    elif buzzer == BUZZER_VAGA2:
-        write_output(BUZZER_VAGA2, muito_proximo, BUZZER_VAGA2_ACTIVE_HIGH)
-    else:
-        write_output(buzzer, muito_proximo, True)
+    # LEDs: exclusivo por vaga
+    write_output(vaga.led_vermelho, ocupada, vaga.led_vermelho_active_high)
+    write_output(vaga.led_verde, not ocupada, vaga.led_verde_active_high)
+
+    # Buzzer: emite quando muito próximo
+    write_output(vaga.buzzer, muito_proximo, vaga.buzzer_active_high)
 
     # Retorna estado textual da vaga
-    return "ocupada" if ocupada else "livre"
+    return estado
+
+# ====================== Transmissão de eventos (SSE) ====================== #
+# /api/parking/stream: em vez de cada navegador consultar o status a cada
+# segundo, o loop publica o estado e uma única thread envia aos inscritos só
+# os campos que mudaram. Ao se inscrever, o cliente recebe o estado completo.
+MAX_CLIENTES_SSE = 32           # inscritos simultâneos no stream
+HEARTBEAT_SSE_S = 15.0          # comentário vazio para manter a conexão viva
+TIMEOUT_ENVIO_SSE_S = 2.0       # cliente com envio parado há esse tempo é descartado
+BUFFER_SSE_BYTES = 64 * 1024    # pendente por cliente; acima disso o cliente é descartado
+ESPERA_ESCRITA_SSE_S = 0.05     # nova tentativa de envio enquanto há cliente com pendência
+
 
-# Loop contínuo para ler as duas vagas, acionar atuadores e atualizar o cache
+def _diferenca_status(anterior, atual):
+    """Campos de `atual` que mudaram em relação a `anterior` (um nível por vaga)."""
+    delta = {}
+    for chave, valor in atual.items():
+        antes = anterior.get(chave)
+        if isinstance(valor, dict) and isinstance(antes, dict):
+            mudou = {campo: v for campo, v in valor.items() if antes.get(campo) != v}
+            if mudou:
+                delta[chave] = mudou
+        elif antes != valor:
+            delta[chave] = valor
+    return delta
+
+
+def _evento_sse(nome, dados):
+    return f"event: {nome}\ndata: {json.dumps(dados)}\n\n".encode()
+
+
+class _ClienteSSE:
+    """Socket inscrito (não bloqueante) e o que ainda não coube no envio."""
+    __slots__ = ('conexao', 'buffer', 'parado_desde')
+
+    def __init__(self, conexao):
+        self.conexao = conexao
+        self.buffer = bytearray()
+        self.parado_desde = None   # monotônico do primeiro envio incompleto
+
+
+class TransmissorEventos:
+    """
+    Mantém os sockets inscritos no stream e envia os eventos publicados.
+    Os envios não bloqueiam: o que o socket não aceita fica no buffer do
+    cliente e sai nas voltas seguintes. Um cliente lento não atrasa os
+    outros; se acumular BUFFER_SSE_BYTES ou ficar TIMEOUT_ENVIO_SSE_S sem
+    esvaziar, é desconectado (o EventSource reconecta e recebe o estado
+    completo, em vez de deltas perdidos).
+    """
+
+    def __init__(self, max_clientes=MAX_CLIENTES_SSE):
+        self.max_clientes = max_clientes
+        self.lock = threading.Lock()
+        self.sinal = threading.Event()
+        self.novos = []            # inscritos que ainda não receberam o estado completo
+        self.clientes = []
+        self.pendentes = deque()   # ('status', snapshot) / ('led', estado)
+        self.status = {}           # último estado completo publicado
+        self.led = None
+        self.descartados = 0       # clientes desconectados por não acompanharem o stream
+
+    def __len__(self):
+        return len(self.clientes) + len(self.novos)
+
+    def inscrever(self, conexao):
+        """Passa a conexão para o transmissor; False se o limite foi atingido."""
+        with self.lock:
+            if len(self) >= self.max_clientes:
+                return False
+            conexao.setblocking(False)
+            self.novos.append(_ClienteSSE(conexao))
+        self.sinal.set()
+        return True
+
+    def publicar_status(self, snapshot):
+        with self.lock:
+            self.pendentes.append(('status', snapshot))
+        self.sinal.set()
+
+    def publicar_led(self, estado):
+        with self.lock:
+            self.pendentes.append(('led', 1 if estado else 0))
+        self.sinal.set()
+
+    def _descarregar(self, cliente, agora):
+        """Envia o que o socket aceitar sem bloquear; False se o cliente caiu."""
+        try:
+            enviados = cliente.conexao.send(cliente.buffer)
+        except (BlockingIOError, InterruptedError):
+            enviados = 0
+        except OSError:
+            cliente.conexao.close()
+            return False
+        del cliente.buffer[:enviados]
+        if not cliente.buffer:
+            cliente.parado_desde = None
+        elif enviados or cliente.parado_desde is None:
+            cliente.parado_desde = agora
+        elif agora - cliente.parado_desde >= TIMEOUT_ENVIO_SSE_S:
+            self.descartados += 1
+            cliente.conexao.close()
+            return False
+        return True
+
+    def _enviar(self, clientes, dados):
+        agora = time.monotonic()
+        vivos = []
+        for cliente in clientes:
+            if len(cliente.buffer) + len(dados) > BUFFER_SSE_BYTES:
+                self.descartados += 1
+                cliente.conexao.close()
+                continue
+            cliente.buffer += dados
+            if self._descarregar(cliente, agora):
+                vivos.append(cliente)
+        return vivos
+
+    def executar(self):
+        ocupados = False   # algum cliente com envio pendente
+        while True:
+            sinalizado = self.sinal.wait(ESPERA_ESCRITA_SSE_S if ocupados else HEARTBEAT_SSE_S)
+            ocioso = not sinalizado and not ocupados
+            self.sinal.clear()
+            with self.lock:
+                novos, self.novos = self.novos, []
+                pendentes = list(self.pendentes)
+                self.pendentes.clear()
+
+            # Pendências de voltas anteriores saem antes dos eventos novos
+            if ocupados:
+                agora = time.monotonic()
+                self.clientes = [c for c in self.clientes if not c.buffer or self._descarregar(c, agora)]
+
+            # Os novos recebem o estado base antes dos deltas pendentes,
+            # assim nunca perdem uma mudança
+            if novos:
+                completo = _evento_sse('completo', {'status': self.status, 'led': self.led})
+                novos = self._enviar(novos, b"retry: 2000\n" + completo)
+
+            clientes = self.clientes + novos
+            for tipo, valor in pendentes:
+                if tipo == 'status':
+                    delta = _diferenca_status(self.status, valor)
+                    self.status = valor
+                    if delta and clientes:
+                        clientes = self._enviar(clientes, _evento_sse('status', delta))
+                elif valor != self.led:
+                    self.led = valor
+                    if clientes:
+                        clientes = self._enviar(clientes, _evento_sse('led', {'estado': valor}))
+            if ocioso and clientes:
+                clientes = self._enviar(clientes, b": \n\n")
+            self.clientes = clientes
+            ocupados = any(cliente.buffer for cliente in clientes)
+
+
+transmissor = TransmissorEventos()
+
+def publicar_snapshot(snapshot):
+    """Serializa o status uma vez e troca o snapshot servido pelo endpoint."""
+    global snapshot_status, _dados_snapshot
+    versao, _, etag = snapshot_status
+    dados = {chave: valor for chave, valor in snapshot.items() if chave != 'timestamp'}
+    if dados != _dados_snapshot:
+        _dados_snapshot = dados
+        versao += 1
+        etag = f'W/"{_ID_SNAPSHOT}-{versao}"'
+    snapshot_status = (versao, json.dumps(snapshot).encode(), etag)
+
+
+def etag_corresponde(if_none_match, etag):
+    """
+    Comparação fraca do If-None-Match (lista de ETags separados por vírgula,
+    ou "*") com o ETag atual.
+    """
+    if if_none_match is None:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    atual = etag.removeprefix('W/')
+    return any(candidato.strip().removeprefix('W/') == atual for candidato in if_none_match.split(','))
+
+
+# Loop contínuo para ler as vagas do registro, acionar atuadores e atualizar o cache.
+# Cada volta mede só as vagas cuja leitura venceu (amostragem adaptativa) e
+# dorme até a próxima; os agregados continuam com uma amostra por vaga a
+# cada intervalo_estacionamento, para a taxa variável não pesar na ocupação.
 def loop_estacionamento():
-    global estado_vagas_cache
+    proximo_agregado = 0.0
+    # Log 'completo': próxima linha de cada vaga (a amostragem adaptativa pode
+    # medir a 20 Hz; o log continua na cadência de intervalo_estacionamento)
+    proximo_registro = {}
     while True:
+        inicio = time.perf_counter()
         try:
-            d1 = medir_distancia_parking(S1_TRIGGER, S1_ECHO)
-            d2 = medir_distancia_parking(S2_TRIGGER, S2_ECHO)
-            estado1 = atualizar_atuadores(d1, LED_VAGA1_VERMELHO, LED_VAGA1_VERDE, BUZZER_VAGA1)
-            estado2 = atualizar_atuadores(d2, LED_VAGA2_VERMELHO, LED_VAGA2_VERDE, BUZZER_VAGA2)
-            prox1 = (d1 is not None) and (d1 < THRESHOLD_MUITO_PROXIMO_CM)
-            prox2 = (d2 is not None) and (d2 < THRESHOLD_MUITO_PROXIMO_CM)
-
-            ts = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-            
-            # OTIMIZAÇÃO: Esta função agora é assíncrona (muito rápida)
-            registrar_leitura_vaga(1, d1, estado1, prox1, ts)
-            registrar_leitura_vaga(2, d2, estado2, prox2, ts)
+            devidas = amostragem.devidas(time.monotonic())
+            if not any(devidas):
+                continue
+            distancias, confiancas = medir_varredura(devidas)
+            registrar_metricas_varredura(inicio, time.perf_counter(), sum(devidas), len(devidas))
+
+            ts = _texto_timestamp()
+            agora = time.monotonic()
+            vagas = [vaga for vaga in registro if devidas[vaga.slot]]
+            estados = [None] * len(registro)
+            proximos = [False] * len(registro)
+            for vaga in vagas:
+                # Rajada sem acordo entre os pings: o filtro trata como falha (mantém o estado)
+                medida = distancias[vaga.slot] if confiancas[vaga.slot] >= CONFIANCA_MINIMA else None
+                estados[vaga.slot] = atualizar_atuadores(vaga, medida, agora)
+                # Daqui em diante (logs, cache, agregados) vale a distância filtrada. Leitura
+                # perdida dentro de max_falhas: o estado (e os atuadores) se mantém, mas a
+                # distância e o "muito próximo" do filtro são da última leitura boa
+                filtro = filtros_vagas[vaga.slot]
+                leu = medida is not None and estados[vaga.slot] != "falha"
+                d = distancias[vaga.slot] = filtro.distancia if leu else None
+                prox = leu and filtro.muito_proximo
+                proximos[vaga.slot] = estados[vaga.slot] != "falha" and filtro.muito_proximo  # buzzer
+                amostragem.registrar(vaga.slot, d, leu and (prox or filtro.candidato is not None), agora)
+                # OTIMIZAÇÃO: Esta função agora é assíncrona (muito rápida)
+                if MODO_LOG == 'delta':
+                    registrar = filtro_delta.deve_registrar(vaga.slot, d, estados[vaga.slot], prox, agora)
+                else:
+                    registrar = agora >= proximo_registro.get(vaga.slot, 0.0)
+                    if registrar:
+                        proximo_registro[vaga.slot] = agora + intervalo_estacionamento
+                if registrar:
+                    registrar_leitura_vaga(vaga.id, d, estados[vaga.slot], prox, ts, confiancas[vaga.slot])
 
             # Atualiza cache usado pelo endpoint
+            fechados = []
             with cache_vagas_lock:
-                estado_vagas_cache['timestamp'] = ts
-                estado_vagas_cache['vaga1'] = {
-                    'distancia': None if d1 is None else float(round(d1, 2)),
-                    'estado': estado1,
-                    'muito_proximo': prox1,
-                    'led_vermelho': True if (d1 is not None and d1 < THRESHOLD_OCUPADA_CM) else False,
-                    'led_verde': True if (d1 is not None and d1 >= THRESHOLD_OCUPADA_CM) else False,
-                    'buzzer': True if prox1 else False,
-                }
-                estado_vagas_cache['vaga2'] = {
-                    'distancia': None if d2 is None else float(round(d2, 2)),
-                    'estado': estado2,
-                    'muito_proximo': prox2,
-                    'led_vermelho': True if (d2 is not None and d2 < THRESHOLD_OCUPADA_CM) else False,
-                    'led_verde': True if (d2 is not None and d2 >= THRESHOLD_OCUPADA_CM) else False,
-                    'buzzer': True if prox2 else False,
-                }
+                estado_vagas.timestamp = ts
+                for vaga in vagas:
+                    estado_vagas.atualizar(vaga.slot, distancias[vaga.slot], estados[vaga.slot], proximos[vaga.slot],
+                                           confiancas[vaga.slot])
+                instante = time.time()
+                # Agregados: todas as vagas (do cache) a cada intervalo_estacionamento, mesmo no log delta
+                if agora >= proximo_agregado:
+                    proximo_agregado = agora + intervalo_estacionamento
+                    cache = [None if math.isnan(d) else d for d in estado_vagas.distancia]
+                    fechados = agregador.amostrar(instante, cache, estado_vagas.estado)
+                # Sessões: chegada ao ocupar, saída ao liberar
+                eventos_sessao = [rastreador_sessoes.atualizar(vaga.id, estados[vaga.slot], instante)
+                                  for vaga in vagas]
+                eventos_sessao = [evento for evento in eventos_sessao if evento is not None]
+                abertas = dict(rastreador_sessoes.abertas) if eventos_sessao else None
+            for resolucao, inicio_bucket, dados in fechados:
+                log_queue.put(('agregado', resolucao, inicio_bucket, dados))
+            for evento in eventos_sessao:
+                if evento[0] == 'saida':
+                    log_queue.put(('sessao', sessoes.registro_sessao(*evento[1:])))
+            if abertas is not None:
+                log_queue.put(('sessoes_abertas', abertas))
+
+            # Publica o snapshot serializado e o stream (o transmissor calcula o que mudou)
+            snapshot = {'timestamp': ts}
+            for vaga in registro:
+                snapshot[vaga.chave] = estado_vagas.como_dict(vaga.slot)
+            publicar_snapshot(snapshot)
+            transmissor.publicar_status(snapshot)
         except Exception as e:
             print(f"Erro no loop de estacionamento: {e}")
         finally:
-            time.sleep(intervalo_estacionamento)
+            # Dorme até a próxima leitura agendada (de qualquer vaga)
+            agora = time.monotonic()
+            time.sleep(max(0.0, amostragem.proxima_leitura(agora) - agora))
 
 # ==========================================================
 # ============ TEMPLATE HTML ATUALIZADO ====================
@@ -563,60 +2370,13 @@ HTML_TEMPLATE = """
 
         <div class="historico">
             <h2>Monitoramento das Vagas</h2>
-            <div id="parking-status" class="cards-container">
-                <div class="card-vaga">
-                    <h3>Vaga 1</h3>
-                    <div>Distância: <span id="vaga1-dist">--</span> cm</div>
-                    <div>Estado: <span id="vaga1-estado">--</span></div>
-                    <div>Muito próximo: <span id="vaga1-prox">--</span></div>
-                    <div>LED vermelho: <span id="vaga1-led-v">--</span></div>
-                    <div>LED verde: <span id="vaga1-led-g">--</span></div>
-                    <div>Buzzer: <span id="vaga1-buzzer">--</span></div>
-                    
-                    <div style="position: relative; height: 150px; margin-top: 10px;">
-                        <canvas id="chart-vaga1"></canvas>
-                    </div>
-                    
-                    <div style="margin-top:8px; text-align:right;">
-                        <a href="/download/leituras_vaga1.csv" style="background:#2196F3;color:#fff;padding:6px 10px;border-radius:4px;text-decoration:none;font-size:12px;">Baixar CSV Vaga 1</a>
-                    </div>
-                </div>
-                <div class="card-vaga">
-                    <h3>Vaga 2</h3>
-                    <div>Distância: <span id="vaga2-dist">--</span> cm</div>
-                    <div>Estado: <span id="vaga2-estado">--</span></div>
-                    <div>Muito próximo: <span id="vaga2-prox">--</span></div>
-                    <div>LED vermelho: <span id="vaga2-led-v">--</span></div>
-                    <div>LED verde: <span id="vaga2-led-g">--</span></div>
-                    <div>Buzzer: <span id="vaga2-buzzer">--</span></div>
-                    
-                    <div style="position: relative; height: 150px; margin-top: 10px;">
-                        <canvas id="chart-vaga2"></canvas>
-                    </div>
-
-                    <div style="margin-top:8px; text-align:right;">
-                        <a href="/download/leituras_vaga2.csv" style="background:#4CAF50;color:#fff;padding:6px 10px;border-radius:4px;text-decoration:none;font-size:12px;">Baixar CSV Vaga 2</a>
-                    </div>
-                </div>
-            </div>
+            <!-- Os cards são criados a partir das vagas do registro -->
+            <div id="parking-status" class="cards-container"></div>
         </div>
 
         <div class="historico">
             <h2>Resumo da Ocupação (Sessão Atual)</h2>
-            <div class="resumo-container">
-                <div class="resumo-vaga">
-                    <h3>Vaga 1</h3>
-                    <div style="position: relative; height: 200px;">
-                        <canvas id="chart-resumo-vaga1"></canvas>
-                    </div>
-                </div>
-                <div class="resumo-vaga">
-                    <h3>Vaga 2</h3>
-                    <div style="position: relative; height: 200px;">
-                        <canvas id="chart-resumo-vaga2"></canvas>
-                    </div>
-                </div>
-            </div>
+            <div id="resumo-container" class="resumo-container"></div>
         </div>
         
         
@@ -629,205 +2389,211 @@ HTML_TEMPLATE = """
     <script>
         // Elementos da interface
         const alerta = document.getElementById('alerta-proximidade');
-        const vaga1Dist = document.getElementById('vaga1-dist');
-        const vaga1Estado = document.getElementById('vaga1-estado');
-        const vaga1Prox = document.getElementById('vaga1-prox');
-        const vaga2Dist = document.getElementById('vaga2-dist');
-        const vaga2Estado = document.getElementById('vaga2-estado');
-        const vaga2Prox = document.getElementById('vaga2-prox');
-        const chartVaga1 = document.getElementById('chart-vaga1');
-        const chartVaga2 = document.getElementById('chart-vaga2');
-        const v1LedV = document.getElementById('vaga1-led-v');
-        const v1LedG = document.getElementById('vaga1-led-g');
-        const v1Buzzer = document.getElementById('vaga1-buzzer');
-        const v2LedV = document.getElementById('vaga2-led-v');
-        const v2LedG = document.getElementById('vaga2-led-g');
-        const v2Buzzer = document.getElementById('vaga2-buzzer');
+        const parkingStatus = document.getElementById('parking-status');
+        const resumoContainer = document.getElementById('resumo-container');
         const ledEstado = document.getElementById('led-estado'); // <--- MANTIDO
         const ledToggle = document.getElementById('led-toggle'); // <--- MANTIDO
 
-        // --- Variáveis dos Gráficos de Linha ---
-        const dadosVaga1 = [];
-        const dadosVaga2 = [];
+        // --- Estado por vaga (cards, gráficos e contagens) ---
         const MAX_PONTOS = 40;
-        let chart1 = null;
-        let chart2 = null;
+        // Os gráficos amostram o estado atual nesse intervalo, qualquer que
+        // seja a taxa de eventos do stream (o "Resumo" conta tempo, não eventos)
+        const INTERVALO_AMOSTRA_MS = 1000;
+        const CORES = ['#F44336', '#2196F3', '#4CAF50', '#FF9800', '#9C27B0', '#009688'];
+        const vagas = {};  // chave ('vaga1', ...) -> elementos/gráficos da vaga
 
-        // --- Variáveis dos Gráficos de Resumo (Rosca) ---
-        let chartResumo1 = null;
-        let chartResumo2 = null;
-        let contagemVaga1 = { ocupada: 0, livre: 0, falha: 0 };
-        let contagemVaga2 = { ocupada: 0, livre: 0, falha: 0 };
-        const canvasResumo1 = document.getElementById('chart-resumo-vaga1');
-        const canvasResumo2 = document.getElementById('chart-resumo-vaga2');
 
+        // Estado atual das vagas (completo ao assinar o stream, depois só deltas)
+        let statusAtual = {};
 
         // Inicializa a página
         window.addEventListener('load', function() {
-            atualizarEstacionamento();
-            inicializarGraficos();
-            inicializarGraficosResumo(); 
-            atualizarLedStatus(); // <--- MANTIDO
-
-            // OTIMIZAÇÃO: Intervalo reduzido para 1000ms (1 segundo)
-            setInterval(atualizarEstacionamento, 1000); 
-            setInterval(atualizarLedStatus, 2000); // <--- MANTIDO (pode ser mais lento)
+            if (window.EventSource) {
+                assinarStream();
+            } else {
+                // Navegador sem SSE: volta ao polling
+                atualizarEstacionamento();
+                atualizarLedStatus();
+                setInterval(atualizarEstacionamento, 1000); 
+                setInterval(atualizarLedStatus, 2000);
+            }
+            setInterval(amostrarGraficos, INTERVALO_AMOSTRA_MS);
             
             // <--- MANTIDO
             ledToggle.addEventListener('click', function() {
                 const ligar = ledToggle.textContent.includes('Ligar');
                 fetch('/api/led?estado=' + (ligar ? 1 : 0))
                     .then(r => r.json())
-                    .then(() => atualizarLedStatus())
+                    .then(d => mostrarLed(d.estado))
                     .catch(err => console.error('Erro ao alternar LED:', err));
             });
         });
+
+        // Stream SSE: o servidor empurra o estado a cada varredura
+        function assinarStream() {
+            const stream = new EventSource('/api/parking/stream');
+            stream.addEventListener('completo', e => {
+                const d = JSON.parse(e.data);
+                statusAtual = d.status;
+                if (d.led !== null) mostrarLed(d.led);
+                aplicarStatus(statusAtual);
+            });
+            stream.addEventListener('status', e => {
+                const delta = JSON.parse(e.data);
+                for (const chave of Object.keys(delta)) {
+                    const valor = delta[chave];
+                    if (valor !== null && typeof valor === 'object') {
+                        statusAtual[chave] = Object.assign(statusAtual[chave] || {}, valor);
+                    } else {
+                        statusAtual[chave] = valor;
+                    }
+                }
+                aplicarStatus(statusAtual);
+            });
+            stream.addEventListener('led', e => mostrarLed(JSON.parse(e.data).estado));
+            stream.onerror = () => console.error('Stream de status interrompido; reconectando...');
+        }
+
+        // Cria card, gráfico de linha e gráfico de resumo de uma vaga
+        function criarVaga(chave) {
+            const numero = chave.replace('vaga', '');
+            const cor = CORES[Object.keys(vagas).length % CORES.length];
+
+            const card = document.createElement('div');
+            card.className = 'card-vaga';
+            card.innerHTML = `
+                <h3>Vaga ${numero}</h3>
+                <div>Distância: <span class="dist">--</span> cm</div>
+                <div>Estado: <span class="estado">--</span></div>
+                <div>Muito próximo: <span class="prox">--</span></div>
+                <div>LED vermelho: <span class="led-v">--</span></div>
+                <div>LED verde: <span class="led-g">--</span></div>
+                <div>Buzzer: <span class="buzzer">--</span></div>
+                <div style="position: relative; height: 150px; margin-top: 10px;">
+                    <canvas></canvas>
+                </div>
+                <div style="margin-top:8px; text-align:right;">
+                    <a href="/download/leituras_${chave}.csv" style="background:${cor};color:#fff;padding:6px 10px;border-radius:4px;text-decoration:none;font-size:12px;">Baixar CSV Vaga ${numero}</a>
+                </div>`;
+            parkingStatus.appendChild(card);
+
+            const resumo = document.createElement('div');
+            resumo.className = 'resumo-vaga';
+            resumo.innerHTML = `
+                <h3>Vaga ${numero}</h3>
+                <div style="position: relative; height: 200px;">
+                    <canvas></canvas>
+                </div>`;
+            resumoContainer.appendChild(resumo);
+
+            const vaga = {
+                numero: numero,
+                dist: card.querySelector('.dist'),
+                estado: card.querySelector('.estado'),
+                prox: card.querySelector('.prox'),
+                ledV: card.querySelector('.led-v'),
+                ledG: card.querySelector('.led-g'),
+                buzzer: card.querySelector('.buzzer'),
+                dados: [],
+                contagem: { ocupada: 0, livre: 0, falha: 0 },
+                chart: criarGraficoLinha(card.querySelector('canvas'), cor),
+                chartResumo: criarGraficoResumo(resumo.querySelector('canvas')),
+            };
+            vagas[chave] = vaga;
+            return vaga;
+        }
         
         // Atualização do status das vagas de estacionamento
         function atualizarEstacionamento() {
             fetch('/api/parking/status')
                 .then(response => response.json())
                 .then(data => {
-                    // --- Atualiza Textos Vaga 1 ---
-                    vaga1Dist.textContent = data.vaga1.distancia !== null ? data.vaga1.distancia.toFixed(2) : '--';
-                    vaga1Estado.textContent = data.vaga1.estado;
-                    vaga1Prox.textContent = data.vaga1.muito_proximo ? 'Sim' : 'Não';
-                    v1LedV.textContent = data.vaga1.led_vermelho ? 'Ligado' : 'Desligado';
-                    v1LedG.textContent = data.vaga1.led_verde ? 'Ligado' : 'Desligado';
-                    v1Buzzer.textContent = data.vaga1.buzzer ? 'Ligado' : 'Desligado';
-                    
-                    // --- Atualiza Textos Vaga 2 ---
-                    vaga2Dist.textContent = data.vaga2.distancia !== null ? data.vaga2.distancia.toFixed(2) : '--';
-                    vaga2Estado.textContent = data.vaga2.estado;
-                    vaga2Prox.textContent = data.vaga2.muito_proximo ? 'Sim' : 'Não';
-                    v2LedV.textContent = data.vaga2.led_vermelho ? 'Ligado' : 'Desligado';
-                    v2LedG.textContent = data.vaga2.led_verde ? 'Ligado' : 'Desligado';
-                    v2Buzzer.textContent = data.vaga2.buzzer ? 'Ligado' : 'Desligado';
-
-                    // --- Atualiza Alerta ---
-                    const vagasProximas = [];
-                    if (data.vaga1.muito_proximo) vagasProximas.push('Vaga 1');
-                    if (data.vaga2.muito_proximo) vagasProximas.push('Vaga 2');
-                    if (vagasProximas.length > 0) {
-                        alerta.textContent = 'Alerta: ' + vagasProximas.join(' e ') + ' muito próxima(s)!';
-                        alerta.style.display = 'block';
-                    } else {
-                        alerta.style.display = 'none';
-                    }
-
-                    // --- Atualiza Gráficos de Linha ---
-                    const t = new Date();
-                    if (typeof data.vaga1.distancia === 'number') {
-                        dadosVaga1.push({ x: t, y: data.vaga1.distancia });
-                        if (dadosVaga1.length > MAX_PONTOS) dadosVaga1.shift();
-                        chart1.data.datasets[0].data = dadosVaga1.slice();
-                        chart1.update('none');
-                    }
-                    if (typeof data.vaga2.distancia === 'number') {
-                        dadosVaga2.push({ x: t, y: data.vaga2.distancia });
-                        if (dadosVaga2.length > MAX_PONTOS) dadosVaga2.shift();
-                        chart2.data.datasets[0].data = dadosVaga2.slice();
-                        chart2.update('none');
-                    }
-
-                    // --- ATUALIZAÇÃO DOS GRÁFICOS DE RESUMO ---
-                    const estado1 = data.vaga1.estado;
-                    const estado2 = data.vaga2.estado;
-
-                    if (estado1 === 'ocupada') contagemVaga1.ocupada++;
-                    else if (estado1 === 'livre') contagemVaga1.livre++;
-                    else contagemVaga1.falha++;
-                    
-                    if (estado2 === 'ocupada') contagemVaga2.ocupada++;
-                    else if (estado2 === 'livre') contagemVaga2.livre++;
-                    else contagemVaga2.falha++;
-
-                    if(chartResumo1) {
-                        chartResumo1.data.datasets[0].data = [contagemVaga1.ocupada, contagemVaga1.livre];
-                        chartResumo1.update('none'); 
-                    }
-                    if(chartResumo2) {
-                        chartResumo2.data.datasets[0].data = [contagemVaga2.ocupada, contagemVaga2.livre];
-                        chartResumo2.update('none');
-                    }
-
+                    statusAtual = data;
+                    aplicarStatus(statusAtual);
                 })
                 .catch(err => {
                     console.error('Erro ao obter status de estacionamento:', err);
                 });
         }
 
-        // --- Função dos Gráficos de Linha (sem alteração) ---
-        function inicializarGraficos() {
-            const ctx1 = chartVaga1.getContext('2d');
-            const gradient1 = ctx1.createLinearGradient(0, 0, 0, 150);
-            gradient1.addColorStop(0, 'rgba(244, 67, 54, 0.5)'); 
-            gradient1.addColorStop(1, 'rgba(244, 67, 54, 0)');
+        // Textos e alerta: atualizados a cada evento
+        function aplicarStatus(data) {
+            const vagasProximas = [];
+
+            for (const chave of Object.keys(data)) {
+                if (!chave.startsWith('vaga')) continue;
+                const info = data[chave];
+                const vaga = vagas[chave] || criarVaga(chave);
+
+                // --- Atualiza Textos ---
+                vaga.dist.textContent = info.distancia !== null ? info.distancia.toFixed(2) : '--';
+                vaga.estado.textContent = info.estado;
+                vaga.prox.textContent = info.muito_proximo ? 'Sim' : 'Não';
+                vaga.ledV.textContent = info.led_vermelho ? 'Ligado' : 'Desligado';
+                vaga.ledG.textContent = info.led_verde ? 'Ligado' : 'Desligado';
+                vaga.buzzer.textContent = info.buzzer ? 'Ligado' : 'Desligado';
+                if (info.muito_proximo) vagasProximas.push('Vaga ' + vaga.numero);
+            }
+
+            // --- Atualiza Alerta ---
+            if (vagasProximas.length > 0) {
+                alerta.textContent = 'Alerta: ' + vagasProximas.join(' e ') + ' muito próxima(s)!';
+                alerta.style.display = 'block';
+            } else {
+                alerta.style.display = 'none';
+            }
+        }
 
-            chart1 = new Chart(ctx1, {
-                type: 'line',
-                data: {
-                    datasets: [{
-                        label: 'Distância (cm)',
-                        data: [],
-                        borderColor: '#F44336',
-                        borderWidth: 2,
-                        pointRadius: 0,
-                        tension: 0.3, 
-                        fill: true,
-                        backgroundColor: gradient1,
-                    }]
-                },
-                options: {
-                    responsive: true,
-                    maintainAspectRatio: false,
-                    plugins: { legend: { display: false }, title: { display: false }, 
-                        tooltip: { enabled: true, mode: 'index', intersect: false, }
-                    },
-                    scales: {
-                        x: {
-                            type: 'time',
-                            time: { unit: 'second', displayFormats: { second: 'HH:mm:ss' } },
-                            title: { display: false },
-                            grid: { display: false },
-                            ticks: { color: '#666', maxRotation: 0, autoSkip: true, maxTicksLimit: 6 }
-                        },
-                        y: {
-                            title: { display: true, text: 'cm', color: '#666' },
-                            grid: { display: true, color: '#eeeeee', lineWidth: 1 },
-                            ticks: { color: '#666' },
-                            beginAtZero: true,
-                            suggestedMax: 70 
-                        }
-                    },
-                    animation: { duration: 200 }
+        // Gráficos: uma amostra do estado atual por INTERVALO_AMOSTRA_MS
+        function amostrarGraficos() {
+            const t = new Date();
+            for (const chave of Object.keys(statusAtual)) {
+                const vaga = vagas[chave];
+                if (!vaga) continue;
+                const info = statusAtual[chave];
+
+                // --- Atualiza Gráfico de Linha ---
+                if (typeof info.distancia === 'number') {
+                    vaga.dados.push({ x: t, y: info.distancia });
+                    if (vaga.dados.length > MAX_PONTOS) vaga.dados.shift();
+                    vaga.chart.data.datasets[0].data = vaga.dados.slice();
+                    vaga.chart.update('none');
                 }
-            });
 
-            const ctx2 = chartVaga2.getContext('2d');
-            const gradient2 = ctx2.createLinearGradient(0, 0, 0, 150);
-            gradient2.addColorStop(0, 'rgba(33, 150, 243, 0.5)');
-            gradient2.addColorStop(1, 'rgba(33, 150, 243, 0)');
+                // --- ATUALIZAÇÃO DO GRÁFICO DE RESUMO ---
+                if (info.estado === 'ocupada') vaga.contagem.ocupada++;
+                else if (info.estado === 'livre') vaga.contagem.livre++;
+                else vaga.contagem.falha++;
+                vaga.chartResumo.data.datasets[0].data = [vaga.contagem.ocupada, vaga.contagem.livre];
+                vaga.chartResumo.update('none');
+            }
+        }
+
+        // --- Gráfico de Linha de uma vaga ---
+        function criarGraficoLinha(canvas, cor) {
+            const ctx = canvas.getContext('2d');
+            const gradient = ctx.createLinearGradient(0, 0, 0, 150);
+            gradient.addColorStop(0, cor + '80');
+            gradient.addColorStop(1, cor + '00');
 
-            chart2 = new Chart(ctx2, {
+            return new Chart(ctx, {
                 type: 'line',
                 data: {
                     datasets: [{
                         label: 'Distância (cm)',
                         data: [],
-                        borderColor: '#2196F3',
+                        borderColor: cor,
                         borderWidth: 2,
                         pointRadius: 0,
-                        tension: 0.3,
+                        tension: 0.3, 
                         fill: true,
-                        backgroundColor: gradient2,
+                        backgroundColor: gradient,
                     }]
                 },
                 options: {
                     responsive: true,
                     maintainAspectRatio: false,
-                    plugins: {
-                        legend: { display: false }, title: { display: false },
+                    plugins: { legend: { display: false }, title: { display: false }, 
                         tooltip: { enabled: true, mode: 'index', intersect: false, }
                     },
                     scales: {
@@ -843,7 +2609,7 @@ HTML_TEMPLATE = """
                             grid: { display: true, color: '#eeeeee', lineWidth: 1 },
                             ticks: { color: '#666' },
                             beginAtZero: true,
-                            suggestedMax: 70
+                            suggestedMax: 70 
                         }
                     },
                     animation: { duration: 200 }
@@ -851,8 +2617,8 @@ HTML_TEMPLATE = """
             });
         }
 
-        // --- Função dos Gráficos de Resumo (sem alteração) ---
-        function inicializarGraficosResumo() {
+        // --- Gráfico de Resumo (Rosca) de uma vaga ---
+        function criarGraficoResumo(canvas) {
             const optionsResumo = {
                 responsive: true,
                 maintainAspectRatio: false,
@@ -876,21 +2642,7 @@ HTML_TEMPLATE = """
                 }
             };
 
-            chartResumo1 = new Chart(canvasResumo1.getContext('2d'), {
-                type: 'doughnut',
-                data: {
-                    labels: ['Ocupada', 'Livre'],
-                    datasets: [{
-                        data: [0, 0],
-                        backgroundColor: ['#F44336', '#8BC34A'],
-                        borderColor: '#ffffff',
-                        borderWidth: 2
-                    }]
-                },
-                options: optionsResumo
-            });
-
-            chartResumo2 = new Chart(canvasResumo2.getContext('2d'), {
+            return new Chart(canvas.getContext('2d'), {
                 type: 'doughnut',
                 data: {
                     labels: ['Ocupada', 'Livre'],
@@ -910,12 +2662,14 @@ HTML_TEMPLATE = """
         function atualizarLedStatus() {
             fetch('/api/led/status')
                 .then(r => r.json())
-                .then(d => {
-                    ledEstado.textContent = d.estado ? 'Ligado' : 'Desligado';
-                    ledToggle.textContent = d.estado ? 'Desligar LED' : 'Ligar LED';
-                })
+                .then(d => mostrarLed(d.estado))
                 .catch(err => console.error('Erro ao obter estado do LED:', err));
         }
+
+        function mostrarLed(estado) {
+            ledEstado.textContent = estado ? 'Ligado' : 'Desligado';
+            ledToggle.textContent = estado ? 'Desligar LED' : 'Ligar LED';
+        }
     </script>
 </body>
 </html>
@@ -923,16 +2677,246 @@ HTML_TEMPLATE = """
 
 # Classe para o servidor HTTP
 class SensorHTTPHandler(http.server.SimpleHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'      # keep-alive
+    timeout = TIMEOUT_REQUISICAO_S     # protege os workers de clientes lentos
+    # Cabeçalho e corpo saem em writes separados; sem TCP_NODELAY o Nagle
+    # segura o corpo até o ACK atrasado do cliente (~40 ms por resposta)
+    disable_nagle_algorithm = True
+
+    def handle(self):
+        # Atende uma requisição por vez: se a conexão continuar aberta
+        # (keep-alive), ela volta para o seletor do servidor e não prende
+        # um worker enquanto está ociosa. Requisições em pipeline que já
+        # estão no buffer do rfile não acordariam o seletor (e o buffer
+        # morre com o handler): enquanto houver bytes pendentes, segue aqui
+        while True:
+            self.close_connection = True
+            self.handle_one_request()
+            if self.close_connection or not self._requisicao_pendente():
+                return
+
+    def _requisicao_pendente(self):
+        """True se já há bytes da próxima requisição, no buffer ou no socket (sem bloquear)."""
+        timeout = self.connection.gettimeout()
+        self.connection.setblocking(False)
+        try:
+            return bool(self.rfile.peek(1))
+        except OSError:
+            return False
+        finally:
+            self.connection.settimeout(timeout)
+
+    @staticmethod
+    def _expandir(parsed_path):
+        """?expandir=1/0 força (ou não) a reconstrução do log delta."""
+        valor = parse_qs(parsed_path.query).get('expandir', [None])[0]
+        if valor is None:
+            return MODO_LOG == 'delta'
+        return valor not in ('0', 'false', 'nao')
+
+    def _responder(self, corpo, tipo, status=200, cabecalhos=()):
+        """Resposta completa com Content-Length (necessário para o keep-alive)."""
+        self.send_response(status)
+        self.send_header('Content-type', tipo)
+        self.send_header('Content-Length', str(len(corpo)))
+        for nome, valor in cabecalhos:
+            self.send_header(nome, valor)
+        self.end_headers()
+        self.wfile.write(corpo)
+
+    def _responder_json(self, dados):
+        self._responder(json.dumps(dados).encode(), 'application/json')
+
+    def _aceita_gzip(self):
+        return 'gzip' in self.headers.get('Accept-Encoding', '')
+
+    def _intervalo_pedido(self, tamanho):
+        """
+        Interpreta o cabeçalho Range (um único intervalo de bytes).
+        Retorna None (arquivo inteiro), (inicio, fim) inclusivo, ou False
+        se o intervalo não puder ser atendido.
+        """
+        pedido = self.headers.get('Range', '').strip()
+        if not pedido.startswith('bytes=') or ',' in pedido:
+            return None
+        inicio_txt, _, fim_txt = pedido[len('bytes='):].partition('-')
+        try:
+            if inicio_txt == '':
+                # bytes=-N: os últimos N bytes
+                n = int(fim_txt)
+                if n <= 0:
+                    return False
+                return max(0, tamanho - n), tamanho - 1
+            inicio = int(inicio_txt)
+            fim = int(fim_txt) if fim_txt else tamanho - 1
+        except ValueError:
+            return None
+        if inicio >= tamanho or fim < inicio:
+            return False
+        return inicio, min(fim, tamanho - 1)
+
+    def _iniciar_envio_em_partes(self, nome_arquivo, comprimir):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/csv')
+        self.send_header('Content-Disposition', f'attachment; filename="{nome_arquivo}"')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.send_header('Vary', 'Accept-Encoding')
+        if comprimir:
+            self.send_header('Content-Encoding', 'gzip')
+        self.end_headers()
+
+    def _enviar_partes(self, partes, comprimir):
+        """Corpo com Transfer-Encoding: chunked, comprimindo em gzip se pedido."""
+        compressor = zlib.compressobj(NIVEL_GZIP, zlib.DEFLATED, 31) if comprimir else None
+        for parte in partes:
+            if compressor is not None:
+                parte = compressor.compress(parte)
+            if parte:
+                self.wfile.write(b"%x\r\n%s\r\n" % (len(parte), parte))
+        if compressor is not None:
+            parte = compressor.flush()
+            if parte:
+                self.wfile.write(b"%x\r\n%s\r\n" % (len(parte), parte))
+        self.wfile.write(b"0\r\n\r\n")
+
+    @staticmethod
+    def _blocos_arquivo(f):
+        while True:
+            bloco = f.read(TAMANHO_BLOCO_ENVIO)
+            if not bloco:
+                return
+            yield bloco
+
+    @staticmethod
+    def _blocos_csv(linhas):
+        texto = io.StringIO()
+        escritor = csv.writer(texto)
+        for linha in linhas:
+            escritor.writerow(linha)
+            if texto.tell() >= TAMANHO_BLOCO_ENVIO:
+                yield texto.getvalue().encode()
+                texto.seek(0)
+                texto.truncate()
+        yield texto.getvalue().encode()
+
+    @staticmethod
+    def _log_disponivel(caminho):
+        # No backend binário todo CSV pode ser exportado (no mínimo o cabeçalho)
+        return BACKEND_ARMAZENAMENTO == 'binario' or os.path.exists(caminho)
+
+    def _exportar_csv(self, caminho, nome_arquivo, chave, expandir):
+        """CSV gerado do backend binário: tamanho desconhecido, vai em chunks."""
+        linhas = linhas_exportadas(caminho)
+        if expandir:
+            linhas = expandir_timeline(linhas, chave)
+        comprimir = self._aceita_gzip()
+        self._iniciar_envio_em_partes(nome_arquivo, comprimir)
+        self._enviar_partes(self._blocos_csv(linhas), comprimir)
+
+    def _enviar_csv(self, caminho, nome_arquivo, chave, expandir):
+        """
+        Envia um CSV sem carregá-lo inteiro na memória. Arquivo cru: sendfile
+        (zero-cópia) com suporte a Range, ou gzip em blocos se o cliente
+        aceitar. Com expandir, gera a linha do tempo reconstruída em blocos.
+        """
+        if BACKEND_ARMAZENAMENTO == 'binario':
+            self._exportar_csv(caminho, nome_arquivo, chave, expandir)
+            return
+        comprimir = self._aceita_gzip()
+        if segmentos_log(caminho):
+            # Há segmentos rotacionados: o conteúdo é montado na hora (sem Range)
+            self._iniciar_envio_em_partes(nome_arquivo, comprimir)
+            if expandir:
+                partes = self._blocos_csv(expandir_timeline(_linhas_log(caminho), chave))
+            else:
+                partes = _blocos_log(caminho)
+            self._enviar_partes(partes, comprimir)
+            return
+        with open(caminho, 'rb') as f:
+            # O arquivo continua crescendo: envia o tamanho visto agora
+            tamanho = os.fstat(f.fileno()).st_size
+            intervalo = None if expandir else self._intervalo_pedido(tamanho)
+            if intervalo is False:
+                self.send_response(416)
+                self.send_header('Content-Range', f'bytes */{tamanho}')
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+
+            if intervalo is None and (expandir or comprimir):
+                self._iniciar_envio_em_partes(nome_arquivo, comprimir)
+                if expandir:
+                    with open(caminho, 'r', newline='') as texto:
+                        linhas = expandir_timeline(csv.reader(texto), chave)
+                        self._enviar_partes(self._blocos_csv(linhas), comprimir)
+                else:
+                    self._enviar_partes(self._blocos_arquivo(f), comprimir)
+                return
+
+            inicio, fim = intervalo if intervalo else (0, tamanho - 1)
+            quantidade = fim - inicio + 1
+            self.send_response(206 if intervalo else 200)
+            self.send_header('Content-Type', 'text/csv')
+            self.send_header('Content-Disposition', f'attachment; filename="{nome_arquivo}"')
+            self.send_header('Accept-Ranges', 'bytes')
+            self.send_header('Content-Length', str(quantidade))
+            if intervalo:
+                self.send_header('Content-Range', f'bytes {inicio}-{fim}/{tamanho}')
+            self.end_headers()
+            if quantidade > 0:
+                self.connection.sendfile(f, inicio, quantidade)
+
+    def _responder_sessoes(self, path, query):
+        """
+        /api/sessoes?vaga=&from=&to=&limit=   sessões encerradas no período
+        /api/sessoes/resumo?from=&to=         permanência média/máxima por vaga
+        /api/sessoes/abertas?min_duracao=     vagas ocupadas há mais de N s
+        """
+        agora = time.time()
+        try:
+            inicio = _ler_instante_consulta(query['from'][0]) if 'from' in query else agora - 7 * 86400
+            fim = _ler_instante_consulta(query['to'][0]) if 'to' in query else None
+            limite = min(int(query.get('limit', [LIMITE_CONSULTA])[0]), LIMITE_CONSULTA_MAXIMO)
+            min_duracao = float(query.get('min_duracao', ['0'])[0])
+        except ValueError as e:
+            self.send_error(400, f"Parâmetro inválido: {e}")
+            return
+        id_texto = query.get('vaga', [''])[0].replace('vaga', '')
+        vaga = registro.por_id.get(int(id_texto)) if id_texto.isdigit() else None
+        if id_texto and vaga is None:
+            self.send_error(404, "Vaga não encontrada")
+            return
+
+        if path == '/api/sessoes/abertas':
+            with cache_vagas_lock:
+                abertas = rastreador_sessoes.abertas_ha_mais_de(min_duracao, agora)
+            self._responder_json([
+                {'vaga': vaga_id, 'chegada': _texto_timestamp(chegada), 'duracao_s': round(agora - chegada, 1)}
+                for vaga_id, chegada in abertas if vaga is None or vaga_id == vaga.id])
+            return
+
+        descarregar_logs()
+        encerradas = sessoes.ler(DIRETORIO_DADOS, inicio, fim, vaga.id if vaga else None)
+        if path == '/api/sessoes/resumo':
+            self._responder_json(sessoes.resumo(encerradas))
+        elif path == '/api/sessoes':
+            resultado = []
+            for vaga_id, chegada, saida in encerradas:
+                resultado.append({'vaga': vaga_id, 'chegada': _texto_timestamp(chegada),
+                                  'saida': _texto_timestamp(saida), 'duracao_s': round(saida - chegada, 1)})
+                if len(resultado) >= limite:
+                    break
+            self._responder_json(resultado)
+        else:
+            self.send_error(404)
+
     def do_GET(self):
         parsed_path = urlparse(self.path)
         path = parsed_path.path
         global led_status
         
         if path == '/':
-            self.send_response(200)
-            self.send_header('Content-type', 'text/html')
-            self.end_headers()
-            self.wfile.write(HTML_TEMPLATE.encode())
+            self._responder(HTML_TEMPLATE.encode(), 'text/html')
             return
         
         # ==========================================================
@@ -941,76 +2925,197 @@ class SensorHTTPHandler(http.server.SimpleHTTPRequestHandler):
         # ==========================================================
         
         elif path == '/api/historico/led':
-            self.send_response(200)
-            self.send_header('Content-type', 'application/json')
-            self.end_headers()
-            
             historico_led = []
             try:
-                if os.path.exists(ARQUIVO_ACOES_LED):
-                    with open(ARQUIVO_ACOES_LED, 'r', newline='') as arquivo:
-                        leitor = csv.reader(arquivo)
-                        next(leitor, None)  # pula cabeçalho
-                        linhas = list(leitor)[-50:]
-                        for linha in linhas:
-                            if len(linha) >= 3:
-                                historico_led.append({
-                                    'timestamp': linha[0],
-                                    'acao': linha[1],
-                                    'estado': linha[2]
-                                })
+                # Da memória; lê só o final do arquivo se o buffer não cobrir
+                for linha in historico_recente(buffer_led, ARQUIVO_ACOES_LED, 50, origem=0):
+                    if len(linha) >= 3:
+                        historico_led.append({
+                            'timestamp': linha[0],
+                            'acao': linha[1],
+                            'estado': linha[2]
+                        })
             except Exception as e:
                 print(f"Erro ao ler histórico do LED: {e}")
             
-            self.wfile.write(json.dumps(historico_led).encode())
+            self._responder_json(historico_led)
             return
         
         elif path == '/api/historico/eventos':
-            self.send_response(200)
-            self.send_header('Content-type', 'application/json')
-            self.end_headers()
-            
             historico_eventos = []
             try:
-                if os.path.exists(ARQUIVO_EVENTOS):
-                    with open(ARQUIVO_EVENTOS, 'r', newline='') as arquivo:
-                        leitor = csv.reader(arquivo)
-                        next(leitor, None)
-                        linhas = list(leitor)[-100:]
-                        for linha in linhas:
-                            if len(linha) >= 4:
-                                historico_eventos.append({
-                                    'timestamp': linha[0],
-                                    'tipo': linha[1],
-                                    'descricao': linha[2],
-                                    'valor': linha[3]
-                                })
+                if self._expandir(parsed_path):
+                    # Volta um keyframe inteiro para ter o valor retido de todas as vagas
+                    linhas = historico_recente(buffer_eventos, ARQUIVO_EVENTOS, 100, janela_s=KEYFRAME_S)
+                    linhas = list(expandir_timeline(linhas, _chave_eventos))[-100:]
+                else:
+                    linhas = historico_recente(buffer_eventos, ARQUIVO_EVENTOS, 100)
+                for linha in linhas:
+                    if len(linha) >= 4:
+                        historico_eventos.append({
+                            'timestamp': linha[0],
+                            'tipo': linha[1],
+                            'descricao': linha[2],
+                            'valor': linha[3]
+                        })
             except Exception as e:
                 print(f"Erro ao ler histórico combinado: {e}")
             
-            self.wfile.write(json.dumps(historico_eventos).encode())
+            self._responder_json(historico_eventos)
             return
         
-        elif path == '/api/parking/status':
-            # Tenta servir do cache preenchido pelo loop em segundo plano
+        elif path.startswith('/api/historico/vaga'):
+            # Últimas leituras de uma vaga (/api/historico/vaga<id>)
+            id_texto = path[len('/api/historico/vaga'):]
+            vaga = registro.por_id.get(int(id_texto)) if id_texto.isdigit() else None
+            if vaga is None:
+                self.send_error(404, "Vaga não encontrada")
+                return
+            historico_vaga = []
+            try:
+                expandir = self._expandir(parsed_path)
+                janela_s = KEYFRAME_S if expandir else None
+                linhas = historico_recente(buffers_vagas.get(vaga.id), arquivo_vaga(vaga.id), 100, janela_s, vaga.id)
+                if expandir:
+                    linhas = list(expandir_timeline(linhas, _chave_vaga))[-100:]
+                for linha in linhas:
+                    if len(linha) >= 4:
+                        historico_vaga.append({
+                            'timestamp': linha[0],
+                            'distancia': linha[1],
+                            'estado': linha[2],
+                            'muito_proximo': linha[3],
+                            'confianca': linha[4] if len(linha) > 4 else ''
+                        })
+            except Exception as e:
+                print(f"Erro ao ler histórico da vaga {vaga.id}: {e}")
+
+            self._responder_json(historico_vaga)
+            return
+
+        elif path == '/api/historico/query':
+            # Leituras por intervalo de tempo: ?vaga=&from=&to=&limit=
+            query = parse_qs(parsed_path.query)
+            try:
+                inicio = _ler_instante_consulta(query.get('from', ['0'])[0])
+                fim = _ler_instante_consulta(query['to'][0]) if 'to' in query else math.inf
+                limite = min(int(query.get('limit', [LIMITE_CONSULTA])[0]), LIMITE_CONSULTA_MAXIMO)
+            except ValueError as e:
+                self.send_error(400, f"Parâmetro inválido: {e}")
+                return
+            id_texto = query.get('vaga', [''])[0].replace('vaga', '')
+            vaga = registro.por_id.get(int(id_texto)) if id_texto.isdigit() else None
+            if id_texto and vaga is None:
+                self.send_error(404, "Vaga não encontrada")
+                return
+
+            resultado = []
+            try:
+                if BACKEND_ARMAZENAMENTO == 'binario':
+                    linhas = consultar_intervalo_binario(inicio, fim, limite, vaga.id if vaga else None)
+                elif vaga is not None:
+                    linhas = consultar_intervalo(arquivo_vaga(vaga.id), inicio, fim, limite)
+                else:
+                    linhas = consultar_intervalo(ARQUIVO_UNIFICADO, inicio, fim, limite,
+                                                 lambda l: len(l) >= 6 and l[1] == 'leitura')
+                if vaga is not None:
+                    for linha in linhas:
+                        if len(linha) >= 4:
+                            resultado.append({'timestamp': linha[0], 'distancia': linha[1],
+                                              'estado': linha[2], 'muito_proximo': linha[3],
+                                              'confianca': linha[4] if len(linha) > 4 else ''})
+                else:
+                    # Sem vaga: leituras de todas as vagas, no layout do unificado
+                    for linha in linhas:
+                        resultado.append({'timestamp': linha[0], 'vaga': linha[2], 'distancia': linha[3],
+                                          'estado': linha[4], 'muito_proximo': linha[5],
+                                          'confianca': linha[8] if len(linha) > 8 else ''})
+            except Exception as e:
+                print(f"Erro na consulta de histórico: {e}")
+
+            self._responder_json(resultado)
+            return
+
+        elif path == '/api/estatisticas':
+            # Agregados por vaga: ?vaga=&resolucao=minuto|hora|dia&from=&to=
+            query = parse_qs(parsed_path.query)
+            resolucao = query.get('resolucao', ['hora'])[0]
+            if resolucao not in agregados.RESOLUCOES:
+                self.send_error(400, "resolucao deve ser minuto, hora ou dia")
+                return
+            try:
+                if 'from' in query:
+                    inicio = _ler_instante_consulta(query['from'][0])
+                else:
+                    inicio = time.time() - JANELA_PADRAO_ESTATISTICAS[resolucao]
+                fim = _ler_instante_consulta(query['to'][0]) if 'to' in query else None
+            except ValueError as e:
+                self.send_error(400, f"Parâmetro inválido: {e}")
+                return
+            id_texto = query.get('vaga', [''])[0].replace('vaga', '')
+            vaga = registro.por_id.get(int(id_texto)) if id_texto.isdigit() else None
+            if id_texto and vaga is None:
+                self.send_error(404, "Vaga não encontrada")
+                return
+
+            descarregar_logs()
             with cache_vagas_lock:
-                cache_snapshot = {
-                    'timestamp': estado_vagas_cache.get('timestamp'),
-                    'vaga1': dict(estado_vagas_cache.get('vaga1', {})),
-                    'vaga2': dict(estado_vagas_cache.get('vaga2', {})),
-                }
+                abertos = agregador.abertos(resolucao)
+            # O início do bucket que contém `inicio` também entra
+            inicio_bucket = agregados.limites_bucket(resolucao, inicio)[0]
+            registros = agregados.ler(DIRETORIO_DADOS, resolucao, inicio_bucket, fim,
+                                      vaga.id if vaga else None, abertos)
+            self._responder_json([agregados.como_dict(r) for r in registros])
+            return
 
-            # Este endpoint agora apenas lê o cache.
-            # O fallback foi removido, pois o loop principal (loop_estacionamento)
-            # é o único responsável por popular o cache.
-            payload = cache_snapshot
-            
+        elif path.startswith('/api/sessoes'):
+            self._responder_sessoes(path, parse_qs(parsed_path.query))
+            return
+
+        elif path == '/api/parking/status':
+            # Snapshot já serializado pelo loop (loop_estacionamento):
+            # sem lock e sem json.dumps por requisição
+            _, corpo, etag = snapshot_status
+            cabecalhos = (('ETag', etag), ('Cache-Control', 'no-cache'))
+            if etag_corresponde(self.headers.get('If-None-Match'), etag):
+                self.send_response(304)
+                for nome, valor in cabecalhos:
+                    self.send_header(nome, valor)
+                self.end_headers()
+                return
+            self._responder(corpo, 'application/json', cabecalhos=cabecalhos)
+            return
+        
+        elif path == '/api/parking/stream':
+            if len(transmissor) >= transmissor.max_clientes:
+                self.send_error(503, "Limite de clientes do stream atingido")
+                return
             self.send_response(200)
-            self.send_header('Content-type', 'application/json')
+            self.send_header('Content-Type', 'text/event-stream')
+            self.send_header('Cache-Control', 'no-cache')
             self.end_headers()
-            self.wfile.write(json.dumps(payload).encode())
+            # A conexão passa a ser do transmissor: o servidor não a fecha
+            self.close_connection = True
+            self.desanexado = transmissor.inscrever(self.connection)
             return
-        
+
+        elif path == '/api/metricas':
+            with metricas_lock:
+                payload = {
+                    'varredura': dict(metricas_varredura),
+                    'log': dict(metricas_log, profundidade_fila=log_queue.qsize()),
+                }
+            payload['fila'] = {
+                'capacidade': log_queue.maxsize,
+                'politica': log_queue.politica,
+                'descartados': log_queue.descartados,
+                'coalescidos': log_queue.coalescidos,
+            }
+            payload['stream'] = {'clientes': len(transmissor), 'descartados': transmissor.descartados}
+            payload['amostragem'] = {vaga.chave: amostragem.como_dict(vaga.slot) for vaga in registro}
+            self._responder_json(payload)
+            return
+
         elif path == '/api/led':
             
             # Obter parâmetros da URL
@@ -1031,61 +3136,36 @@ class SensorHTTPHandler(http.server.SimpleHTTPRequestHandler):
             
             # OTIMIZAÇÃO: Esta função agora é assíncrona (muito rápida)
             registrar_acao_led(led_status)
+            transmissor.publicar_led(led_status)
             
             # Enviar resposta
-            self.send_response(200)
-            self.send_header('Content-type', 'application/json')
-            self.end_headers()
-            self.wfile.write(json.dumps({'estado': 1 if led_status else 0}).encode())
+            self._responder_json({'estado': 1 if led_status else 0})
             return
 
         elif path == '/api/led/status':
-            self.send_response(200)
-            self.send_header('Content-type', 'application/json')
-            self.end_headers()
-            self.wfile.write(json.dumps({'estado': 1 if led_status else 0}).encode())
+            self._responder_json({'estado': 1 if led_status else 0})
             return
         
         # Endpoints de download dos arquivos CSV (sem alterações)
-        elif path == '/download/leituras_vaga1.csv':
-            if os.path.exists(ARQUIVO_VAGA1):
+        elif path.startswith('/download/leituras_vaga') and path.endswith('.csv'):
+            vaga = None
+            id_texto = path[len('/download/leituras_vaga'):-len('.csv')]
+            if id_texto.isdigit():
+                vaga = registro.por_id.get(int(id_texto))
+            if vaga is not None and self._log_disponivel(arquivo_vaga(vaga.id)):
                 try:
-                    self.send_response(200)
-                    self.send_header('Content-Type', 'text/csv')
-                    self.send_header('Content-Disposition', 'attachment; filename="leituras_vaga1.csv"')
-                    self.end_headers()
-                    with open(ARQUIVO_VAGA1, 'rb') as f:
-                        self.wfile.write(f.read())
+                    self._enviar_csv(arquivo_vaga(vaga.id), f"leituras_vaga{vaga.id}.csv",
+                                     _chave_vaga, self._expandir(parsed_path))
                 except Exception as e:
-                    print(f"Erro ao enviar leituras CSV da vaga 1: {e}")
+                    print(f"Erro ao enviar leituras CSV da vaga {vaga.id}: {e}")
                     self.send_error(500, "Erro ao enviar arquivo")
             else:
-                self.send_error(404, "Arquivo de leituras da vaga 1 não encontrado")
-            return
-        elif path == '/download/leituras_vaga2.csv':
-            if os.path.exists(ARQUIVO_VAGA2):
-                try:
-                    self.send_response(200)
-                    self.send_header('Content-Type', 'text/csv')
-                    self.send_header('Content-Disposition', 'attachment; filename="leituras_vaga2.csv"')
-                    self.end_headers()
-                    with open(ARQUIVO_VAGA2, 'rb') as f:
-                        self.wfile.write(f.read())
-                except Exception as e:
-                    print(f"Erro ao enviar leituras CSV da vaga 2: {e}")
-                    self.send_error(500, "Erro ao enviar arquivo")
-            else:
-                self.send_error(404, "Arquivo de leituras da vaga 2 não encontrado")
+                self.send_error(404, f"Arquivo de leituras da vaga {id_texto} não encontrado")
             return
         elif path == '/download/led':
-            if os.path.exists(ARQUIVO_ACOES_LED):
+            if self._log_disponivel(ARQUIVO_ACOES_LED):
                 try:
-                    self.send_response(200)
-                    self.send_header('Content-Type', 'text/csv')
-                    self.send_header('Content-Disposition', 'attachment; filename="acoes_led.csv"')
-                    self.end_headers()
-                    with open(ARQUIVO_ACOES_LED, 'rb') as f:
-                        self.wfile.write(f.read())
+                    self._enviar_csv(ARQUIVO_ACOES_LED, "acoes_led.csv", None, False)
                 except Exception as e:
                     print(f"Erro ao enviar ações LED CSV: {e}")
                     self.send_error(500, "Erro ao enviar arquivo")
@@ -1093,14 +3173,10 @@ class SensorHTTPHandler(http.server.SimpleHTTPRequestHandler):
                 self.send_error(404, "Arquivo de ações do LED não encontrado")
             return
         elif path == '/download/eventos':
-            if os.path.exists(ARQUIVO_EVENTOS):
+            if self._log_disponivel(ARQUIVO_EVENTOS):
                 try:
-                    self.send_response(200)
-                    self.send_header('Content-Type', 'text/csv')
-                    self.send_header('Content-Disposition', 'attachment; filename="historico_completo.csv"')
-                    self.end_headers()
-                    with open(ARQUIVO_EVENTOS, 'rb') as f:
-                        self.wfile.write(f.read())
+                    self._enviar_csv(ARQUIVO_EVENTOS, "historico_completo.csv",
+                                     _chave_eventos, self._expandir(parsed_path))
                 except Exception as e:
                     print(f"Erro ao enviar eventos CSV: {e}")
                     self.send_error(500, "Erro ao enviar arquivo")
@@ -1108,14 +3184,10 @@ class SensorHTTPHandler(http.server.SimpleHTTPRequestHandler):
                 self.send_error(404, "Arquivo de histórico consolidado não encontrado")
             return
         elif path == '/download/unificado':
-            if os.path.exists(ARQUIVO_UNIFICADO):
+            if self._log_disponivel(ARQUIVO_UNIFICADO):
                 try:
-                    self.send_response(200)
-                    self.send_header('Content-Type', 'text/csv')
-                    self.send_header('Content-Disposition', 'attachment; filename="historico_unificado.csv"')
-                    self.end_headers()
-                    with open(ARQUIVO_UNIFICADO, 'rb') as f:
-                        self.wfile.write(f.read())
+                    self._enviar_csv(ARQUIVO_UNIFICADO, "historico_unificado.csv",
+                                     _chave_unificado, self._expandir(parsed_path))
                 except Exception as e:
                     print(f"Erro ao enviar unificado CSV: {e}")
                     self.send_error(500, "Erro ao enviar arquivo")
@@ -1129,6 +3201,101 @@ class SensorHTTPHandler(http.server.SimpleHTTPRequestHandler):
 
 # Função para leitura contínua do sensor (REMOVIDA)
 
+# ====================== Servidor HTTP concorrente ====================== #
+class ServidorHTTPConcorrente(socketserver.TCPServer):
+    """
+    TCPServer que atende as requisições em um pool de MAX_WORKERS_HTTP
+    threads. Conexões keep-alive ociosas ficam num seletor (sem ocupar
+    worker) e voltam ao pool quando chega a próxima requisição; são
+    fechadas após TIMEOUT_KEEPALIVE_S sem uso. Acima de MAX_CONEXOES_HTTP
+    conexões abertas, as novas recebem 503.
+    """
+    allow_reuse_address = True
+    request_queue_size = 64
+
+    def __init__(self, endereco, handler, max_workers=None, max_conexoes=None):
+        super().__init__(endereco, handler)
+        self.pool = ThreadPoolExecutor(max_workers=max_workers or MAX_WORKERS_HTTP,
+                                       thread_name_prefix='http')
+        self.vagas_conexao = threading.BoundedSemaphore(max_conexoes or MAX_CONEXOES_HTTP)
+        self.seletor_ociosas = selectors.DefaultSelector()
+        self.ociosas = {}          # socket -> instante em que ficou ociosa
+        self.a_estacionar = []     # conexões devolvidas pelos workers
+        self.lock_estacionar = threading.Lock()
+        self._despertar_r, self._despertar_w = socket.socketpair()
+        self._despertar_r.setblocking(False)
+        self.seletor_ociosas.register(self._despertar_r, selectors.EVENT_READ)
+        self._ativo = True
+        threading.Thread(target=self._vigiar_ociosas, daemon=True).start()
+
+    def process_request(self, request, client_address):
+        if not self.vagas_conexao.acquire(blocking=False):
+            try:
+                request.sendall(b"HTTP/1.1 503 Service Unavailable\r\n"
+                                b"Content-Length: 0\r\nConnection: close\r\nRetry-After: 1\r\n\r\n")
+            except OSError:
+                pass
+            self.shutdown_request(request)
+            return
+        self.pool.submit(self._atender, request, client_address)
+
+    def finish_request(self, request, client_address):
+        return self.RequestHandlerClass(request, client_address, self)
+
+    def _atender(self, request, client_address):
+        manter = False
+        try:
+            handler = self.finish_request(request, client_address)
+            if getattr(handler, 'desanexado', False):
+                # Stream SSE: o socket agora é do transmissor
+                self.vagas_conexao.release()
+                return
+            manter = not handler.close_connection and self._ativo
+        except Exception:
+            self.handle_error(request, client_address)
+        if manter:
+            with self.lock_estacionar:
+                self.a_estacionar.append((request, client_address))
+            self._despertar_w.send(b'\0')
+        else:
+            self._fechar(request)
+
+    def _fechar(self, request):
+        self.shutdown_request(request)
+        self.vagas_conexao.release()
+
+    def _vigiar_ociosas(self):
+        while self._ativo:
+            for chave, _ in self.seletor_ociosas.select(timeout=1.0):
+                if chave.fileobj is self._despertar_r:
+                    try:
+                        self._despertar_r.recv(4096)
+                    except BlockingIOError:
+                        pass
+                    continue
+                # Chegou uma nova requisição: volta para o pool
+                self.seletor_ociosas.unregister(chave.fileobj)
+                self.ociosas.pop(chave.fileobj, None)
+                self.pool.submit(self._atender, chave.fileobj, chave.data)
+
+            with self.lock_estacionar:
+                novas, self.a_estacionar = self.a_estacionar, []
+            agora = time.monotonic()
+            for request, client_address in novas:
+                self.ociosas[request] = agora
+                self.seletor_ociosas.register(request, selectors.EVENT_READ, client_address)
+
+            for request, desde in list(self.ociosas.items()):
+                if agora - desde > TIMEOUT_KEEPALIVE_S:
+                    self.seletor_ociosas.unregister(request)
+                    del self.ociosas[request]
+                    self._fechar(request)
+
+    def server_close(self):
+        self._ativo = False
+        super().server_close()
+        self.pool.shutdown(wait=False)
+
 # Função para iniciar o servidor HTTP
 def iniciar_servidor():
     handler = SensorHTTPHandler
@@ -1143,15 +3310,24 @@ def iniciar_servidor():
     # Inicia thread do loop de estacionamento (duas vagas)
     thread_parking = threading.Thread(target=loop_estacionamento, daemon=True)
     thread_parking.start()
+
+    # Thread única que envia os eventos do /api/parking/stream
+    transmissor.publicar_led(led_status)
+    thread_stream = threading.Thread(target=transmissor.executar, daemon=True)
+    thread_stream.start()
     
     # ==========================================================
     #     NOVO: Inicia thread de logging
     # ==========================================================
     thread_logger = threading.Thread(target=log_writer, daemon=True)
     thread_logger.start()
+
+    # Compressão dos segmentos rotacionados e retenção
+    thread_manutencao = threading.Thread(target=manutencao_logs, daemon=True)
+    thread_manutencao.start()
     
     # Configura o servidor para aceitar conexões de qualquer endereço IP
-    with socketserver.TCPServer(("0.0.0.0", PORT), handler) as httpd:
+    with ServidorHTTPConcorrente(("0.0.0.0", PORT), handler) as httpd:
         print(f"Servidor iniciado na porta {PORT}")
         print(f"Acesse http://localhost:{PORT} ou http://<IP-DA-RASPBERRY>:{PORT} no navegador")
         
@@ -1169,8 +3345,18 @@ if __name__ == "__main__":
         # Suporte a argumento de linha de comando para porta
         parser = argparse.ArgumentParser(description="Servidor Lite do monitor de estacionamento")
         parser.add_argument("--port", type=int, default=PORT, help="Porta do servidor HTTP (default: %(default)s)")
+        parser.add_argument("--vagas", default=ARQUIVO_CONFIG_VAGAS, help="Arquivo JSON do registro de vagas (default: %(default)s)")
+        parser.add_argument("--armazenamento", choices=('csv', 'binario'), default=BACKEND_ARMAZENAMENTO,
+                            help="Backend de gravação das leituras (default: %(default)s)")
+        parser.add_argument("--workers", type=int, default=MAX_WORKERS_HTTP, help="Threads do servidor HTTP (default: %(default)s)")
+        parser.add_argument("--max-conexoes", type=int, default=MAX_CONEXOES_HTTP, help="Conexões simultâneas (default: %(default)s)")
         args = parser.parse_args()
         PORT = args.port
+        BACKEND_ARMAZENAMENTO = args.armazenamento
+        MAX_WORKERS_HTTP = args.workers
+        MAX_CONEXOES_HTTP = args.max_conexoes
+        if args.vagas != ARQUIVO_CONFIG_VAGAS:
+            carregar_vagas(args.vagas)
 
         # Inicia o servidor
         print("Iniciando servidor web simplificado (OTIMIZADO)...")
@@ -1179,6 +3365,9 @@ if __name__ == "__main__":
     except KeyboardInterrupt:
         print("\nEncerrando o programa...")
     finally:
+        # Grava o que ainda estiver nos buffers de log
+        gravar_agregados_parciais()
+        descarregar_logs(fsync=True)
         # Limpa os recursos
         # O `sensor.cleanup()` agora limpa TODOS os pinos GPIO
         # usados, incluindo os do estacionamento e o LED_PIN 18.
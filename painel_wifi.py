@@ -1,6 +1,10 @@
 #!/usr/bin/env python3
 
+import queue
+import signal
 import subprocess
+import sys
+import threading
 import time
 import board
 import busio
@@ -10,12 +14,16 @@ import RPi.GPIO as GPIO
 import psutil
 from enum import Enum, auto
 
+from info_sistema import ColetorSistema, ObservadorWifi
+from renderizador_oled import RenderizadorSSD1306
+import cache_texto
+
 
 # --- Configurações ---
 DISPLAY_WIDTH = 128
 DISPLAY_HEIGHT = 64
 CARROSSEL_INTERVAL = 3  # Segundos por página do carrossel
-MENU_REDRAW_SLEEP = 0.1 # 100ms de pausa no menu
+MENU_REDRAW_SLEEP = 0.1 # 100ms: acompanhamento do nmcli durante a conexão
 FONT_PATH = "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf"
 FONT_SIZE = 9
 
@@ -26,6 +34,11 @@ PIN_ENTER = 22
 
 # Debounce time para botões (em segundos)
 DEBOUNCE_TIME = 0.05
+# Auto-repetição de CIMA/BAIXO segurados (percorrer o CHARSET)
+REPETICAO_ATRASO = 0.5      # segurar esse tempo para começar a repetir
+REPETICAO_INTERVALO = 0.08  # um evento a cada intervalo enquanto segurado
+# Espera máxima do loop sem eventos nem prazos (segurança)
+ESPERA_MAXIMA = 1.0
 
 # Conjunto de caracteres para senha
 CHARSET = "abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789 !@#$%^&*()_+-=[]{}|;':\",./<>?"
@@ -38,6 +51,13 @@ PROJECT_AUTHORS = "Pedro Augusto & Nicholas"
 SPLASH_SECONDS = 2.5  # tempo que a tela fica visível
 
 
+# --- Eventos do loop principal ---
+# Fila única: pinos dos botões (pressionados ou auto-repetidos) e mudanças
+# do Wi-Fi. O loop bloqueia nela até um evento ou o próximo prazo da tela.
+EVENTO_WIFI = "wifi"
+eventos_painel = queue.Queue()
+
+
 # --- Estados do Programa ---
 class EstadoPrograma(Enum):
     CARROSSEL = auto()
@@ -59,47 +79,47 @@ def run_command(command):
 # --- Funções de Dados (Tradução das funções C) ---
 
 def is_wifi_connected():
-    """Verifica se o Wi-Fi está conectado."""
-    ssid = run_command("iwgetid -r")
-    return ssid is not None and ssid != ""
+    """Verifica se o Wi-Fi está conectado (estado publicado pelo observador)."""
+    return observador.conectado
+
+# Dados do carrossel: lidos do cache do coletor (renovado em segundo plano,
+# cada campo com o seu TTL), sem abrir processos a cada redesenho
+coletor = ColetorSistema()
+
+# Conexão Wi-Fi acompanhada por eventos do kernel (netlink); ao mudar, os
+# dados de rede do carrossel são relidos sem esperar o TTL
+def _wifi_mudou(conectado):
+    coletor.invalidar('ssid', 'ip', 'sinal')
+    eventos_painel.put(EVENTO_WIFI)  # acorda o loop para trocar de tela
+
+observador = ObservadorWifi(ao_mudar=_wifi_mudou)
 
 def get_wifi_signal():
     """Obtém o nível do sinal Wi-Fi."""
-    output = run_command("iwconfig wlan0 | grep 'Signal level'")
-    if output:
-        try:
-            signal = output.split("Signal level=")[1].split(" dBm")[0]
-            return f"Sinal: {signal} dBm"
-        except IndexError: pass
-    output_proc = run_command("cat /proc/net/wireless | tail -n 1 | awk '{print $3}' | sed 's/\\.//'")
-    if output_proc: return f"Sinal: ~{output_proc}%"
+    nivel, qualidade = coletor.valor('sinal', (None, None))
+    if nivel is not None: return f"Sinal: {nivel} dBm"
+    if qualidade is not None: return f"Sinal: ~{qualidade}%"
     return "Sinal: N/A"
 
 def get_ssh_status():
     """Verifica o estado do serviço SSH."""
-    result = subprocess.run("systemctl is-active ssh", shell=True, capture_output=True, text=True, check=False)
-    return "ATIVO" if result.returncode == 0 else "INATIVO"
+    return "ATIVO" if coletor.valor('ssh_ativo') else "INATIVO"
 
 def get_ip_address():
     """Obtém o endereço IP da Raspberry."""
-    ip = run_command("hostname -I | awk '{print $1}'")
-    return ip if ip else "N/A"
+    return coletor.valor('ip') or "N/A"
 
 def get_network_name():
     """Obtém o nome da rede conectada."""
-    ssid = run_command("iwgetid -r")
-    return ssid if ssid else "N/A"
+    return coletor.valor('ssid') or "N/A"
 
 def get_hostname():
     """Obtém o hostname."""
-    hostname = run_command("hostname")
-    return hostname if hostname else "N/A"
+    return coletor.valor('hostname') or "N/A"
 
 def get_num_ssh():
     """Obtém o número de utilizadores SSH."""
-    count_str = run_command("who | grep pts | wc -l")
-    try: return int(count_str) if count_str else 0
-    except ValueError: return 0
+    return coletor.valor('usuarios_ssh', 0)
 
 def get_ssids():
     """Obtém a lista de SSIDs disponíveis usando nmcli."""
@@ -150,12 +170,11 @@ def connect_to_wifi(ssid, password):
 
 # --- Funções de Display ---
 def setup_display():
-    """Configura e inicializa o display OLED."""
+    """Configura e inicializa o display OLED (envio incremental dos quadros)."""
     try:
         i2c = busio.I2C(board.SCL, board.SDA)
-        disp = adafruit_ssd1306.SSD1306_I2C(DISPLAY_WIDTH, DISPLAY_HEIGHT, i2c)
-        disp.fill(0)
-        disp.show()
+        disp = RenderizadorSSD1306(adafruit_ssd1306.SSD1306_I2C(DISPLAY_WIDTH, DISPLAY_HEIGHT, i2c))
+        disp.limpar()
         image = Image.new("1", (disp.width, disp.height))
         draw = ImageDraw.Draw(image)
         try:
@@ -163,6 +182,8 @@ def setup_display():
         except IOError:
              print(f"Aviso: Fonte {FONT_PATH} não encontrada, usando fonte padrão.")
              font = ImageFont.load_default()
+        # Glifos da tela de senha prontos antes do primeiro uso
+        cache_texto.pre_renderizar(font, CHARSET, anterior="*")
         return disp, image, draw, font
     except Exception as e:
         print(f"Erro Crítico: Display I2C: {e}")
@@ -172,48 +193,22 @@ def display_clear(draw, disp, image):
     draw.rectangle((0, 0, disp.width, disp.height), outline=0, fill=0)
 
 def display_text(draw, font, text, x, y, wrap=False, max_width=DISPLAY_WIDTH):
-    """Desenha texto no buffer, com quebra de linha opcional."""
+    """Desenha texto no buffer, com quebra de linha opcional (layouts e bitmaps em cache)."""
     if wrap:
-        lines = []
-        words = text.split(' ')
-        current_line = ""
-        for word in words:
-            # Verifica se a palavra cabe na linha atual
-            test_line = f"{current_line} {word}".strip()
-            bbox = font.getbbox(test_line)
-            text_width = bbox[2] - bbox[0] # Largura calculada
-            if text_width <= max_width:
-                current_line = test_line
-            else:
-                # Palavra não cabe, começa nova linha
-                lines.append(current_line)
-                current_line = word
-                bbox_word = font.getbbox(word)
-                if bbox_word[2] - bbox_word[0] > max_width: # Palavra maior que a linha
-                     # Truncar palavra (poderia implementar quebra no meio)
-                     # Por agora, apenas truncamos
-                     while font.getbbox(current_line)[2] - font.getbbox(current_line)[0] > max_width:
-                          current_line = current_line[:-1]
-                     current_line += "..."
-
-
-        lines.append(current_line) # Adiciona a última linha
-
-        # Desenha as linhas
-        line_height = font.getbbox("A")[3] - font.getbbox("A")[1] + 2 # Altura aproximada
-        for i, line in enumerate(lines):
-            draw.text((x, y + i * line_height), line, font=font, fill=255)
+        # Palavra maior que a linha é truncada com "..."
+        line_height = cache_texto.altura_linha(font)
+        for i, line in enumerate(cache_texto.quebrar_linhas(font, text, max_width)):
+            cache_texto.desenhar(draw, font, line, x, y + i * line_height)
     else:
         # Desenho simples sem quebra
-        draw.text((x, y), text, font=font, fill=255)
+        cache_texto.desenhar(draw, font, text, x, y)
 
 
 def draw_centered_text(draw, font, text, y, disp_width=DISPLAY_WIDTH):
     """Desenha uma linha de texto centralizada no eixo X."""
-    bbox = font.getbbox(text)
-    w = bbox[2] - bbox[0]
+    w = cache_texto.largura(font, text)
     x = max(0, (disp_width - w) // 2)
-    draw.text((x, y), text, font=font, fill=255)
+    cache_texto.desenhar(draw, font, text, x, y)
 
 def show_splash(disp, image, draw, font):
     """Exibe a tela de abertura com nome do projeto e autores."""
@@ -238,9 +233,16 @@ def show_splash(disp, image, draw, font):
 
 
 def display_show(disp, image):
-    """Envia o buffer para o display."""
-    disp.image(image)
-    disp.show()
+    """Envia o buffer para o display (só o que mudou desde o último envio)."""
+    disp.enviar(image)
+
+def mostrar_estatisticas_display(disp):
+    """Tráfego I2C do display: bytes enviados x o que custariam os quadros completos."""
+    estatisticas = disp.como_dict()
+    economia = estatisticas['economia']
+    print(f"Display: {estatisticas['quadros']} quadros ({estatisticas['quadros_iguais']} iguais), "
+          f"{estatisticas['bytes_enviados']} de {estatisticas['bytes_completos']} bytes enviados"
+          + (f" (economia de {economia * 100:.1f}%)" if economia is not None else ""))
 
 # --- Funções de GPIO ---
 def setup_gpio():
@@ -252,46 +254,102 @@ def setup_gpio():
     GPIO.setup(PIN_BAIXO, GPIO.IN, pull_up_down=GPIO.PUD_DOWN)
     GPIO.setup(PIN_ENTER, GPIO.IN, pull_up_down=GPIO.PUD_DOWN)
 
-def read_button_debounced(pin, button_states):
-    """Lê um botão com debounce simples baseado em tempo."""
-    current_state = GPIO.input(pin)
-    now = time.monotonic()
-    pressed = False
-
-    # Acessa estado anterior e info de debounce
-    last_state, last_time, debounce_info = button_states.get(pin, (GPIO.LOW, now, {'debounced': False})) # Usa .get para segurança
-
-    if current_state != last_state:
-        # Estado mudou, reinicia timer e estado debounced
-        button_states[pin] = (current_state, now, {'debounced': False})
-    elif current_state == GPIO.HIGH: # Estado está ALTO (pressionado)
-        # Verifica se tempo suficiente passou E se já não foi registado
-        if now - last_time > DEBOUNCE_TIME and not debounce_info.get('debounced', False):
-            pressed = True
-            # Marca que já registou este pressionar
-            button_states[pin] = (current_state, last_time, {'debounced': True}) # Mantém last_time original do início do press
-    elif current_state == GPIO.LOW:
-         # Botão solto, reseta a flag 'debounced' se necessário
-         if debounce_info.get('debounced', True): # Reseta se estava True ou se nunca foi definido
-              button_states[pin] = (current_state, now, {'debounced': False}) # Atualiza last_time para o momento do release
-
-    return pressed
+class BotoesGPIO:
+    """
+    Botões por interrupção: callbacks de borda do GPIO (nas duas bordas),
+    debounce por software e auto-repetição enquanto CIMA/BAIXO ficam
+    pressionados. Cada aperto vira o número do pino na fila de eventos.
+
+    Debounce: o aperto vale na primeira borda com o pino em HIGH; cada
+    borda (re)inicia um timer de DEBOUNCE_TIME e, quando ele dispara, o
+    nível já assentado decide o estado do botão. A soltura nunca se perde
+    no ruído do contato: a última borda sempre leva a uma releitura.
+    """
+
+    def __init__(self, pinos, fila, repetir=()):
+        self.pinos = pinos
+        self.fila = fila
+        self.repetir = set(repetir)
+        self.pressionado = {pin: False for pin in pinos}
+        self.timers = {}              # auto-repetição
+        self.timers_assentamento = {}
+        self.lock = threading.Lock()  # bordas (thread do RPi.GPIO) x timers
+
+    def iniciar(self):
+        for pin in self.pinos:
+            GPIO.add_event_detect(pin, GPIO.BOTH, callback=self._borda)
+
+    def _borda(self, pin):
+        """Chamado na thread de eventos do RPi.GPIO."""
+        with self.lock:
+            if GPIO.input(pin) == GPIO.HIGH and not self.pressionado[pin]:
+                self._pressionar(pin)
+            timer = self.timers_assentamento.pop(pin, None)
+            if timer is not None:
+                timer.cancel()
+            timer = threading.Timer(DEBOUNCE_TIME, self._assentar, args=(pin,))
+            timer.daemon = True
+            self.timers_assentamento[pin] = timer
+            timer.start()
+
+    def _assentar(self, pin):
+        """DEBOUNCE_TIME sem bordas: o nível lido agora é o estado do botão."""
+        with self.lock:
+            self.timers_assentamento.pop(pin, None)
+            nivel = GPIO.input(pin)
+            if nivel == GPIO.HIGH and not self.pressionado[pin]:
+                self._pressionar(pin)
+            elif nivel == GPIO.LOW and self.pressionado[pin]:
+                self.pressionado[pin] = False
+                timer = self.timers.pop(pin, None)
+                if timer is not None:
+                    timer.cancel()
+
+    def _pressionar(self, pin):
+        self.pressionado[pin] = True
+        self.fila.put(pin)
+        if pin in self.repetir:
+            self._agendar_repeticao(pin, REPETICAO_ATRASO)
+
+    def _agendar_repeticao(self, pin, atraso):
+        timer = threading.Timer(atraso, self._repetir, args=(pin,))
+        timer.daemon = True
+        self.timers[pin] = timer
+        timer.start()
+
+    def _repetir(self, pin):
+        with self.lock:
+            if self.timers.get(pin) is None or not self.pressionado[pin]:
+                return  # soltou (timer cancelado tarde demais)
+            if GPIO.input(pin) == GPIO.HIGH:
+                self.fila.put(pin)
+                self._agendar_repeticao(pin, REPETICAO_INTERVALO)
+
+
+def esperar_evento(espera):
+    """Próximo evento da fila, esperando até `espera` segundos (None se não houver)."""
+    try:
+        if espera <= 0:
+            return eventos_painel.get_nowait()
+        return eventos_painel.get(timeout=espera)
+    except queue.Empty:
+        return None
 
 # --- MAIN ---
 def main():
 
     disp, image, draw, font = setup_display()
     setup_gpio()
+    coletor.iniciar()
+    observador.iniciar()
 
     # Tela inicial do projeto (splash)
     show_splash(disp, image, draw, font)
 
-    # Estado inicial dos botões para debounce
-    button_states = {
-        PIN_CIMA: (GPIO.LOW, time.monotonic(), {'debounced': False}),
-        PIN_BAIXO: (GPIO.LOW, time.monotonic(), {'debounced': False}),
-        PIN_ENTER: (GPIO.LOW, time.monotonic(), {'debounced': False}),
-    }
+    # Botões por interrupção (alimentam a fila de eventos)
+    botoes = BotoesGPIO((PIN_CIMA, PIN_BAIXO, PIN_ENTER), eventos_painel, repetir=(PIN_CIMA, PIN_BAIXO))
+    botoes.iniciar()
+    espera = 0.0 # Primeira iteração desenha sem esperar
 
     # --- Variáveis de Estado ---
     estado = EstadoPrograma.CARROSSEL
@@ -314,289 +372,298 @@ def main():
     senha_tentando = ""
 
 
+    # systemd para o serviço com SIGTERM: sai pelo finally (limpeza + estatísticas)
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+
     print("Programa iniciado. Use os botões. Pressione ENTER no menu principal para sair.")
 
-    while True:
-        # --- 1. Ler Botões ---
-        cima_pressed = read_button_debounced(PIN_CIMA, button_states)
-        baixo_pressed = read_button_debounced(PIN_BAIXO, button_states)
-        enter_pressed = read_button_debounced(PIN_ENTER, button_states)
-
-        # --- 2. Lógica Principal de Estados ---
-        current_time = time.time()
-        needs_redraw_this_iteration = False
-
-        # Verifica conexão e define o estado base
-        wifi_ok = is_wifi_connected()
-
-        # ====================================================================
-        #                      ESTADO: WI-FI CONECTADO (CARROSSEL)
-        # ====================================================================
-        if wifi_ok and estado not in [EstadoPrograma.CONECTANDO, EstadoPrograma.CONECTADO_MSG]:
-            if estado != EstadoPrograma.CARROSSEL:
-                estado = EstadoPrograma.CARROSSEL
-                redes_escaneadas = False
-                last_display_update = 0
-                needs_redraw_this_iteration = True
-
-            if needs_redraw_this_iteration or (current_time - last_display_update >= CARROSSEL_INTERVAL):
-                last_display_update = current_time
-                display_clear(draw, disp, image)
-
-                # Coleta e formata dados
-                network_name = get_network_name()
-                hostname = get_hostname()
-                num_ssh = get_num_ssh()
-                wifi_signal = get_wifi_signal()
-                ssh_status = get_ssh_status()
-                ip_address = get_ip_address()
-                WEB_PORT = 8001
-
-                line_rede = f"Rede: {network_name}"
-                line_host = f"Host: {hostname}"
-                line_ip = f"IP: {ip_address}:{WEB_PORT}" if ip_address != "N/A" else "IP: N/A"
-                line_ssh_status = f"SSH: {ssh_status}"
-                line_ssh_users = f"Users: {num_ssh}"
-
-                display_text(draw, font, "Status: CONECTADO", 0, 0)
-                if pagina_carrossel == 0:
-                    display_text(draw, font, line_rede, 0, 15)
-                    display_text(draw, font, line_host, 0, 30)
-                    display_text(draw, font, line_ip, 0, 45)
-                else:
-                    display_text(draw, font, wifi_signal, 0, 15)
-                    display_text(draw, font, line_ssh_status, 0, 30)
-                    display_text(draw, font, line_ssh_users, 0, 45)
-
-                pagina_carrossel = (pagina_carrossel + 1) % 2
-                display_show(disp, image)
-                needs_redraw_this_iteration = False # Acabámos de redesenhar
-
-        # ====================================================================
-        #                  ESTADO: WI-FI DESCONECTADO (MENU/SENHA/MENSAGENS)
-        # ====================================================================
-        # Bloco "rede/senha/conectar/mensagens temporárias"
-        # Bloco "rede/senha/conectar/mensagens temporárias"
-        elif (not wifi_ok) or (estado in [
-                EstadoPrograma.CONECTANDO,
-                EstadoPrograma.CONECTADO_MSG,
-                EstadoPrograma.FALHA_CONEXAO_MSG
-            ]):
-
-            # Gerencia transição e scan
-            if estado == EstadoPrograma.CARROSSEL:
-                estado = EstadoPrograma.MENU_REDE
-                item_menu_rede = 0
-                num_redes = 0
-                redes_escaneadas = False
-                needs_redraw_this_iteration = True
-                oled_clear_needed = True
-
-            if not redes_escaneadas and estado == EstadoPrograma.MENU_REDE:
-                 if oled_clear_needed: display_clear(draw, disp, image); oled_clear_needed = False
-                 display_text(draw, font, "A escanear...", 0, 20)
-                 display_show(disp, image)
-
-                 redes_encontradas = get_ssids() # Recebe a lista
-                 num_redes = len(redes_encontradas) if redes_encontradas[0] not in ["Erro ao escanear", "Nenhuma rede"] else 0
-                 redes_escaneadas = True
-                 oled_clear_needed = True # Força limpeza para desenhar o menu
-                 needs_redraw_this_iteration = True # Força redesenho do menu
-
-            # --- Processar Input dos Botões ---
-            action_taken = False
-            if estado == EstadoPrograma.MENU_REDE:
-                if cima_pressed and num_redes > 0:
-                    item_menu_rede = (item_menu_rede - 1 + num_redes) % num_redes
-                    oled_clear_needed = True; action_taken = True
-                elif baixo_pressed and num_redes > 0:
-                    item_menu_rede = (item_menu_rede + 1) % num_redes
-                    oled_clear_needed = True; action_taken = True
-                elif enter_pressed:
-                    if num_redes > 0:
-                        estado = EstadoPrograma.SENHA
-                        ssid_selecionado = redes_encontradas[item_menu_rede]
-                        senha_digitada = ""
-                        char_atual_index = 0
+    try:
+        while True:
+            # --- 1. Esperar Botões (ou o próximo prazo da tela) ---
+            evento = esperar_evento(espera)
+            cima_pressed = evento == PIN_CIMA
+            baixo_pressed = evento == PIN_BAIXO
+            enter_pressed = evento == PIN_ENTER
+
+            # --- 2. Lógica Principal de Estados ---
+            current_time = time.time()
+            needs_redraw_this_iteration = False
+
+            # Verifica conexão e define o estado base
+            wifi_ok = is_wifi_connected()
+
+            # ====================================================================
+            #                      ESTADO: WI-FI CONECTADO (CARROSSEL)
+            # ====================================================================
+            if wifi_ok and estado not in [EstadoPrograma.CONECTANDO, EstadoPrograma.CONECTADO_MSG]:
+                if estado != EstadoPrograma.CARROSSEL:
+                    estado = EstadoPrograma.CARROSSEL
+                    redes_escaneadas = False
+                    last_display_update = 0
+                    needs_redraw_this_iteration = True
+
+                if needs_redraw_this_iteration or (current_time - last_display_update >= CARROSSEL_INTERVAL):
+                    last_display_update = current_time
+                    display_clear(draw, disp, image)
+
+                    # Coleta e formata dados
+                    network_name = get_network_name()
+                    hostname = get_hostname()
+                    num_ssh = get_num_ssh()
+                    wifi_signal = get_wifi_signal()
+                    ssh_status = get_ssh_status()
+                    ip_address = get_ip_address()
+                    WEB_PORT = 8001
+
+                    line_rede = f"Rede: {network_name}"
+                    line_host = f"Host: {hostname}"
+                    line_ip = f"IP: {ip_address}:{WEB_PORT}" if ip_address != "N/A" else "IP: N/A"
+                    line_ssh_status = f"SSH: {ssh_status}"
+                    line_ssh_users = f"Users: {num_ssh}"
+
+                    display_text(draw, font, "Status: CONECTADO", 0, 0)
+                    if pagina_carrossel == 0:
+                        display_text(draw, font, line_rede, 0, 15)
+                        display_text(draw, font, line_host, 0, 30)
+                        display_text(draw, font, line_ip, 0, 45)
                     else:
-                        # Se não há redes, ENTER re-escaneia
-                        redes_escaneadas = False
-                    oled_clear_needed = True; action_taken = True
-
-            elif estado == EstadoPrograma.SENHA:
-                action_taken_senha = False # Flag local para saber se CIMA/BAIXO foi pressionado
-
-                if cima_pressed:
-                    char_atual_index = (char_atual_index + 1) % CHARSET_LEN
-                    oled_clear_needed = True; action_taken = True
-                    action_taken_senha = True # Marca que CIMA foi pressionado
-                elif baixo_pressed:
-                    char_atual_index = (char_atual_index - 1 + CHARSET_LEN) % CHARSET_LEN
-                    oled_clear_needed = True; action_taken = True
-                    action_taken_senha = True # Marca que BAIXO foi pressionado
-                elif enter_pressed:
-                    char_selecionado = CHARSET[char_atual_index]
-                    # Adiciona caractere ou finaliza
-                    if char_selecionado == '*': # Finaliza a senha
-                         if len(senha_digitada) > 0:
-                                estado = EstadoPrograma.CONECTANDO
-                                oled_clear_needed = True
-                                action_taken = True
-
-                                # salva os dados que vamos tentar
-                                ssid_tentando = ssid_selecionado
-                                senha_tentando = senha_digitada
-
-                                # inicia o processo de conexão ASSÍNCRONO
-                                ssid_escaped = ssid_tentando.replace('"', '\\"')
-                                password_escaped = senha_tentando.replace('"', '\\"')
-                                command = f'nmcli device wifi connect "{ssid_escaped}" password "{password_escaped}"'
-
-                                print(f"[DEBUG] Iniciando conexão async: {command}")
-                                processo_conexao = subprocess.Popen(
-                                    command,
-                                    shell=True,
-                                    stdout=subprocess.PIPE,
-                                    stderr=subprocess.PIPE,
-                                    text=True
-                                )
-                                # limpa a senha atual da caixa de digitação pra não reaparecer depois se falhar
-                                senha_digitada = ""
-                                char_atual_index = 0
-
-                    # Backspace (exemplo com '<')
-                    elif char_selecionado == '<':
-                         if len(senha_digitada) > 0:
-                              senha_digitada = senha_digitada[:-1]
-                              char_atual_index = 0 # Reseta caractere
-                              oled_clear_needed = True; action_taken = True
-                    # Adiciona caractere normal
-                    elif len(senha_digitada) < 63:
-                        senha_digitada += char_selecionado
-                        char_atual_index = 0 # Reseta para 'a'
-                        oled_clear_needed = True; action_taken = True
+                        display_text(draw, font, wifi_signal, 0, 15)
+                        display_text(draw, font, line_ssh_status, 0, 30)
+                        display_text(draw, font, line_ssh_users, 0, 45)
+
+                    pagina_carrossel = (pagina_carrossel + 1) % 2
+                    display_show(disp, image)
+                    needs_redraw_this_iteration = False # Acabámos de redesenhar
+
+            # ====================================================================
+            #                  ESTADO: WI-FI DESCONECTADO (MENU/SENHA/MENSAGENS)
+            # ====================================================================
+            # Bloco "rede/senha/conectar/mensagens temporárias"
+            # Bloco "rede/senha/conectar/mensagens temporárias"
+            elif (not wifi_ok) or (estado in [
+                    EstadoPrograma.CONECTANDO,
+                    EstadoPrograma.CONECTADO_MSG,
+                    EstadoPrograma.FALHA_CONEXAO_MSG
+                ]):
+
+                # Gerencia transição e scan
+                if estado == EstadoPrograma.CARROSSEL:
+                    estado = EstadoPrograma.MENU_REDE
+                    item_menu_rede = 0
+                    num_redes = 0
+                    redes_escaneadas = False
+                    needs_redraw_this_iteration = True
+                    oled_clear_needed = True
 
-                # --- ADICIONA ATRASO APÓS CIMA/BAIXO ---
-                if action_taken_senha:
-                    time.sleep(0.15) # Pausa de 150ms após CIMA ou BAIXO
-                # ----------------------------------------
+                if not redes_escaneadas and estado == EstadoPrograma.MENU_REDE:
+                     if oled_clear_needed: display_clear(draw, disp, image); oled_clear_needed = False
+                     display_text(draw, font, "A escanear...", 0, 20)
+                     display_show(disp, image)
 
-            # --- Redesenhar Display se Necessário ---
-            if needs_redraw_this_iteration or action_taken or oled_clear_needed:
-                if oled_clear_needed:
-                    display_clear(draw, disp, image)
-                    oled_clear_needed = False
+                     redes_encontradas = get_ssids() # Recebe a lista
+                     num_redes = len(redes_encontradas) if redes_encontradas[0] not in ["Erro ao escanear", "Nenhuma rede"] else 0
+                     redes_escaneadas = True
+                     oled_clear_needed = True # Força limpeza para desenhar o menu
+                     needs_redraw_this_iteration = True # Força redesenho do menu
 
+                # --- Processar Input dos Botões ---
+                action_taken = False
                 if estado == EstadoPrograma.MENU_REDE:
-                    titulo = f"Redes ({num_redes}):"
-                    display_text(draw, font, titulo, 0, 0)
-                    if num_redes == 0:
-                        display_text(draw, font, redes_encontradas[0], 0, 15) # Mostra "Nenhuma rede" ou "Erro"
-                        display_text(draw, font, "ENTER p/ scan", 0, 30)
-                    else:
-                        # Mostra 3 redes por vez, com scroll
-                        start_index = (item_menu_rede // 3) * 3
-                        for i in range(3):
-                            idx = start_index + i
-                            if idx < num_redes:
-                                prefixo = ">" if idx == item_menu_rede else " "
-                                nome_rede = redes_encontradas[idx]
-                                # Truncar nome se necessário
-                                if font.getbbox(nome_rede)[2] > DISPLAY_WIDTH - 10:
-                                     while font.getbbox(nome_rede + "...")[2] > DISPLAY_WIDTH - 10:
-                                          nome_rede = nome_rede[:-1]
-                                     nome_rede += "..."
-                                display_text(draw, font, f"{prefixo} {nome_rede}", 0, 15 + i * 15)
+                    if cima_pressed and num_redes > 0:
+                        item_menu_rede = (item_menu_rede - 1 + num_redes) % num_redes
+                        oled_clear_needed = True; action_taken = True
+                    elif baixo_pressed and num_redes > 0:
+                        item_menu_rede = (item_menu_rede + 1) % num_redes
+                        oled_clear_needed = True; action_taken = True
+                    elif enter_pressed:
+                        if num_redes > 0:
+                            estado = EstadoPrograma.SENHA
+                            ssid_selecionado = redes_encontradas[item_menu_rede]
+                            senha_digitada = ""
+                            char_atual_index = 0
+                        else:
+                            # Se não há redes, ENTER re-escaneia
+                            redes_escaneadas = False
+                        oled_clear_needed = True; action_taken = True
 
                 elif estado == EstadoPrograma.SENHA:
-                    titulo = f"Senha: {ssid_selecionado[:18]}" + ("..." if len(ssid_selecionado) > 18 else "")
-                    display_text(draw, font, titulo, 0, 0)
+                    # Segurar CIMA/BAIXO percorre o CHARSET (auto-repetição dos botões)
+                    if cima_pressed:
+                        char_atual_index = (char_atual_index + 1) % CHARSET_LEN
+                        oled_clear_needed = True; action_taken = True
+                    elif baixo_pressed:
+                        char_atual_index = (char_atual_index - 1 + CHARSET_LEN) % CHARSET_LEN
+                        oled_clear_needed = True; action_taken = True
+                    elif enter_pressed:
+                        char_selecionado = CHARSET[char_atual_index]
+                        # Adiciona caractere ou finaliza
+                        if char_selecionado == '*': # Finaliza a senha
+                             if len(senha_digitada) > 0:
+                                    estado = EstadoPrograma.CONECTANDO
+                                    oled_clear_needed = True
+                                    action_taken = True
+
+                                    # salva os dados que vamos tentar
+                                    ssid_tentando = ssid_selecionado
+                                    senha_tentando = senha_digitada
+
+                                    # inicia o processo de conexão ASSÍNCRONO
+                                    ssid_escaped = ssid_tentando.replace('"', '\\"')
+                                    password_escaped = senha_tentando.replace('"', '\\"')
+                                    command = f'nmcli device wifi connect "{ssid_escaped}" password "{password_escaped}"'
+
+                                    print(f"[DEBUG] Iniciando conexão async: {command}")
+                                    processo_conexao = subprocess.Popen(
+                                        command,
+                                        shell=True,
+                                        stdout=subprocess.PIPE,
+                                        stderr=subprocess.PIPE,
+                                        text=True
+                                    )
+                                    # limpa a senha atual da caixa de digitação pra não reaparecer depois se falhar
+                                    senha_digitada = ""
+                                    char_atual_index = 0
+
+                        # Backspace (exemplo com '<')
+                        elif char_selecionado == '<':
+                             if len(senha_digitada) > 0:
+                                  senha_digitada = senha_digitada[:-1]
+                                  char_atual_index = 0 # Reseta caractere
+                                  oled_clear_needed = True; action_taken = True
+                        # Adiciona caractere normal
+                        elif len(senha_digitada) < 63:
+                            senha_digitada += char_selecionado
+                            char_atual_index = 0 # Reseta para 'a'
+                            oled_clear_needed = True; action_taken = True
+
+                # --- Redesenhar Display se Necessário ---
+                if needs_redraw_this_iteration or action_taken or oled_clear_needed:
+                    if oled_clear_needed:
+                        display_clear(draw, disp, image)
+                        oled_clear_needed = False
+
+                    if estado == EstadoPrograma.MENU_REDE:
+                        titulo = f"Redes ({num_redes}):"
+                        display_text(draw, font, titulo, 0, 0)
+                        if num_redes == 0:
+                            display_text(draw, font, redes_encontradas[0], 0, 15) # Mostra "Nenhuma rede" ou "Erro"
+                            display_text(draw, font, "ENTER p/ scan", 0, 30)
+                        else:
+                            # Mostra 3 redes por vez, com scroll
+                            start_index = (item_menu_rede // 3) * 3
+                            for i in range(3):
+                                idx = start_index + i
+                                if idx < num_redes:
+                                    prefixo = ">" if idx == item_menu_rede else " "
+                                    # Truncar nome se necessário
+                                    nome_rede = cache_texto.truncar(font, redes_encontradas[idx], DISPLAY_WIDTH - 10)
+                                    display_text(draw, font, f"{prefixo} {nome_rede}", 0, 15 + i * 15)
 
-                    # Asteriscos + caractere atual
-                    display_text(draw, font, "*" * len(senha_digitada) + CHARSET[char_atual_index], 0, 20)
+                    elif estado == EstadoPrograma.SENHA:
+                        titulo = f"Senha: {ssid_selecionado[:18]}" + ("..." if len(ssid_selecionado) > 18 else "")
+                        display_text(draw, font, titulo, 0, 0)
 
-                    display_text(draw, font, "C/B: Muda", 0, 40)
-                    display_text(draw, font, "ENT: Add/'*'=OK", 0, 50)
-                    # Adicionar indicação de Backspace se implementado
+                        # Asteriscos + caractere atual (glifos pré-renderizados)
+                        cache_texto.desenhar_com_final(draw, font, "*" * len(senha_digitada), CHARSET[char_atual_index], 0, 20)
 
-                elif estado == EstadoPrograma.CONECTANDO:
-                     display_text(draw, font, "Conectando...", 0, 20)
-                     display_text(draw, font, ssid_selecionado, 0, 35)
+                        display_text(draw, font, "C/B: Muda", 0, 40)
+                        display_text(draw, font, "ENT: Add/'*'=OK", 0, 50)
+                        # Adicionar indicação de Backspace se implementado
 
-                elif estado == EstadoPrograma.CONECTADO_MSG:
-                     display_text(draw, font, "Conectado!", 0, 30)
+                    elif estado == EstadoPrograma.CONECTANDO:
+                         display_text(draw, font, "Conectando...", 0, 20)
+                         display_text(draw, font, ssid_selecionado, 0, 35)
 
-                elif estado == EstadoPrograma.FALHA_CONEXAO_MSG:
-                     display_text(draw, font, "Falha na conexão!", 0, 20)
-                     display_text(draw, font, "Verifique a senha.", 0, 35)
+                    elif estado == EstadoPrograma.CONECTADO_MSG:
+                         display_text(draw, font, "Conectado!", 0, 30)
 
+                    elif estado == EstadoPrograma.FALHA_CONEXAO_MSG:
+                         display_text(draw, font, "Falha na conexão!", 0, 20)
+                         display_text(draw, font, "Verifique a senha.", 0, 35)
 
-                display_show(disp, image)
 
-            # --- Transições de Estado Pós-Desenho ---
+                    display_show(disp, image)
 
-            if estado == EstadoPrograma.CONECTANDO:
-                # 1. já estamos conectados? (às vezes o Wi-Fi sobe antes do nmcli encerrar)
-                if is_wifi_connected():
-                    print("[DEBUG] Wi-Fi já conectado (detecção antecipada)")
-                    estado = EstadoPrograma.CONECTADO_MSG
-                    last_display_update = time.time()
-                    oled_clear_needed = True
-
-                    # Se o processo ainda tá vivo, manda encerrar educadamente
-                    if processo_conexao is not None:
-                        try:
-                            processo_conexao.terminate()
-                        except Exception as e:
-                            print(f"[DEBUG] erro ao terminar processo_conexao: {e}")
-                    processo_conexao = None
-
-                # 2. senão, verifica se o processo nmcli acabou por conta própria
-                elif processo_conexao is not None:
-                    retorno = processo_conexao.poll()  # None = ainda rodando
-                    if retorno is not None:
-                        # terminou!
-                        stdout_txt, stderr_txt = processo_conexao.communicate()
-                        print(f"[DEBUG] nmcli terminou. code={retorno}")
-                        print(f"[DEBUG] STDOUT: {stdout_txt.strip()}")
-                        print(f"[DEBUG] STDERR: {stderr_txt.strip()}")
-
-                        if retorno == 0:
-                            estado = EstadoPrograma.CONECTADO_MSG
-                        else:
-                            estado = EstadoPrograma.FALHA_CONEXAO_MSG
+                # --- Transições de Estado Pós-Desenho ---
 
+                if estado == EstadoPrograma.CONECTANDO:
+                    # 1. já estamos conectados? (às vezes o Wi-Fi sobe antes do nmcli encerrar)
+                    if is_wifi_connected():
+                        print("[DEBUG] Wi-Fi já conectado (detecção antecipada)")
+                        estado = EstadoPrograma.CONECTADO_MSG
                         last_display_update = time.time()
                         oled_clear_needed = True
+
+                        # Se o processo ainda tá vivo, manda encerrar educadamente
+                        if processo_conexao is not None:
+                            try:
+                                processo_conexao.terminate()
+                            except Exception as e:
+                                print(f"[DEBUG] erro ao terminar processo_conexao: {e}")
                         processo_conexao = None
 
+                    # 2. senão, verifica se o processo nmcli acabou por conta própria
+                    elif processo_conexao is not None:
+                        retorno = processo_conexao.poll()  # None = ainda rodando
+                        if retorno is not None:
+                            # terminou!
+                            stdout_txt, stderr_txt = processo_conexao.communicate()
+                            print(f"[DEBUG] nmcli terminou. code={retorno}")
+                            print(f"[DEBUG] STDOUT: {stdout_txt.strip()}")
+                            print(f"[DEBUG] STDERR: {stderr_txt.strip()}")
 
-            elif estado == EstadoPrograma.CONECTADO_MSG:
-                 if time.time() - last_display_update > 2: # Mostra msg por 2 seg
-                      estado = EstadoPrograma.CARROSSEL # Volta ao normal
-                      oled_clear_needed = True
+                            observador.reavaliar() # Não espera o próximo evento de link
+                            if retorno == 0:
+                                estado = EstadoPrograma.CONECTADO_MSG
+                            else:
+                                estado = EstadoPrograma.FALHA_CONEXAO_MSG
 
-            elif estado == EstadoPrograma.FALHA_CONEXAO_MSG:
-                 if time.time() - last_display_update > 3: # Mostra msg por 3 seg
-                      estado = EstadoPrograma.SENHA # Volta para digitar senha
-                      senha_digitada = "" # Limpa a senha anterior
-                      char_atual_index = 0
-                      oled_clear_needed = True
+                            last_display_update = time.time()
+                            oled_clear_needed = True
+                            processo_conexao = None
 
 
-        # --- Pausa Mínima ---
-        time.sleep(MENU_REDRAW_SLEEP)
+                elif estado == EstadoPrograma.CONECTADO_MSG:
+                     if time.time() - last_display_update > 2: # Mostra msg por 2 seg
+                          estado = EstadoPrograma.CARROSSEL # Volta ao normal
+                          oled_clear_needed = True
 
-    # --- Limpeza ---
-    print("\nLimpando GPIO...")
-    GPIO.cleanup()
-    print("Limpando display...")
-    display_clear(draw, disp, image)
-    display_text(draw, font, "Desligando...", 10, 30)
-    display_show(disp, image)
-    time.sleep(1)
-    disp.fill(0) # Garante que o display apaga
-    disp.show()
+                elif estado == EstadoPrograma.FALHA_CONEXAO_MSG:
+                     if time.time() - last_display_update > 3: # Mostra msg por 3 seg
+                          estado = EstadoPrograma.SENHA # Volta para digitar senha
+                          senha_digitada = "" # Limpa a senha anterior
+                          char_atual_index = 0
+                          oled_clear_needed = True
+
+
+            # --- Espera até o próximo prazo (eventos na fila acordam antes) ---
+            if not eventos_painel.empty():
+                espera = 0.0
+            elif estado == EstadoPrograma.CARROSSEL:
+                espera = last_display_update + CARROSSEL_INTERVAL - time.time()
+            elif estado == EstadoPrograma.CONECTANDO:
+                espera = MENU_REDRAW_SLEEP # Acompanha o processo do nmcli
+            elif estado == EstadoPrograma.CONECTADO_MSG:
+                espera = last_display_update + 2 - time.time()
+            elif estado == EstadoPrograma.FALHA_CONEXAO_MSG:
+                espera = last_display_update + 3 - time.time()
+            else:
+                espera = ESPERA_MAXIMA
+            espera = min(max(espera, 0.0), ESPERA_MAXIMA)
+
+    finally:
+        # --- Limpeza ---
+        print("\nLimpando GPIO...")
+        GPIO.cleanup()
+        print("Limpando display...")
+        try:
+            display_clear(draw, disp, image)
+            display_text(draw, font, "Desligando...", 10, 30)
+            display_show(disp, image)
+            time.sleep(1)
+            disp.limpar() # Garante que o display apaga
+        finally:
+            mostrar_estatisticas_display(disp)
     # disable_raw_mode() será chamado por atexit() se enable_raw_mode foi usado
     print("Programa finalizado.")
 
@@ -0,0 +1,164 @@
+"""
+Registro de vagas do estacionamento.
+
+Carrega a configuração das vagas (pinos, polaridade e grupo de disparo) de
+um arquivo JSON e guarda o estado ao vivo de todas as vagas em colunas de
+arrays compactos, indexadas pelo slot (posição) da vaga no registro.
+Assim o custo de memória por vaga é fixo, mesmo com centenas de vagas.
+
+Formato do arquivo (campos opcionais entre colchetes):
+
+    {
+      "vagas": [
+        {"id": 1, "trigger": 23, "echo": 24,
+         "led_vermelho": 25, "led_verde": 8, "buzzer": 12,
+         ["grupo": 0,]
+         ["led_vermelho_active_high": true,]
+         ["led_verde_active_high": true,]
+         ["buzzer_active_high": true,]
+         ["mediana_k": 5, "ema_alfa": 0.3,]
+         ["histerese_cm": 3.0, "permanencia_s": 2.0]}
+      ]
+    }
+"""
+import json
+import math
+import os
+from array import array
+
+ARQUIVO_CONFIG_VAGAS = "vagas.json"
+
+# Configuração usada quando não existe arquivo (as duas vagas originais).
+# Os sensores são vizinhos: cada vaga no seu grupo, disparadas em sequência.
+# Observação: GPIO 1 (LED verde da vaga 2) pode ser reservado em alguns modelos.
+VAGAS_PADRAO = [
+    {'id': 1, 'trigger': 23, 'echo': 24, 'led_vermelho': 25, 'led_verde': 8, 'buzzer': 12, 'grupo': 0},
+    {'id': 2, 'trigger': 14, 'echo': 15, 'led_vermelho': 7, 'led_verde': 1, 'buzzer': 13, 'grupo': 1},
+]
+
+# Códigos de estado guardados em bytearray
+ESTADOS = ('desconhecido', 'livre', 'ocupada', 'falha')
+CODIGO_ESTADO = {nome: codigo for codigo, nome in enumerate(ESTADOS)}
+
+# Bits da coluna de flags
+FLAG_MUITO_PROXIMO = 1
+FLAG_LED_VERMELHO = 2
+FLAG_LED_VERDE = 4
+FLAG_BUZZER = 8
+
+# Filtro das leituras (padrões por vaga; ver filtro_vagas.py)
+MEDIANA_K_PADRAO = 5          # leituras na mediana móvel
+EMA_ALFA_PADRAO = None        # sem EMA
+HISTERESE_CM_PADRAO = 3.0     # meia largura da banda em torno dos limiares
+PERMANENCIA_S_PADRAO = 2.0    # tempo mínimo no novo estado antes de trocar
+
+
+class Vaga:
+    """Configuração (estática) de uma vaga."""
+    __slots__ = ('slot', 'id', 'chave', 'trigger', 'echo',
+                 'led_vermelho', 'led_verde', 'buzzer',
+                 'led_vermelho_active_high', 'led_verde_active_high',
+                 'buzzer_active_high', 'grupo',
+                 'mediana_k', 'ema_alfa', 'histerese_cm', 'permanencia_s')
+
+    def __init__(self, slot, cfg):
+        self.slot = slot
+        self.id = int(cfg['id'])
+        self.chave = f"vaga{self.id}"
+        self.trigger = int(cfg['trigger'])
+        self.echo = int(cfg['echo'])
+        self.led_vermelho = int(cfg['led_vermelho'])
+        self.led_verde = int(cfg['led_verde'])
+        self.buzzer = int(cfg['buzzer'])
+        self.led_vermelho_active_high = bool(cfg.get('led_vermelho_active_high', True))
+        self.led_verde_active_high = bool(cfg.get('led_verde_active_high', True))
+        self.buzzer_active_high = bool(cfg.get('buzzer_active_high', True))
+        # Sem grupo explícito a vaga é disparada sozinha (sem risco de crosstalk)
+        self.grupo = cfg.get('grupo', f"_slot{slot}")
+        self.mediana_k = int(cfg.get('mediana_k', MEDIANA_K_PADRAO))
+        ema_alfa = cfg.get('ema_alfa', EMA_ALFA_PADRAO)
+        self.ema_alfa = float(ema_alfa) if ema_alfa else None
+        self.histerese_cm = float(cfg.get('histerese_cm', HISTERESE_CM_PADRAO))
+        self.permanencia_s = float(cfg.get('permanencia_s', PERMANENCIA_S_PADRAO))
+
+
+class RegistroVagas:
+    """Lista ordenada de vagas com busca por id e por pino de trigger."""
+
+    def __init__(self, configs):
+        self.vagas = [Vaga(slot, cfg) for slot, cfg in enumerate(configs)]
+        self.por_id = {vaga.id: vaga for vaga in self.vagas}
+        self.por_trigger = {vaga.trigger: vaga for vaga in self.vagas}
+        if len(self.por_id) != len(self.vagas):
+            raise ValueError("IDs de vaga repetidos na configuração")
+
+    def __len__(self):
+        return len(self.vagas)
+
+    def __iter__(self):
+        return iter(self.vagas)
+
+    def grupos(self):
+        """Agrupa as vagas por grupo de disparo, na ordem em que aparecem."""
+        grupos = {}
+        for vaga in self.vagas:
+            grupos.setdefault(vaga.grupo, []).append(vaga)
+        return list(grupos.values())
+
+    def pinos_saida(self):
+        pinos = []
+        for vaga in self.vagas:
+            pinos.extend((vaga.led_vermelho, vaga.led_verde, vaga.buzzer))
+        return pinos
+
+
+def carregar_registro(caminho=ARQUIVO_CONFIG_VAGAS):
+    """Lê o arquivo de vagas; usa VAGAS_PADRAO se ele não existir."""
+    if caminho and os.path.exists(caminho):
+        with open(caminho, 'r', encoding='utf-8') as arquivo:
+            dados = json.load(arquivo)
+        configs = dados['vagas'] if isinstance(dados, dict) else dados
+        print(f"Registro de vagas carregado de {caminho} ({len(configs)} vagas)")
+    else:
+        configs = VAGAS_PADRAO
+    return RegistroVagas(configs)
+
+
+class EstadoVagas:
+    """
+    Estado ao vivo das vagas em colunas compactas (uma posição por slot).
+    A distância usa NaN para "sem leitura"; a confiança (0 a 1) é a da
+    rajada de pings da última leitura.
+    """
+
+    def __init__(self, n_vagas):
+        self.timestamp = None
+        self.distancia = array('f', [math.nan]) * n_vagas
+        self.estado = bytearray(n_vagas)  # 0 = desconhecido
+        self.flags = bytearray(n_vagas)
+        self.confianca = array('f', [math.nan]) * n_vagas
+
+    def atualizar(self, slot, distancia, estado, muito_proximo, confianca=None):
+        self.distancia[slot] = math.nan if distancia is None else distancia
+        self.confianca[slot] = math.nan if confianca is None else confianca
+        self.estado[slot] = CODIGO_ESTADO[estado]
+        flags = FLAG_MUITO_PROXIMO | FLAG_BUZZER if muito_proximo else 0
+        if estado == 'ocupada':
+            flags |= FLAG_LED_VERMELHO
+        elif estado == 'livre':
+            flags |= FLAG_LED_VERDE
+        self.flags[slot] = flags
+
+    def como_dict(self, slot):
+        distancia = self.distancia[slot]
+        confianca = self.confianca[slot]
+        flags = self.flags[slot]
+        return {
+            'distancia': None if math.isnan(distancia) else round(distancia, 2),
+            'confianca': None if math.isnan(confianca) else round(confianca, 2),
+            'estado': ESTADOS[self.estado[slot]],
+            'muito_proximo': bool(flags & FLAG_MUITO_PROXIMO),
+            'led_vermelho': bool(flags & FLAG_LED_VERMELHO),
+            'led_verde': bool(flags & FLAG_LED_VERDE),
+            'buzzer': bool(flags & FLAG_BUZZER),
+        }
@@ -0,0 +1,140 @@
+"""
+Envio incremental de quadros para o display SSD1306 (I2C).
+
+O painel redesenha a imagem PIL inteira a cada mudança, mas quase sempre
+só um pedaço muda (ex.: o caractere selecionado na tela de senha). O
+RenderizadorSSD1306 guarda o último quadro enviado, compara página a
+página (faixas de 8 linhas, como na memória do SSD1306) e transmite só a
+janela de colunas alterada de cada página, usando os comandos de
+endereçamento do controlador:
+
+    0x21 coluna_inicial coluna_final   (SET_COL_ADDR)
+    0x22 pagina_inicial pagina_final   (SET_PAGE_ADDR)
+    0x40 dados...                      (escrita na janela)
+
+Quadros idênticos não geram tráfego nenhum. Quando muitas páginas mudam,
+uma única janela envolvendo todas sai mais barata que várias pequenas; o
+renderizador escolhe a opção com menos bytes no barramento.
+
+    disp = RenderizadorSSD1306(adafruit_ssd1306.SSD1306_I2C(128, 64, i2c))
+    disp.enviar(image)
+    disp.como_dict()   # bytes enviados x bytes de quadros completos
+
+Requer o display em endereçamento horizontal (o padrão da biblioteca da
+Adafruit, page_addressing=False).
+"""
+from PIL import Image
+
+# Bytes no barramento por transação: endereço do dispositivo + byte de controle
+_CABECALHO_I2C = 2
+# Uma janela: transação de comandos (0x21 x0 x1 0x22 p0 p1) + transação de dados
+_CUSTO_JANELA = _CABECALHO_I2C + 6 + _CABECALHO_I2C
+
+_ROTACAO = getattr(Image, 'Transpose', Image).ROTATE_270  # Pillow < 9.1 não tem Image.Transpose
+
+
+def paginas_imagem(image, n_paginas):
+    """
+    Bytes de cada página do SSD1306 (bit 0 = linha de cima) a partir de uma
+    imagem modo "1". Girada 90°, cada linha da imagem PIL vira uma coluna
+    do display, já empacotada em bytes na ordem inversa das páginas.
+    """
+    if image.mode != "1":
+        image = image.convert("1")
+    dados = image.transpose(_ROTACAO).tobytes()
+    return [dados[n_paginas - 1 - p::n_paginas] for p in range(n_paginas)]
+
+
+class RenderizadorSSD1306:
+    """Envia ao display só as regiões do quadro que mudaram."""
+
+    def __init__(self, disp):
+        self.disp = disp
+        self.width = disp.width
+        self.height = disp.height
+        self.n_paginas = disp.height // 8
+        # Telas estreitas usam as colunas centrais da RAM de 128 colunas
+        self.deslocamento = (128 - disp.width) // 2 if disp.width != 128 else 0
+        self.ultimo = None  # páginas do último quadro enviado (None = conteúdo desconhecido)
+
+        # Medição
+        self.quadros = 0
+        self.quadros_iguais = 0
+        self.janelas = 0
+        self.bytes_enviados = 0
+        self.bytes_completos = 0  # o que os mesmos quadros custariam enviados inteiros
+
+    def _custo_completo(self):
+        return _CUSTO_JANELA + self.n_paginas * self.width
+
+    def _faixa_alterada(self, nova, antiga):
+        """(primeira, última) coluna diferente entre duas páginas iguais em tamanho."""
+        diferenca = int.from_bytes(nova, 'big') ^ int.from_bytes(antiga, 'big')
+        primeira = len(nova) - 1 - (diferenca.bit_length() - 1) // 8
+        ultima = len(nova) - 1 - ((diferenca & -diferenca).bit_length() - 1) // 8
+        return primeira, ultima
+
+    def _janelas(self, paginas):
+        """Janelas (x0, x1, p0, p1) a enviar para trocar self.ultimo por `paginas`."""
+        if self.ultimo is None:
+            return [(0, self.width - 1, 0, self.n_paginas - 1)]
+        por_pagina = [(*self._faixa_alterada(nova, antiga), p, p)
+                      for p, (nova, antiga) in enumerate(zip(paginas, self.ultimo)) if nova != antiga]
+        if len(por_pagina) < 2:
+            return por_pagina
+        # Alternativa: uma janela só, envolvendo todas as regiões alteradas
+        unica = (min(j[0] for j in por_pagina), max(j[1] for j in por_pagina),
+                 por_pagina[0][2], por_pagina[-1][3])
+        if self._custo(unica) < sum(self._custo(j) for j in por_pagina):
+            return [unica]
+        return por_pagina
+
+    def _custo(self, janela):
+        x0, x1, p0, p1 = janela
+        return _CUSTO_JANELA + (x1 - x0 + 1) * (p1 - p0 + 1)
+
+    def _escrever(self, janela, paginas):
+        x0, x1, p0, p1 = janela
+        dispositivo = self.disp.i2c_device
+        comandos = bytes((0x00, 0x21, x0 + self.deslocamento, x1 + self.deslocamento, 0x22, p0, p1))
+        dados = bytearray(b'\x40')
+        for p in range(p0, p1 + 1):
+            dados += paginas[p][x0:x1 + 1]
+        with dispositivo:
+            dispositivo.write(comandos)
+        with dispositivo:
+            dispositivo.write(dados)
+        self.janelas += 1
+        return len(comandos) + len(dados) + 2  # + endereço de cada transação
+
+    def enviar(self, image):
+        """Envia o quadro; retorna os bytes transmitidos (0 se igual ao anterior)."""
+        paginas = paginas_imagem(image, self.n_paginas)
+        self.quadros += 1
+        self.bytes_completos += self._custo_completo()
+        if paginas == self.ultimo:
+            self.quadros_iguais += 1
+            return 0
+        enviados = 0
+        for janela in self._janelas(paginas):
+            enviados += self._escrever(janela, paginas)
+        self.ultimo = paginas
+        # Mantém o buffer da biblioteca igual à tela (disp.show() continua válido)
+        self.disp.buffer[1:] = b''.join(paginas)
+        self.bytes_enviados += enviados
+        return enviados
+
+    def limpar(self):
+        """Apaga a tela inteira e passa a conhecer o conteúdo dela."""
+        self.ultimo = None
+        return self.enviar(Image.new("1", (self.width, self.height)))
+
+    def como_dict(self):
+        return {
+            'quadros': self.quadros,
+            'quadros_iguais': self.quadros_iguais,
+            'janelas': self.janelas,
+            'bytes_enviados': self.bytes_enviados,
+            'bytes_completos': self.bytes_completos,
+            'economia': round(1 - self.bytes_enviados / self.bytes_completos, 4) if self.bytes_completos else None,
+        }
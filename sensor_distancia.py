@@ -1,50 +1,28 @@
 import RPi.GPIO as GPIO
 import time
 
+from registro_vagas import ARQUIVO_CONFIG_VAGAS, carregar_registro
+
 # =================================== Configuração ============================ #
 # Use BCM pin numbering
 GPIO.setmode(GPIO.BCM)
 GPIO.setwarnings(False)  # Desativa avisos
 
-# Sensores ultrassônicos (duas vagas)
-S1_TRIGGER = 23  # Vaga 1 - Trigger
-S1_ECHO = 24     # Vaga 1 - Echo
-S2_TRIGGER = 14  # Vaga 2 - Trigger
-S2_ECHO = 15     # Vaga 2 - Echo
-
-# LEDs (vermelho/verde por vaga)
-LED_VAGA1_VERMELHO = 25
-LED_VAGA1_VERDE = 8
-LED_VAGA2_VERMELHO = 7
-LED_VAGA2_VERDE = 1  # Observação: GPIO 1 pode ser reservado em alguns modelos
-
-# Polaridade (defina False se seu LED acende com nível baixo)
-LED_VAGA1_RED_ACTIVE_HIGH = True
-LED_VAGA1_GREEN_ACTIVE_HIGH = True
-LED_VAGA2_RED_ACTIVE_HIGH = True
-LED_VAGA2_GREEN_ACTIVE_HIGH = True
-
-# Polaridade dos buzzers (alterar para False se acionam em LOW)
-BUZZER_VAGA1_ACTIVE_HIGH = True
-BUZZER_VAGA2_ACTIVE_HIGH = True
-
-# Buzzers por vaga
-BUZZER_VAGA1 = 12
-BUZZER_VAGA2 = 13
+# Pinos e polaridade de cada vaga vêm do registro de vagas (vagas.json,
+# ver registro_vagas.py); sem o arquivo, usa as duas vagas originais.
+registro = carregar_registro(ARQUIVO_CONFIG_VAGAS)
 
 # Thresholds (ajuste conforme instalação)
 THRESHOLD_OCUPADA_CM = 40.0   # abaixo disso considera ocupada
 THRESHOLD_MUITO_PROXIMO_CM = 10.0  # abaixo disso emite bip
 
 # Configura pinos dos sensores
-GPIO.setup(S1_TRIGGER, GPIO.OUT)
-GPIO.setup(S1_ECHO, GPIO.IN)
-GPIO.setup(S2_TRIGGER, GPIO.OUT)
-GPIO.setup(S2_ECHO, GPIO.IN)
+for vaga in registro:
+    GPIO.setup(vaga.trigger, GPIO.OUT)
+    GPIO.setup(vaga.echo, GPIO.IN)
 
 # Configura pinos dos LEDs e buzzers
-for pin in [LED_VAGA1_VERMELHO, LED_VAGA1_VERDE, LED_VAGA2_VERMELHO, LED_VAGA2_VERDE,
-            BUZZER_VAGA1, BUZZER_VAGA2]:
+for pin in registro.pinos_saida():
     try:
         GPIO.setup(pin, GPIO.OUT, initial=GPIO.LOW)
     except Exception as e:
@@ -89,7 +67,7 @@ def medir_distancia(trigger_pin, echo_pin):
     return distance
 
 
-def atualizar_atuadores(dist_cm, led_vermelho, led_verde, buzzer):
+def atualizar_atuadores(dist_cm, vaga):
     """Atualiza LED e buzzer de uma vaga a partir da distância medida."""
     def write_output(pin, turn_on, active_high=True):
         if active_high:
@@ -99,60 +77,38 @@ def atualizar_atuadores(dist_cm, led_vermelho, led_verde, buzzer):
 
     if dist_cm is None:
         # Falha na leitura: apaga LEDs e buzzer para segurança
-        write_output(led_vermelho, False, True)
-        write_output(led_verde, False, True)
-        write_output(buzzer, False, True)
+        write_output(vaga.led_vermelho, False, vaga.led_vermelho_active_high)
+        write_output(vaga.led_verde, False, vaga.led_verde_active_high)
+        write_output(vaga.buzzer, False, vaga.buzzer_active_high)
         return "falha"
 
     ocupada = dist_cm < THRESHOLD_OCUPADA_CM
     muito_proximo = dist_cm < THRESHOLD_MUITO_PROXIMO_CM
 
     # LEDs: exclusivo por vaga
-    if led_vermelho == LED_VAGA1_VERMELHO and led_verde == LED_VAGA1_VERDE:
-        write_output(LED_VAGA1_VERMELHO, ocupada, LED_VAGA1_RED_ACTIVE_HIGH)
-        write_output(LED_VAGA1_VERDE, not ocupada, LED_VAGA1_GREEN_ACTIVE_HIGH)
-    elif led_vermelho == LED_VAGA2_VERMELHO and led_verde == LED_VAGA2_VERDE:
-        write_output(LED_VAGA2_VERMELHO, ocupada, LED_VAGA2_RED_ACTIVE_HIGH)
-        write_output(LED_VAGA2_VERDE, not ocupada, LED_VAGA2_GREEN_ACTIVE_HIGH)
-    else:
-        # fallback genérico
-        write_output(led_vermelho, ocupada, True)
-        write_output(led_verde, not ocupada, True)
+    write_output(vaga.led_vermelho, ocupada, vaga.led_vermelho_active_high)
+    write_output(vaga.led_verde, not ocupada, vaga.led_verde_active_high)
 
     # Buzzer: emite quando muito próximo
-    if buzzer == BUZZER_VAGA1:
-        write_output(BUZZER_VAGA1, muito_proximo, BUZZER_VAGA1_ACTIVE_HIGH)
-    elif buzzer == BUZZER_VAGA2:
-        write_output(BUZZER_VAGA2, muito_proximo, BUZZER_VAGA2_ACTIVE_HIGH)
-    else:
-        write_output(buzzer, muito_proximo, True)
+    write_output(vaga.buzzer, muito_proximo, vaga.buzzer_active_high)
 
     return "ocupada" if ocupada else "livre"
 
 
 # =================================== Loop Principal ========================= #
-print("Monitorando duas vagas com sensores ultrassônicos (CTRL+C para sair)")
+print(f"Monitorando {len(registro)} vagas com sensores ultrassônicos (CTRL+C para sair)")
 
 try:
     while True:
-        # Vaga 1
-        d1 = medir_distancia(S1_TRIGGER, S1_ECHO)
-        estado1 = atualizar_atuadores(d1, LED_VAGA1_VERMELHO, LED_VAGA1_VERDE, BUZZER_VAGA1)
+        for vaga in registro:
+            d = medir_distancia(vaga.trigger, vaga.echo)
+            estado = atualizar_atuadores(d, vaga)
 
-        # Vaga 2
-        d2 = medir_distancia(S2_TRIGGER, S2_ECHO)
-        estado2 = atualizar_atuadores(d2, LED_VAGA2_VERMELHO, LED_VAGA2_VERDE, BUZZER_VAGA2)
-
-        # Prints informativos
-        if d1 is None:
-            print("Vaga 1: leitura falhou")
-        else:
-            print(f"Vaga 1: {d1:.2f} cm -> {estado1}")
-
-        if d2 is None:
-            print("Vaga 2: leitura falhou")
-        else:
-            print(f"Vaga 2: {d2:.2f} cm -> {estado2}")
+            # Prints informativos
+            if d is None:
+                print(f"Vaga {vaga.id}: leitura falhou")
+            else:
+                print(f"Vaga {vaga.id}: {d:.2f} cm -> {estado}")
 
         time.sleep(0.5)
 
@@ -162,4 +118,4 @@ except KeyboardInterrupt:
 finally:
     # Limpa a configuração dos pinos GPIO ao sair
     print("Limpando GPIO...")
-    GPIO.cleanup()
\ No newline at end of file
+    GPIO.cleanup()
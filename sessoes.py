@@ -0,0 +1,115 @@
+"""
+Sessões de estacionamento (chegada, saída e permanência) por vaga.
+
+O loop entrega o estado de cada vaga a cada varredura ao
+RastreadorSessoes: a passagem para 'ocupada' abre uma sessão e a volta
+para 'livre' a fecha ('falha' e 'desconhecido' não mudam nada). As sessões
+abertas ficam num índice em memória (vaga -> chegada), salvo em
+"sessoes_abertas.json" para sobreviver a reinícios; as fechadas vão para
+"sessoes.bin", em ordem de saída, com registros de 18 bytes:
+
+    chegada_ms  int64   epoch em milissegundos
+    saida_ms    int64
+    vaga        uint16
+
+Como o arquivo está ordenado pela saída, uma consulta por período acha o
+início por busca binária e lê só as sessões do período.
+"""
+import json
+import mmap
+import os
+import struct
+
+REGISTRO = struct.Struct('<qqH')
+_SAIDA = struct.Struct('<8xq')
+ARQUIVO_SESSOES = "sessoes.bin"
+ARQUIVO_ABERTAS = "sessoes_abertas.json"
+
+
+class RastreadorSessoes:
+    """Deriva as sessões do fluxo de estados (chamado só pela thread do loop)."""
+
+    def __init__(self, abertas=None):
+        self.abertas = dict(abertas or {})  # vaga_id -> chegada (epoch, s)
+
+    def atualizar(self, vaga_id, estado, instante):
+        """
+        Retorna ('chegada', vaga_id, instante), ('saida', vaga_id, chegada,
+        instante) ou None se o estado não muda a sessão.
+        """
+        if estado == 'ocupada' and vaga_id not in self.abertas:
+            self.abertas[vaga_id] = instante
+            return ('chegada', vaga_id, instante)
+        if estado == 'livre' and vaga_id in self.abertas:
+            chegada = self.abertas.pop(vaga_id)
+            return ('saida', vaga_id, chegada, instante)
+        return None
+
+    def abertas_ha_mais_de(self, segundos, agora):
+        """[(vaga_id, chegada)] das sessões abertas há mais de `segundos`."""
+        return sorted((vaga_id, chegada) for vaga_id, chegada in self.abertas.items()
+                      if agora - chegada > segundos)
+
+
+def registro_sessao(vaga_id, chegada, saida):
+    return REGISTRO.pack(int(chegada * 1000), int(saida * 1000), vaga_id)
+
+
+def carregar_abertas(diretorio):
+    caminho = os.path.join(diretorio, ARQUIVO_ABERTAS)
+    try:
+        with open(caminho, 'r', encoding='utf-8') as arquivo:
+            return {int(vaga_id): chegada for vaga_id, chegada in json.load(arquivo).items()}
+    except (OSError, ValueError):
+        return {}
+
+
+def salvar_abertas(diretorio, abertas):
+    """Grava o índice de sessões abertas (troca atômica do arquivo)."""
+    caminho = os.path.join(diretorio, ARQUIVO_ABERTAS)
+    temporario = caminho + '.tmp'
+    with open(temporario, 'w', encoding='utf-8') as arquivo:
+        json.dump({str(vaga_id): chegada for vaga_id, chegada in abertas.items()}, arquivo)
+    os.replace(temporario, caminho)
+
+
+def ler(diretorio, inicio=None, fim=None, vaga_id=None):
+    """
+    Gera (vaga_id, chegada, saida), em segundos, das sessões encerradas
+    com saída em [inicio, fim].
+    """
+    caminho = os.path.join(diretorio, ARQUIVO_SESSOES)
+    if not os.path.exists(caminho):
+        return
+    with open(caminho, 'rb') as arquivo:
+        total = os.fstat(arquivo.fileno()).st_size // REGISTRO.size
+        if not total:
+            return
+        with mmap.mmap(arquivo.fileno(), 0, access=mmap.ACCESS_READ) as mapa:
+            baixo, alto = 0, total
+            if inicio is not None:
+                limite = inicio * 1000
+                while baixo < alto:
+                    meio = (baixo + alto) // 2
+                    if _SAIDA.unpack_from(mapa, meio * REGISTRO.size)[0] < limite:
+                        baixo = meio + 1
+                    else:
+                        alto = meio
+            for chegada_ms, saida_ms, vaga in REGISTRO.iter_unpack(mapa[baixo * REGISTRO.size:total * REGISTRO.size]):
+                if fim is not None and saida_ms > fim * 1000:
+                    return
+                if vaga_id is None or vaga == vaga_id:
+                    yield vaga, chegada_ms / 1000, saida_ms / 1000
+
+
+def resumo(sessoes):
+    """Por vaga: quantidade de sessões e permanência média/máxima (s)."""
+    por_vaga = {}
+    for vaga_id, chegada, saida in sessoes:
+        quantidade, soma, maxima = por_vaga.get(vaga_id, (0, 0.0, 0.0))
+        duracao = saida - chegada
+        por_vaga[vaga_id] = (quantidade + 1, soma + duracao, max(maxima, duracao))
+    return {vaga_id: {'sessoes': quantidade,
+                      'permanencia_media_s': round(soma / quantidade, 1),
+                      'permanencia_maxima_s': round(maxima, 1)}
+            for vaga_id, (quantidade, soma, maxima) in sorted(por_vaga.items())}
@@ -0,0 +1,74 @@
+"""
+Os bitmaps em cache precisam sair idênticos ao draw.text direto na tela.
+
+    python -m pytest -q test_cache_texto.py
+"""
+import os
+
+import pytest
+
+Image = pytest.importorskip("PIL.Image")
+from PIL import ImageDraw, ImageFont
+
+import cache_texto
+
+FONT_PATH = "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf"
+CHARSET = "abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789 !@#$%^&*()_+-=[]{}|;':\",./<>?"
+
+# Textos das telas do painel e nomes de rede
+TEXTOS = [
+    "Status: CONECTADO", "Rede: MinhaRede_5G", "Host: raspberrypi", "IP: 192.168.0.42:8001",
+    "Sinal: -67 dBm", "SSH: INATIVO", "Users: 2", "Redes (12):", "A escanear...",
+    "ENTER p/ scan", "C/B: Muda", "ENT: Add/'*'=OK", "Conectando...", "Conectado!",
+    "Falha na conexão!", "Verifique a senha.", "Desligando...", "Hello World",
+    "SSID: CasaDoPedro", "> CasaDoPedro", "  NET_VIRTUA_WWW_5G", "> Wave yo jy",
+    "  Vivo-Fibra-2.4GHz_A1B2", "Senha: CasaDoPedro...",
+]
+
+
+def _fontes():
+    fontes = [pytest.param(ImageFont.load_default(), id="padrao")]
+    if os.path.exists(FONT_PATH):
+        fontes.append(pytest.param(ImageFont.truetype(FONT_PATH, 9), id="dejavu9"))
+        fontes.append(pytest.param(ImageFont.truetype(FONT_PATH, 14), id="dejavu14"))
+    return fontes
+
+
+def _tela():
+    image = Image.new("1", (128, 64))
+    return image, ImageDraw.Draw(image)
+
+
+@pytest.fixture(params=_fontes())
+def font(request):
+    return request.param
+
+
+@pytest.mark.parametrize("texto", TEXTOS + list(CHARSET))
+def test_desenhar_igual_draw_text(font, texto):
+    esperado, draw = _tela()
+    draw.text((3, 7), texto, font=font, fill=255)
+    obtido, draw = _tela()
+    cache_texto.desenhar(draw, font, texto, 3, 7)
+    assert obtido.tobytes() == esperado.tobytes()
+
+
+def test_senha_igual_draw_text(font):
+    cache_texto.pre_renderizar(font, CHARSET, anterior="*")
+    for tamanho in (0, 1, 5, 12):
+        for caractere in CHARSET:
+            esperado, draw = _tela()
+            draw.text((0, 20), "*" * tamanho + caractere, font=font, fill=255)
+            obtido, draw = _tela()
+            cache_texto.desenhar_com_final(draw, font, "*" * tamanho, caractere, 0, 20)
+            assert obtido.tobytes() == esperado.tobytes(), (tamanho, caractere)
+
+
+@pytest.mark.parametrize("texto", TEXTOS)
+def test_truncar_igual_corte_por_caractere(font, texto):
+    esperado = texto
+    if font.getbbox(esperado)[2] > 60:
+        while font.getbbox(esperado + "...")[2] > 60:
+            esperado = esperado[:-1]
+        esperado += "..."
+    assert cache_texto.truncar(font, texto, 60) == esperado
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Teste de carga do servidor web do monitor.
+
+Abre N clientes simultâneos (uma thread e uma conexão keep-alive por
+cliente) e faz GETs seguidos no endpoint de status, reportando a vazão e a
+latência p50/p99.
+
+Uso (com o monitor_sensor_web.py rodando):
+    python3 teste_carga.py --clientes 32 --duracao 10
+    python3 teste_carga.py --url http://192.168.0.10:8001/api/parking/status
+"""
+import argparse
+import http.client
+import statistics
+import threading
+import time
+from urllib.parse import urlparse
+
+
+def cliente(url, fim, latencias, erros, lock):
+    local = []
+    falhas = 0
+    conexao = None
+    caminho = url.path or '/'
+    if url.query:
+        caminho += '?' + url.query
+    while time.perf_counter() < fim:
+        try:
+            if conexao is None:
+                conexao = http.client.HTTPConnection(url.hostname, url.port or 80, timeout=10)
+            inicio = time.perf_counter()
+            conexao.request('GET', caminho)
+            resposta = conexao.getresponse()
+            resposta.read()
+            if resposta.status != 200:
+                falhas += 1
+            else:
+                local.append(time.perf_counter() - inicio)
+            if resposta.will_close:
+                conexao.close()
+                conexao = None
+        except (OSError, http.client.HTTPException):
+            falhas += 1
+            if conexao is not None:
+                conexao.close()
+            conexao = None
+    if conexao is not None:
+        conexao.close()
+    with lock:
+        latencias.extend(local)
+        erros[0] += falhas
+
+
+def percentil(valores, p):
+    return valores[min(len(valores) - 1, int(len(valores) * p))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Teste de carga do endpoint de status")
+    parser.add_argument("--url", default="http://127.0.0.1:8001/api/parking/status", help="URL testada (default: %(default)s)")
+    parser.add_argument("--clientes", type=int, default=16, help="Clientes simultâneos (default: %(default)s)")
+    parser.add_argument("--duracao", type=float, default=10.0, help="Duração em segundos (default: %(default)s)")
+    args = parser.parse_args()
+
+    url = urlparse(args.url)
+    latencias = []
+    erros = [0]
+    lock = threading.Lock()
+    fim = time.perf_counter() + args.duracao
+    threads = [threading.Thread(target=cliente, args=(url, fim, latencias, erros, lock))
+               for _ in range(args.clientes)]
+    inicio = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    duracao = time.perf_counter() - inicio
+
+    print(f"[{args.clientes} clientes, {duracao:.1f} s] {args.url}")
+    print(f"  Requisições:        {len(latencias)}")
+    print(f"  Erros:              {erros[0]}")
+    if latencias:
+        latencias.sort()
+        print(f"  Vazão:              {len(latencias) / duracao:.1f} req/s")
+        print(f"  Latência média:     {statistics.mean(latencias) * 1000:.2f} ms")
+        print(f"  Latência p50:       {percentil(latencias, 0.50) * 1000:.2f} ms")
+        print(f"  Latência p99:       {percentil(latencias, 0.99) * 1000:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()